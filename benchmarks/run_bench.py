@@ -0,0 +1,307 @@
+"""
+End-to-end benchmark of the trip pipeline under local PySpark.
+
+    raw/trips (synthetic, tlc_gen.py)
+      -> src/glue/glue_raw_to_validated.py  (--schema_registry true --single_scan true)
+      -> src/glue/glue_enrich_to_curated.py (zones snapshot seeded from data/taxi_zone_lookup.csv)
+
+Each stage runs in its own process with the awsglue shim (benchmarks/shim) on the
+path. boto3 traffic (listing, _LATEST pointers, metrics JSON) goes to an in-process
+moto S3 server; Spark parquet I/O for s3://<bucket>/... goes to <work>/lake/<bucket>/...
+because local Spark has no s3a connector.
+
+Reported per stage: wall time, job time (Job.init -> Job.commit), rows/sec, shuffle
+read/write bytes, spill, GC time and peak JVM heap. The run is compared with
+benchmarks/baseline.json and exits 1 on a regression beyond the stored tolerances.
+
+    python benchmarks/run_bench.py                       # compare with the baseline
+    python benchmarks/run_bench.py --update-baseline     # record a new baseline
+    python benchmarks/run_bench.py --scale 1.0 --report /tmp/bench.json
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import boto3
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import tlc_gen
+
+BENCH = Path(__file__).resolve().parent
+REPO = BENCH.parent
+GLUE = REPO / "src" / "glue"
+BASELINE = BENCH / "baseline.json"
+
+BUCKET = "bench-lake"
+RAW_PREFIX = "raw/trips/"
+VALIDATED_PREFIX = "validated/trips/"
+SNAPSHOT_PREFIX = "validated/master_snapshot/zonesnapshots/"
+VENDOR_SNAPSHOT_PREFIX = "validated/vendor_snapshot/"
+RATECODE_SNAPSHOT_PREFIX = "validated/ratecode_snapshot/"
+CURATED_PREFIX = "curated/trips/"
+METRICS_PREFIX = "audit/metrics/"
+
+DEFAULT_CONFIG = {
+    "scale": 0.2,
+    "vintages": ["2019", "2024"],
+    "months_per_vintage": 1,
+    "bad_fraction": 0.02,
+    "seed": 42,
+    "cores": 4,
+    "driver_memory": "2g",
+    "enrich_engine": "join",
+}
+
+# TLC data dictionary names of the vendor / ratecode ids tlc_gen.py writes
+VENDOR_NAMES = {1: "Creative Mobile Technologies, LLC", 2: "Curb Mobility, LLC", 6: "Myle Technologies Inc",
+                7: "Helix"}
+RATECODE_NAMES = {1: "Standard rate", 2: "JFK", 3: "Newark", 4: "Nassau or Westchester", 5: "Negotiated fare",
+                  6: "Group ride", 99: "Null/unknown"}
+
+# allowed relative change before a metric counts as a regression
+DEFAULT_TOLERANCES = {
+    "rows_per_sec": 0.25,          # drop
+    "shuffle_bytes": 0.10,         # rise
+    "jvm_heap_peak_bytes": 0.50,   # rise (GC timing makes this noisy)
+}
+HIGHER_IS_BETTER = {"rows_per_sec"}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_moto():
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    port = _free_port()
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    return server, f"http://127.0.0.1:{port}"
+
+
+def _upload_tree(s3, local_dir: Path, prefix: str, bucket: str = BUCKET) -> int:
+    n = 0
+    for path in sorted(local_dir.rglob("*")):
+        if path.is_file() and not path.name.endswith(".crc"):
+            s3.upload_file(str(path), bucket, prefix + path.relative_to(local_dir).as_posix())
+            n += 1
+    return n
+
+
+def _seed_zone_snapshot(s3, lake: Path, bucket: str = BUCKET) -> None:
+    """Current-only golden zone snapshot + its _LATEST pointer, as mdm_golden_snapshot_final.py publishes it."""
+    import csv
+
+    with open(tlc_gen.ZONE_LOOKUP, newline="", encoding="utf-8") as fh:
+        rows = list(csv.DictReader(fh))
+    table = pa.table({
+        "location_id": pa.array([int(r["LocationID"]) for r in rows], pa.int32()),
+        "borough": [r["Borough"] for r in rows],
+        "zone": [r["Zone"] for r in rows],
+        "service_zone": [r["service_zone"] for r in rows],
+        "is_current": pa.array([True] * len(rows)),
+    })
+    _seed_snapshot(s3, lake, SNAPSHOT_PREFIX, table, bucket)
+
+
+def _seed_reference_snapshots(s3, lake: Path, bucket: str = BUCKET) -> None:
+    """Vendor and ratecode golden snapshots (the enrich job's --vendor/--ratecode_snapshot_prefix)."""
+    for base, key, name, names in [(VENDOR_SNAPSHOT_PREFIX, "vendor_id", "vendor_name", VENDOR_NAMES),
+                                   (RATECODE_SNAPSHOT_PREFIX, "rate_code_id", "rate_code_name", RATECODE_NAMES)]:
+        _seed_snapshot(s3, lake, base, pa.table({
+            key: pa.array(list(names), pa.int32()),
+            name: list(names.values()),
+            "is_current": pa.array([True] * len(names)),
+        }), bucket)
+
+
+def _seed_snapshot(s3, lake: Path, base: str, table, bucket: str = BUCKET) -> None:
+    prefix = f"{base}snapshot_id=bench/"
+    folder = lake / bucket / prefix
+    folder.mkdir(parents=True, exist_ok=True)
+    pq.write_table(table, folder / "part-00000.parquet")
+    _upload_tree(s3, folder, prefix, bucket)
+    s3.put_object(Bucket=bucket, Key=f"{base}_LATEST.json",
+                  Body=json.dumps({"bucket": bucket, "prefix": prefix}).encode("utf-8"))
+
+
+def _get_json(s3, key: str) -> dict:
+    return json.loads(s3.get_object(Bucket=BUCKET, Key=key)["Body"].read().decode("utf-8"))
+
+
+def _run_stage(name: str, script: Path, job_args: list, env: dict, work: Path) -> dict:
+    metrics_path = work / f"{name}_stage_metrics.json"
+    log_path = work / f"{name}.log"
+    stage_env = dict(env, BENCH_STAGE_METRICS=str(metrics_path))
+    t0 = time.time()
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.run([sys.executable, str(script), "--JOB_NAME", f"bench_{name}", *job_args],
+                              env=stage_env, stdout=log, stderr=subprocess.STDOUT, cwd=work)
+    wall = time.time() - t0
+    if proc.returncode != 0 or not metrics_path.exists():
+        tail = log_path.read_text(encoding="utf-8", errors="replace").splitlines()[-40:]
+        raise SystemExit(f"Stage {name} failed (exit {proc.returncode}), log {log_path}:\n" + "\n".join(tail))
+    stage = json.loads(metrics_path.read_text(encoding="utf-8"))
+    stage["wall_seconds"] = round(wall, 3)
+    stage["shuffle_bytes"] = stage["shuffle_read_bytes"] + stage["shuffle_write_bytes"]
+    return stage
+
+
+def run(config: dict, work: Path) -> dict:
+    lake = work / "lake"
+    raw_dir = lake / BUCKET / RAW_PREFIX
+    generated = tlc_gen.generate(raw_dir, config["scale"], config["vintages"], config["months_per_vintage"],
+                                 config["bad_fraction"], config["seed"])
+    print(f"Generated {generated['rows']:,} rows in {len(generated['files'])} files")
+
+    server, endpoint = _start_moto()
+    try:
+        env = dict(
+            os.environ,
+            AWS_ENDPOINT_URL=endpoint,
+            AWS_ACCESS_KEY_ID="bench",
+            AWS_SECRET_ACCESS_KEY="bench",
+            AWS_DEFAULT_REGION="us-east-1",
+            BENCH_LAKE_ROOT=str(lake),
+            PYTHONPATH=os.pathsep.join(filter(None, [str(BENCH / "shim"), os.environ.get("PYTHONPATH")])),
+            PYSPARK_PYTHON=sys.executable,
+            PYSPARK_SUBMIT_ARGS=(f"--master local[{config['cores']}] --driver-memory {config['driver_memory']} "
+                                 "--conf spark.ui.enabled=true --conf spark.executor.metrics.pollingInterval=200 "
+                                 "pyspark-shell"),
+        )
+        s3 = boto3.client("s3", endpoint_url=endpoint, region_name="us-east-1",
+                          aws_access_key_id="bench", aws_secret_access_key="bench")
+        s3.create_bucket(Bucket=BUCKET)
+        _upload_tree(s3, raw_dir, RAW_PREFIX)
+        _seed_zone_snapshot(s3, lake)
+        _seed_reference_snapshots(s3, lake)
+
+        stages = {}
+        stages["raw_to_validated"] = _run_stage("raw_to_validated", GLUE / "glue_raw_to_validated.py", [
+            "--bucket", BUCKET,
+            "--raw_trips_prefix", RAW_PREFIX,
+            "--validated_trips_prefix", VALIDATED_PREFIX,
+            "--run_id", "bench",
+            "--schema_registry", "true",
+            "--single_scan", "true",
+            "--metrics_prefix", METRICS_PREFIX,
+        ], env, work)
+        validation = _get_json(s3, f"{METRICS_PREFIX}_VALIDATION_METRICS.json")
+        stages["raw_to_validated"]["rows"] = validation["validated_rows"] + validation["quarantine_rows"]
+
+        stages["enrich_to_curated"] = _run_stage("enrich_to_curated", GLUE / "glue_enrich_to_curated.py", [
+            "--bucket", BUCKET,
+            "--validated_trips_prefix", VALIDATED_PREFIX,
+            "--snapshot_prefix", SNAPSHOT_PREFIX,
+            "--vendor_snapshot_prefix", VENDOR_SNAPSHOT_PREFIX,
+            "--ratecode_snapshot_prefix", RATECODE_SNAPSHOT_PREFIX,
+            "--enrich_engine", config["enrich_engine"],
+            "--curated_trips_prefix", CURATED_PREFIX,
+            "--metrics_prefix", METRICS_PREFIX,
+            "--run_id", "bench",
+        ], env, work)
+        stages["enrich_to_curated"]["rows"] = _get_json(s3, f"{METRICS_PREFIX}_METRICS.json")["total_rows"]
+    finally:
+        server.stop()
+
+    if stages["raw_to_validated"]["rows"] != generated["rows"]:
+        raise SystemExit(f"Row count mismatch: generated {generated['rows']}, "
+                         f"validated+quarantined {stages['raw_to_validated']['rows']}")
+    for stage in stages.values():
+        stage["rows_per_sec"] = round(stage["rows"] / stage["job_seconds"], 1) if stage["job_seconds"] else 0.0
+    return {"config": config, "stages": stages}
+
+
+def compare(result: dict, baseline: dict) -> list:
+    """Human-readable regressions of result against baseline (empty list = pass)."""
+    tolerances = dict(DEFAULT_TOLERANCES, **baseline.get("tolerances", {}))
+    regressions = []
+    for name, base in baseline["stages"].items():
+        current = result["stages"].get(name)
+        if current is None:
+            regressions.append(f"{name}: stage missing from this run")
+            continue
+        for metric, tolerance in tolerances.items():
+            before, after = base.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if worse > tolerance:
+                regressions.append(f"{name}.{metric}: {before:,} -> {after:,} ({change:+.1%}, "
+                                   f"tolerance {tolerance:.0%})")
+    return regressions
+
+
+def _print_report(result: dict) -> None:
+    cols = ["rows", "wall_seconds", "job_seconds", "rows_per_sec", "shuffle_bytes",
+            "disk_spilled_bytes", "jvm_gc_ms", "jvm_heap_peak_bytes"]
+    print(f"{'stage':<20}" + "".join(f"{c:>21}" for c in cols))
+    for name, stage in result["stages"].items():
+        print(f"{name:<20}" + "".join(f"{stage.get(c, 0):>21,}" for c in cols))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Local end-to-end benchmark of the Glue trip pipeline")
+    ap.add_argument("--scale", type=float, help=f"1.0 = {tlc_gen.ROWS_PER_SCALE:,} rows (default: baseline's)")
+    ap.add_argument("--vintages", help=f"comma list of {sorted(tlc_gen.VINTAGES)}")
+    ap.add_argument("--cores", type=int)
+    ap.add_argument("--enrich-engine", choices=["lookup", "join"], help="enrich_to_curated engine (default: join)")
+    ap.add_argument("--work-dir", help="keep the lake and stage logs here (default: temp dir, removed)")
+    ap.add_argument("--baseline", default=str(BASELINE))
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--report", help="also write the result JSON here")
+    a = ap.parse_args()
+
+    baseline = json.loads(Path(a.baseline).read_text(encoding="utf-8")) if os.path.exists(a.baseline) else None
+    config = dict(DEFAULT_CONFIG, **(baseline or {}).get("config", {}))
+    if a.scale is not None:
+        config["scale"] = a.scale
+    if a.vintages:
+        config["vintages"] = [v.strip() for v in a.vintages.split(",") if v.strip()]
+    if a.cores:
+        config["cores"] = a.cores
+    if a.enrich_engine:
+        config["enrich_engine"] = a.enrich_engine
+
+    work = Path(a.work_dir) if a.work_dir else Path(tempfile.mkdtemp(prefix="nyc_bench_"))
+    work.mkdir(parents=True, exist_ok=True)
+    try:
+        result = run(config, work.resolve())
+    finally:
+        if not a.work_dir:
+            shutil.rmtree(work, ignore_errors=True)
+
+    _print_report(result)
+    if a.report:
+        Path(a.report).write_text(json.dumps(result, indent=2), encoding="utf-8")
+
+    if a.update_baseline:
+        result["tolerances"] = (baseline or {}).get("tolerances", DEFAULT_TOLERANCES)
+        Path(a.baseline).write_text(json.dumps(result, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline written: {a.baseline}")
+    elif baseline is None:
+        print(f"No baseline at {a.baseline} - run with --update-baseline to record one")
+    elif baseline["config"] != config:
+        raise SystemExit(f"Config differs from the baseline ({baseline['config']}); "
+                         "compare like with like or re-record with --update-baseline")
+    else:
+        regressions = compare(result, baseline)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            sys.exit(1)
+        print("OK - within baseline tolerances")
@@ -0,0 +1,8 @@
+"""
+Minimal stand-in for the AWS Glue runtime so the src/glue scripts run under local
+PySpark (benchmarks only - never shipped to Glue).
+
+With BENCH_LAKE_ROOT set, Spark reads/writes of s3://<bucket>/<key> go to
+file://<BENCH_LAKE_ROOT>/<bucket>/<key>; boto3 calls are left alone and go to
+whatever AWS_ENDPOINT_URL points at (the moto server started by run_bench.py).
+"""
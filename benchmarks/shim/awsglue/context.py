@@ -0,0 +1,50 @@
+import os
+from functools import wraps
+
+from pyspark.sql import SparkSession
+from pyspark.sql.readwriter import DataFrameReader, DataFrameWriter
+
+_READ = ["parquet", "csv", "json", "load"]
+_WRITE = ["parquet", "csv", "json", "save"]
+
+
+def _to_lake(path, root: str):
+    if isinstance(path, str) and path.startswith("s3://"):
+        return f"file://{root}/{path[len('s3://'):]}"
+    if isinstance(path, (list, tuple)):
+        return [_to_lake(p, root) for p in path]
+    return path
+
+
+def _patch(cls, names, root: str):
+    for name in names:
+        original = getattr(cls, name)
+        if getattr(original, "_bench_lake", False):
+            continue
+
+        def make(original):
+            @wraps(original)
+            def call(self, *args, **kwargs):
+                args = [_to_lake(a, root) for a in args]
+                if "path" in kwargs:
+                    kwargs["path"] = _to_lake(kwargs["path"], root)
+                return original(self, *args, **kwargs)
+            call._bench_lake = True
+            return call
+
+        setattr(cls, name, make(original))
+
+
+def install_lake_paths(root: str) -> None:
+    """Routes Spark s3:// paths to <root>/<bucket>/<key> (no s3a jars needed locally)."""
+    root = os.path.abspath(root)
+    _patch(DataFrameReader, _READ, root)
+    _patch(DataFrameWriter, _WRITE, root)
+
+
+class GlueContext:
+    def __init__(self, sc):
+        self._sc = sc
+        self.spark_session = SparkSession(sc)
+        if os.environ.get("BENCH_LAKE_ROOT"):
+            install_lake_paths(os.environ["BENCH_LAKE_ROOT"])
@@ -0,0 +1,14 @@
+class DynamicFrame:
+    """Wraps a DataFrame; enough for scripts that only import it or round-trip through fromDF/toDF."""
+
+    def __init__(self, df, glue_ctx, name: str = ""):
+        self._df = df
+        self.glue_ctx = glue_ctx
+        self.name = name
+
+    @classmethod
+    def fromDF(cls, dataframe, glue_ctx, name):
+        return cls(dataframe, glue_ctx, name)
+
+    def toDF(self):
+        return self._df
@@ -0,0 +1,66 @@
+import json
+import os
+import resource
+import time
+import urllib.request
+
+# summed over every completed stage of the application
+STAGE_FIELDS = {
+    "inputBytes": "input_bytes",
+    "outputBytes": "output_bytes",
+    "shuffleReadBytes": "shuffle_read_bytes",
+    "shuffleWriteBytes": "shuffle_write_bytes",
+    "memoryBytesSpilled": "memory_spilled_bytes",
+    "diskBytesSpilled": "disk_spilled_bytes",
+    "jvmGcTime": "jvm_gc_ms",
+    "executorRunTime": "executor_run_ms",
+}
+
+
+def _rest(sc, path: str):
+    url = f"{sc.uiWebUrl}/api/v1/applications/{sc.applicationId}/{path}"
+    with urllib.request.urlopen(url, timeout=30) as resp:
+        return json.load(resp)
+
+
+def spark_stage_metrics(sc) -> dict:
+    """Stage totals and executor peak memory from the Spark UI REST API."""
+    out = {v: 0 for v in STAGE_FIELDS.values()}
+    out.update(stages=0, jvm_heap_peak_bytes=0)
+    # SparkContext.uiWebUrl raises (None.get) when spark.ui.enabled=false
+    if sc._jsc.sc().uiWebUrl().isEmpty():
+        return out
+    for stage in _rest(sc, "stages?status=complete"):
+        out["stages"] += 1
+        for field, name in STAGE_FIELDS.items():
+            out[name] += stage.get(field) or 0
+    for executor in _rest(sc, "allexecutors"):
+        peak = executor.get("peakMemoryMetrics") or {}
+        out["jvm_heap_peak_bytes"] = max(out["jvm_heap_peak_bytes"], peak.get("JVMHeapMemory", 0))
+    return out
+
+
+class Job:
+    def __init__(self, glue_context):
+        self._glue_context = glue_context
+        self._t0 = None
+        self.name = None
+
+    def init(self, job_name, args=None):
+        self.name = job_name
+        self._t0 = time.time()
+
+    def commit(self):
+        path = os.environ.get("BENCH_STAGE_METRICS")
+        if not path:
+            return
+        sc = self._glue_context.spark_session.sparkContext
+        metrics = {
+            "job_name": self.name,
+            "job_seconds": round(time.time() - self._t0, 3),
+            **spark_stage_metrics(sc),
+            # ru_maxrss is KiB on Linux
+            "driver_python_rss_peak_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        }
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(metrics, fh, indent=2)
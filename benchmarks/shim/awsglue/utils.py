@@ -0,0 +1,10 @@
+def getResolvedOptions(args, options):
+    """Same contract as awsglue.utils: every name in options must be passed as --name value."""
+    resolved = {}
+    for i, arg in enumerate(args):
+        if arg.startswith("--") and i + 1 < len(args):
+            resolved[arg[2:]] = args[i + 1]
+    missing = [o for o in options if o not in resolved]
+    if missing:
+        raise Exception(f"Missing required job arguments: {missing}")
+    return {o: resolved[o] for o in options}
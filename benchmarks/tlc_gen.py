@@ -0,0 +1,171 @@
+"""
+Synthetic NYC TLC yellow-trip parquet for benchmarks.
+
+One yellow_tripdata_YYYY-MM.parquet file is written per month. The physical
+column names and types follow the vintage layouts that TLC_SCHEMA_VERSIONS in
+src/glue/glue_raw_to_validated.py expects. Location IDs come from
+data/taxi_zone_lookup.csv with a skewed (Zipf-like) popularity, so joins and
+shuffles look like real traffic. A configurable fraction of rows breaks exactly
+one validation rule.
+
+    python benchmarks/tlc_gen.py --out /tmp/lake/raw/trips --scale 0.1 --vintages 2019,2024
+"""
+import argparse
+import csv
+import os
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+REPO = Path(__file__).resolve().parents[1]
+ZONE_LOOKUP = REPO / "data" / "taxi_zone_lookup.csv"
+
+# scale 1.0 = 1M trips in total
+ROWS_PER_SCALE = 1_000_000
+
+MONEY_COLS = ["fare_amount", "extra", "mta_tax", "tip_amount", "tolls_amount", "improvement_surcharge"]
+
+# Physical layout per vintage: (first month, integer types, extra fee columns)
+#   ints -> arrow types of VendorID, passenger_count, RatecodeID, PU/DOLocationID, payment_type
+_INTS_2015 = {"VendorID": pa.int64(), "passenger_count": pa.float64(), "RatecodeID": pa.float64(),
+              "location": pa.int64(), "payment_type": pa.int64()}
+_INTS_2024 = {"VendorID": pa.int32(), "passenger_count": pa.int64(), "RatecodeID": pa.int64(),
+              "location": pa.int32(), "payment_type": pa.int64()}
+VINTAGES = {
+    "2015": ("2015-01", _INTS_2015, []),
+    "2019": ("2019-01", _INTS_2015, ["congestion_surcharge"]),
+    "2022": ("2022-01", _INTS_2015, ["congestion_surcharge", "airport_fee"]),
+    "2024": ("2024-01", _INTS_2024, ["congestion_surcharge", "Airport_fee"]),
+    "2025": ("2025-01", _INTS_2024, ["congestion_surcharge", "Airport_fee", "cbd_congestion_fee"]),
+}
+
+# each bad row violates exactly one of these (names match VALIDATION_RULES)
+BAD_KINDS = [
+    "PULocationID_NULL", "DOLocationID_NULL", "PICKUP_TS_NULL", "DROPOFF_TS_NULL",
+    "TRIP_DISTANCE_NULL", "TRIP_DISTANCE_NEG", "TOTAL_AMOUNT_NULL", "DROPOFF_BEFORE_PICKUP",
+]
+
+
+def load_location_ids(path=ZONE_LOOKUP):
+    with open(path, newline="", encoding="utf-8") as fh:
+        return np.array([int(r["LocationID"]) for r in csv.DictReader(fh)], dtype=np.int64)
+
+
+def _month_add(month: str, n: int) -> str:
+    y, m = map(int, month.split("-"))
+    y, m = divmod(y * 12 + (m - 1) + n, 12)
+    return f"{y:04d}-{m + 1:02d}"
+
+
+def _nullable(values, mask, typ):
+    return pa.array(values, type=typ, mask=mask)
+
+
+def month_table(month: str, vintage: str, rows: int, location_ids, bad_fraction: float, rng) -> pa.Table:
+    """One month of trips in the vintage's physical layout."""
+    _, ints, fee_cols = VINTAGES[vintage]
+
+    # skewed zone popularity: a few Manhattan/airport-like hot spots, long tail elsewhere
+    weights = 1.0 / np.arange(1, len(location_ids) + 1) ** 0.9
+    popularity = rng.permutation(location_ids)
+    p = weights / weights.sum()
+    pu = rng.choice(popularity, size=rows, p=p)
+    do = rng.choice(popularity, size=rows, p=p)
+
+    start = np.datetime64(f"{month}-01T00:00:00", "us")
+    days = (np.datetime64(_month_add(month, 1) + "-01", "D") - np.datetime64(month + "-01", "D")).astype(int)
+    pickup = start + rng.integers(0, days * 86_400_000_000, rows).astype("timedelta64[us]")
+    minutes = np.clip(rng.lognormal(2.4, 0.6, rows), 1, 180)
+    dropoff = pickup + (minutes * 60_000_000).astype("timedelta64[us]")
+    distance = np.round(np.clip(minutes * rng.normal(0.25, 0.08, rows), 0.1, None), 2)
+
+    payment = rng.choice([1, 2, 3, 4], size=rows, p=[0.72, 0.24, 0.02, 0.02])
+    fare = np.round(3.0 + 2.5 * distance + 0.5 * minutes, 2)
+    fees = {
+        "extra": rng.choice([0.0, 0.5, 1.0, 2.5], rows),
+        "mta_tax": np.full(rows, 0.5),
+        "tip_amount": np.where(payment == 1, np.round(fare * rng.uniform(0.1, 0.25, rows), 2), 0.0),
+        "tolls_amount": np.where(rng.random(rows) < 0.05, 6.94, 0.0),
+        "improvement_surcharge": np.full(rows, 1.0),
+    }
+    extras = {
+        "congestion_surcharge": np.full(rows, 2.5),
+        "airport_fee": np.where(rng.random(rows) < 0.08, 1.75, 0.0),
+        "cbd_congestion_fee": np.where(rng.random(rows) < 0.4, 0.75, 0.0),
+    }
+    total = fare + sum(fees.values()) + sum(extras[c.lower()] for c in fee_cols)
+
+    # TLC files carry some nulls in columns no rule checks
+    passenger = rng.choice([1, 1, 1, 2, 3, 4, 5], rows)
+    unknown = rng.random(rows) < 0.02
+
+    # bad rows: each breaks exactly one rule
+    bad = rng.random(rows) < bad_fraction
+    kind = np.where(bad, rng.integers(0, len(BAD_KINDS), rows), -1)
+    is_kind = {k: kind == i for i, k in enumerate(BAD_KINDS)}
+    distance = np.where(is_kind["TRIP_DISTANCE_NEG"], -distance, distance)
+    dropoff = np.where(is_kind["DROPOFF_BEFORE_PICKUP"], pickup - np.timedelta64(5, "m"), dropoff)
+
+    cols = {
+        "VendorID": pa.array(rng.choice([1, 2, 6, 7], rows, p=[0.25, 0.73, 0.01, 0.01]), ints["VendorID"]),
+        "tpep_pickup_datetime": _nullable(pickup, is_kind["PICKUP_TS_NULL"], pa.timestamp("us")),
+        "tpep_dropoff_datetime": _nullable(dropoff, is_kind["DROPOFF_TS_NULL"], pa.timestamp("us")),
+        "passenger_count": _nullable(passenger, unknown, ints["passenger_count"]),
+        "trip_distance": _nullable(distance, is_kind["TRIP_DISTANCE_NULL"], pa.float64()),
+        "RatecodeID": _nullable(rng.choice([1, 1, 1, 1, 2, 5, 99], rows), unknown, ints["RatecodeID"]),
+        "store_and_fwd_flag": _nullable(np.where(rng.random(rows) < 0.01, "Y", "N"), unknown, pa.string()),
+        "PULocationID": _nullable(pu, is_kind["PULocationID_NULL"], ints["location"]),
+        "DOLocationID": _nullable(do, is_kind["DOLocationID_NULL"], ints["location"]),
+        "payment_type": pa.array(payment, ints["payment_type"]),
+        "fare_amount": pa.array(fare, pa.float64()),
+    }
+    for c in MONEY_COLS[1:]:
+        cols[c] = pa.array(fees[c], pa.float64())
+    cols["total_amount"] = _nullable(np.round(total, 2), is_kind["TOTAL_AMOUNT_NULL"], pa.float64())
+    for c in fee_cols:
+        cols[c] = _nullable(extras[c.lower()], unknown, pa.float64())
+    return pa.table(cols)
+
+
+def generate(out_dir, scale: float = 0.1, vintages=("2019", "2024"), months_per_vintage: int = 1,
+             bad_fraction: float = 0.02, seed: int = 42, row_group_rows: int = 1_000_000) -> dict:
+    """
+    Writes yellow_tripdata_YYYY-MM.parquet files into out_dir and returns
+    {"rows": total, "files": {file name: rows}}.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    location_ids = load_location_ids()
+    months = [(v, _month_add(VINTAGES[v][0], i)) for v in vintages for i in range(months_per_vintage)]
+    total = max(int(scale * ROWS_PER_SCALE), len(months))
+
+    files = {}
+    for n, (vintage, month) in enumerate(months):
+        rows = total // len(months) + (1 if n < total % len(months) else 0)
+        name = f"yellow_tripdata_{month}.parquet"
+        table = month_table(month, vintage, rows, location_ids, bad_fraction, rng)
+        pq.write_table(table, os.path.join(out_dir, name), row_group_size=row_group_rows)
+        files[name] = rows
+    return {"rows": total, "files": files}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Synthetic NYC TLC yellow-trip parquet")
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--scale", type=float, default=0.1, help=f"1.0 = {ROWS_PER_SCALE:,} rows")
+    ap.add_argument("--vintages", default="2019,2024", help=f"comma list of {sorted(VINTAGES)}")
+    ap.add_argument("--months-per-vintage", type=int, default=1)
+    ap.add_argument("--bad-fraction", type=float, default=0.02)
+    ap.add_argument("--seed", type=int, default=42)
+    a = ap.parse_args()
+
+    vintages = [v.strip() for v in a.vintages.split(",") if v.strip()]
+    unknown = [v for v in vintages if v not in VINTAGES]
+    if unknown:
+        raise SystemExit(f"Unknown vintages {unknown} (expected {sorted(VINTAGES)})")
+    result = generate(a.out, a.scale, vintages, a.months_per_vintage, a.bad_fraction, a.seed)
+    for name, rows in result["files"].items():
+        print(f"{name}: {rows} rows")
+    print(f"TOTAL: {result['rows']} rows -> {a.out}")
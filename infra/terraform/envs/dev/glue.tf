@@ -20,6 +20,15 @@ resource "aws_glue_job" "raw_to_validated" {
     "--enable-continuous-cloudwatch-log" = "true"
     "--job-bookmark-option"              = "job-bookmark-disable"
     "--TempDir"                          = "s3://${var.bucket_name}/glue-temp/"
+    "--single_scan"                      = "true"
+    "--checkpoint_prefix"                = "${var.checkpoint_prefix}raw_trips/"
+    "--quarantine_layout"                = "reason"
+    "--GOV_METRICS_NAMESPACE"            = local.governance_namespace
+    "--extra-py-files"                   = join(",", [
+      "s3://${var.bucket_name}/${aws_s3_object.glue_stage_metrics.key}",
+      "s3://${var.bucket_name}/${aws_s3_object.glue_trip_rules.key}",
+      "s3://${var.bucket_name}/${aws_s3_object.glue_lake_io.key}",
+    ])
   }
 }
 
@@ -38,11 +47,57 @@ resource "aws_glue_job" "enrich_to_curated" {
   number_of_workers = 2
   timeout           = 45
 
+  # opt-in per run, not defaults:
+  #   --vendor_snapshot_prefix / --ratecode_snapshot_prefix (no deployed job publishes these snapshots)
+  #   --fact_prefix ${var.fact_prefix} --dim_keys_prefix ${var.dim_keys_prefix}
+  #     (needs the key maps unloaded by sql/redshift/16_fact_key_maps.sql)
+  default_arguments = {
+    "--enable-metrics"                   = "true"
+    "--enable-continuous-cloudwatch-log" = "true"
+    "--job-bookmark-option"              = "job-bookmark-disable"
+    "--TempDir"                          = "s3://${var.bucket_name}/glue-temp/"
+    "--GOV_METRICS_NAMESPACE"            = local.governance_namespace
+    "--rollup_prefix"                    = var.rollup_prefix
+    "--extra-py-files"                   = join(",", [
+      "s3://${var.bucket_name}/${aws_s3_object.glue_stage_metrics.key}",
+      "s3://${var.bucket_name}/${aws_s3_object.glue_lake_io.key}",
+      "s3://${var.bucket_name}/${aws_s3_object.glue_trip_rollup.key}",
+    ])
+    # conditional PUT (If-Match / If-None-Match) of the rollup _LATEST.json; Glue 4.0 ships an older boto3
+    "--additional-python-modules"        = "boto3>=1.36"
+  }
+}
+
+# Small-file compaction of the run folders (validated by default, read through _MANIFEST.json only;
+# to compact curated pass --trips_prefix ${var.curated_trips_prefix} or ${var.fact_prefix} with
+# --catalog_database/--catalog_table of its Spectrum table and --manifest_readers_only false)
+resource "aws_glue_job" "compact_trips" {
+  name     = "${local.name}-compact-trips"
+  role_arn = aws_iam_role.glue_role.arn
+
+  command {
+    name            = "glueetl"
+    python_version  = "3"
+    script_location = "s3://${var.bucket_name}/${aws_s3_object.glue_job_compact.key}"
+  }
+
+  glue_version      = "4.0"
+  worker_type       = "G.1X"
+  number_of_workers = 2
+  timeout           = 60
+
   default_arguments = {
     "--enable-metrics"                   = "true"
     "--enable-continuous-cloudwatch-log" = "true"
     "--job-bookmark-option"              = "job-bookmark-disable"
     "--TempDir"                          = "s3://${var.bucket_name}/glue-temp/"
+    "--trips_prefix"                     = var.validated_trips_prefix
+    "--manifest_readers_only"            = "true"
+    "--metrics_prefix"                   = "${var.metrics_prefix}compaction/"
     "--GOV_METRICS_NAMESPACE"            = local.governance_namespace
+    "--extra-py-files"                   = join(",", [
+      "s3://${var.bucket_name}/${aws_s3_object.glue_stage_metrics.key}",
+      "s3://${var.bucket_name}/${aws_s3_object.glue_lake_io.key}",
+    ])
   }
 }
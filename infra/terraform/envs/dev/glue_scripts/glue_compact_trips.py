@@ -0,0 +1,358 @@
+import sys
+import json
+from datetime import datetime, timezone
+
+import boto3
+from awsglue.utils import getResolvedOptions
+from pyspark.context import SparkContext
+from awsglue.context import GlueContext
+from awsglue.job import Job
+from pyspark.sql import functions as F
+
+from lake_io import is_data_file, open_store
+from stage_metrics import StageMetrics
+
+# ----------------------------
+# Small-file compaction for the run-scoped trip layers
+# ----------------------------
+# Every run of Glue job 1 / job 2 adds a run_id=... folder of Spark part files under
+# validated/trips_validated/ and curated/. This job rewrites the small files of each leaf
+# partition (the run folder itself, or run_id=.../pickup_year=/pickup_month=/pickup_day=/
+# with the date layout) into files close to --target_file_mb.
+#
+# Commit protocol, per run folder:
+#   0) a run without _MANIFEST.json gets one listing its current files (readers list the
+#      folder until a manifest exists, so it is pinned before anything is added to it)
+#   1) _COMPACTION.json (intent) records the committed file set and the generation before
+#      anything is written
+#   2) compacted files are written to a sibling folder outside the table location,
+#      <trips_prefix>_compacted/<generation>/run_id=.../<leaf>, where no folder listing sees them
+#   3) _MANIFEST.json is replaced in one PUT with the new file set (the commit point)
+#   4) the Glue Catalog partition of every rewritten leaf is pointed at its compacted folder
+#      (--catalog_database / --catalog_table), which switches Spectrum over
+#   5) the rewritten files and the intent are deleted
+# Readers that resolve the run through _MANIFEST.json (job 2, trip_fact_loader.py,
+# Redshift COPY ... MANIFEST) and readers that list the catalog partition folders (Spectrum,
+# 09_fact.sql) never see old and new files together. Without a catalog table nothing re-points
+# the folder listings, so the job then needs --manifest_readers_only true (validated layer).
+# A run whose intent is still present was interrupted and is rolled forward (manifest already
+# replaced) or back on the next run.
+
+MANIFEST_NAME = "_MANIFEST.json"
+INTENT_NAME = "_COMPACTION.json"
+
+
+def _compacted_prefix(base_prefix: str) -> str:
+    """Sibling of the trips prefix holding compacted files: outside every table location."""
+    return base_prefix.rstrip("/") + "_compacted/"
+
+
+def _partition_path(leaf: str) -> str:
+    """run_id=.../<partition folders>/ of a leaf, in the run folder or a compacted generation."""
+    return leaf[leaf.index("run_id="):]
+
+
+def _run_folders(store, base_prefix: str, run_ids, run_from: str, run_to: str) -> dict:
+    """
+    {run_id: [objects]} for the run_id=... folders selected by run_ids or the run range,
+    with the files earlier compactions wrote for those runs under the compacted prefix.
+    """
+    runs = {}
+    for obj in store.list_objects(f"{base_prefix}run_id="):
+        folder = obj["key"][len(base_prefix):].split("/", 1)[0]
+        rid = folder.split("=", 1)[1]
+        if run_ids and rid not in run_ids:
+            continue
+        if (run_from and rid < run_from) or (run_to and rid > run_to):
+            continue
+        runs.setdefault(rid, []).append(obj)
+    compacted = _compacted_prefix(base_prefix)
+    for obj in store.list_objects(compacted):
+        rid = _partition_path(obj["key"]).split("/", 1)[0].split("=", 1)[1]
+        if rid in runs:
+            runs[rid].append(obj)
+    return dict(sorted(runs.items()))
+
+
+def _manifest_payload(store, files) -> dict:
+    # Redshift COPY manifest layout (COPY ... FORMAT AS PARQUET needs meta.content_length)
+    return {
+        "entries": [{"url": store.uri(o["key"]), "mandatory": True,
+                     "meta": {"content_length": o["size"]}}
+                    for o in sorted(files, key=lambda o: o["key"])],
+    }
+
+
+def _committed_files(store, run_prefix: str, objects):
+    """
+    The run's committed data files: _MANIFEST.json entries if present, else every data file
+    of the run folder (compacted files a rewrite of the run left behind are not part of it).
+    """
+    manifest = store.get_json(f"{run_prefix}{MANIFEST_NAME}")
+    data = {o["key"]: o for o in objects if is_data_file(o["key"])}
+    if not manifest:
+        return [o for k, o in data.items() if k.startswith(run_prefix)]
+    base_uri = store.uri("")
+    keys = [e["url"][len(base_uri):] for e in manifest.get("entries", [])]
+    return [data[k] for k in keys if k in data]
+
+
+def _recover_run(store, catalog, run_prefix: str, objects):
+    """
+    Finishes a compaction interrupted before its intent was removed: if _MANIFEST.json already
+    differs from the intent's file set the commit happened, the catalog partitions are switched
+    (again) and the old files go, otherwise the uncommitted new files go. Returns the objects
+    left for the run.
+    """
+    intent = store.get_json(f"{run_prefix}{INTENT_NAME}")
+    if not intent:
+        return objects
+    old = set(intent["files"])
+    committed = {o["key"] for o in _committed_files(store, run_prefix, objects)}
+    manifest = store.get_json(f"{run_prefix}{MANIFEST_NAME}")
+    if manifest and committed != old:
+        _switch_partitions(store, catalog, intent.get("moves", []))
+        drop = [k for k in old if k not in committed]
+        print(f"COMPACTION RECOVERY: {run_prefix} rolled forward ({len(drop)} old files)")
+    else:
+        # new files are those of the intent's generation (appended in the run folder before generations)
+        generation = f"/{intent['generation']}/" if intent.get("generation") else ""
+        drop = [o["key"] for o in objects
+                if is_data_file(o["key"]) and generation in o["key"] and o["key"] not in old]
+        print(f"COMPACTION RECOVERY: {run_prefix} rolled back ({len(drop)} partial files)")
+    store.delete_keys(drop + [f"{run_prefix}{INTENT_NAME}"])
+    dropped = set(drop)
+    return [o for o in objects if o["key"] not in dropped and not o["key"].endswith(INTENT_NAME)]
+
+
+def _leaf_groups(files) -> dict:
+    """{leaf folder prefix: [objects]} - compaction never merges files across partitions."""
+    leaves = {}
+    for o in files:
+        leaves.setdefault(o["key"].rsplit("/", 1)[0] + "/", []).append(o)
+    return leaves
+
+
+def _sort_column(columns, sort_by: str):
+    lowered = {c.lower(): c for c in columns}
+    return lowered.get(sort_by.lower()) if sort_by else None
+
+
+def _partition_values(partition_keys, leaf: str):
+    """Catalog partition values of a leaf folder, from its key=value folder names."""
+    folders = dict(f.split("=", 1) for f in _partition_path(leaf).strip("/").split("/"))
+    lowered = {k.lower(): v for k, v in folders.items()}
+    if sorted(lowered) != sorted(k.lower() for k in partition_keys):
+        raise Exception(f"Leaf {leaf} does not match the catalog partition keys {partition_keys}: "
+                        "each compacted leaf must be one catalog partition")
+    return [lowered[k.lower()] for k in partition_keys]
+
+
+def _catalog_partition_keys(catalog):
+    glue, database, table = catalog
+    return [k["Name"] for k in glue.get_table(DatabaseName=database, Name=table)["Table"]["PartitionKeys"]]
+
+
+def _switch_partitions(store, catalog, moves):
+    """
+    Points the catalog partition of each rewritten leaf at its compacted folder ([old leaf,
+    new leaf] pairs); a partition the crawler has not registered yet is created there.
+    """
+    if catalog is None:
+        return
+    glue, database, table = catalog
+    partition_keys = _catalog_partition_keys(catalog)
+    for old_leaf, new_leaf in moves:
+        values = _partition_values(partition_keys, old_leaf)
+        try:
+            partition = glue.get_partition(DatabaseName=database, TableName=table,
+                                           PartitionValues=values)["Partition"]
+        except glue.exceptions.EntityNotFoundException:
+            descriptor = glue.get_table(DatabaseName=database, Name=table)["Table"]["StorageDescriptor"]
+            descriptor = dict(descriptor, Location=store.uri(new_leaf))
+            glue.create_partition(DatabaseName=database, TableName=table,
+                                  PartitionInput={"Values": values, "StorageDescriptor": descriptor})
+            continue
+        descriptor = dict(partition["StorageDescriptor"], Location=store.uri(new_leaf))
+        glue.update_partition(DatabaseName=database, TableName=table, PartitionValueList=values,
+                              PartitionInput={"Values": values, "StorageDescriptor": descriptor,
+                                              "Parameters": partition.get("Parameters", {})})
+
+
+def _compact_leaf(spark, store, leaf: str, files, n_out: int, sort_by: str, target: str):
+    """Writes the leaf's rows to target as n_out files (range-sorted on sort_by when present); returns the new objects."""
+    df = spark.read.parquet(*[store.uri(o["key"]) for o in sorted(files, key=lambda o: o["key"])])
+    sort_col = _sort_column(df.columns, sort_by)
+    if sort_col and n_out > 1:
+        # file i holds the i-th sort range, each file sorted: global order across the leaf
+        df = df.repartitionByRange(n_out, F.col(sort_col)).sortWithinPartitions(sort_col)
+    elif sort_col:
+        df = df.coalesce(1).sortWithinPartitions(sort_col)
+    else:
+        df = df.coalesce(n_out)
+    df.write.mode("overwrite").parquet(store.uri(target))
+    written = [o for o in store.list_objects(target) if "/" not in o["key"][len(target):]]
+    # _SUCCESS and checksum files are not part of the file set
+    store.delete_keys([o["key"] for o in written if not is_data_file(o["key"])])
+    return [o for o in written if is_data_file(o["key"])]
+
+
+def _compact_run(spark, store, catalog, run_prefix: str, run_id: str, objects, target_bytes: int,
+                 min_files: int, partition_filter: str, sort_by: str) -> dict:
+    objects = _recover_run(store, catalog, run_prefix, objects)
+    files = _committed_files(store, run_prefix, objects)
+    result = {"run_id": run_id, "files_before": len(files), "files_after": len(files),
+              "bytes_rewritten": 0, "bytes_written": 0, "partitions_compacted": 0}
+
+    plan = []
+    for leaf, leaf_files in sorted(_leaf_groups(files).items()):
+        if partition_filter and partition_filter not in _partition_path(leaf):
+            continue
+        total = sum(o["size"] for o in leaf_files)
+        n_out = max(1, -(-total // target_bytes))
+        if len(leaf_files) >= min_files and n_out < len(leaf_files):
+            plan.append((leaf, leaf_files, n_out))
+    if not plan:
+        return result
+
+    if catalog is not None:
+        # fail before writing anything if a leaf is not a catalog partition of its own
+        partition_keys = _catalog_partition_keys(catalog)
+        for leaf, _, _ in plan:
+            _partition_values(partition_keys, leaf)
+
+    started = datetime.now(timezone.utc)
+    generation = started.strftime("c%Y%m%dT%H%M%S%fZ")
+    compacted_prefix = _compacted_prefix(run_prefix[:run_prefix.index("run_id=")])
+    moves = [[leaf, f"{compacted_prefix}{generation}/{_partition_path(leaf)}"] for leaf, _, _ in plan]
+    manifest_key = f"{run_prefix}{MANIFEST_NAME}"
+    if store.get_json(manifest_key) is None:
+        # first compaction of this run: pin the current file set before anything is rewritten
+        store.put_json(manifest_key, _manifest_payload(store, files))
+    store.put_json(f"{run_prefix}{INTENT_NAME}", {
+        "run_id": run_id,
+        "files": sorted(o["key"] for o in files),
+        "generation": generation,
+        "moves": moves,
+        "started_utc": started.isoformat(),
+    })
+    rewritten, written = [], []
+    for (leaf, leaf_files, n_out), (_, target) in zip(plan, moves):
+        written += _compact_leaf(spark, store, leaf, leaf_files, n_out, sort_by, target)
+        rewritten += leaf_files
+
+    # commit point: the manifest flips from the old to the new file set in one PUT
+    dropped = {o["key"] for o in rewritten}
+    kept = [o for o in files if o["key"] not in dropped]
+    store.put_json(manifest_key, _manifest_payload(store, kept + written))
+    _switch_partitions(store, catalog, moves)
+    store.delete_keys([o["key"] for o in rewritten] + [f"{run_prefix}{INTENT_NAME}"])
+
+    result.update(files_after=len(kept) + len(written),
+                  bytes_rewritten=sum(o["size"] for o in rewritten),
+                  bytes_written=sum(o["size"] for o in written),
+                  partitions_compacted=len(plan))
+    return result
+
+
+# ----------------------------
+# Main
+# ----------------------------
+# NOTE: optional args are only resolved when passed
+argv = sys.argv
+base_args = [
+    "JOB_NAME",
+    "bucket",
+    "trips_prefix",
+]
+if "--GOV_METRICS_NAMESPACE" in argv:
+    base_args.append("GOV_METRICS_NAMESPACE")
+for optional in ["run_ids", "run_from", "run_to", "partition", "target_file_mb", "min_files",
+                 "sort_by", "metrics_prefix", "local_root", "catalog_database", "catalog_table",
+                 "manifest_readers_only"]:
+    if f"--{optional}" in argv:
+        base_args.append(optional)
+
+args = getResolvedOptions(argv, base_args)
+
+sc = SparkContext()
+glueContext = GlueContext(sc)
+spark = glueContext.spark_session
+job = Job(glueContext)
+job.init(args["JOB_NAME"], args)
+perf = StageMetrics(spark, args["JOB_NAME"])
+
+bucket = args["bucket"]
+# validated_trips_prefix or curated_trips_prefix: the base holding the run_id=... folders
+trips_prefix = args["trips_prefix"].strip("/") + "/"
+
+# run selection: explicit run_ids (comma separated) and/or an inclusive run_id range
+run_ids = {r.strip() for r in args.get("run_ids", "").split(",") if r.strip()}
+run_from = args.get("run_from", "").strip()
+run_to = args.get("run_to", "").strip()
+# partition: only compact leaves whose path contains this (e.g. pickup_year=2024/pickup_month=1/)
+partition_filter = args.get("partition", "").strip("/")
+target_bytes = int(float(args.get("target_file_mb", "128")) * 1024 * 1024)
+min_files = int(args.get("min_files", "2"))
+# rows of a rewritten leaf are range-sorted on this column when it exists (pickup time by default)
+sort_by = args.get("sort_by", "tpep_pickup_datetime").strip()
+metrics_prefix = args.get("metrics_prefix", "").strip("/")
+
+# Glue Catalog table over trips_prefix (Spectrum): its partitions follow the compacted files.
+# Without one, every reader of the layer must resolve runs through _MANIFEST.json.
+catalog_database = args.get("catalog_database", "").strip()
+catalog_table = args.get("catalog_table", "").strip()
+manifest_readers_only = args.get("manifest_readers_only", "false").lower() == "true"
+if bool(catalog_database) != bool(catalog_table):
+    raise Exception("--catalog_database and --catalog_table go together")
+if not catalog_table and not manifest_readers_only:
+    raise Exception("Pass --catalog_database/--catalog_table of the table over --trips_prefix, or "
+                    "--manifest_readers_only true when nothing lists the run folders (no Spectrum table)")
+catalog = (boto3.client("glue"), catalog_database, catalog_table) if catalog_table else None
+
+local_root = args.get("local_root", "")
+store = open_store(bucket, local_root)
+
+perf.start("plan")
+runs = _run_folders(store, trips_prefix, run_ids, run_from, run_to)
+print(f"COMPACTION: {len(runs)} run folders under {store.uri(trips_prefix)}")
+
+perf.start("compact")
+results = []
+for rid, objects in runs.items():
+    result = _compact_run(spark, store, catalog, f"{trips_prefix}run_id={rid}/", rid, objects,
+                          target_bytes, min_files, partition_filter, sort_by)
+    print(f"COMPACTED: {json.dumps(result)}")
+    results.append(result)
+
+perf.start("metrics")
+totals = {key: sum(r[key] for r in results)
+          for key in ["files_before", "files_after", "bytes_rewritten", "bytes_written", "partitions_compacted"]}
+metrics = {
+    "trips_path": store.uri(trips_prefix),
+    "runs_scanned": len(results),
+    "runs_compacted": sum(1 for r in results if r["partitions_compacted"]),
+    **totals,
+    "target_file_mb": target_bytes / (1024 * 1024),
+    "runs": [r for r in results if r["partitions_compacted"]],
+    "stage_metrics": perf.summary(),
+    "generated_utc": datetime.now(timezone.utc).isoformat(),
+}
+print(f"COMPACTION SUMMARY: {json.dumps(totals)}")
+
+if metrics_prefix:
+    key = f"{metrics_prefix}/_COMPACTION_METRICS.json"
+    store.put_json(key, metrics)
+    print("Wrote metrics:", store.uri(key))
+
+# One batched PutMetricData per run (optional)
+namespace = args.get("GOV_METRICS_NAMESPACE", "")
+if namespace:
+    dims = [{"Name": "JobName", "Value": args["JOB_NAME"]}, {"Name": "Dataset", "Value": trips_prefix.rstrip("/")}]
+    boto3.client("cloudwatch").put_metric_data(Namespace=namespace, MetricData=[
+        {"MetricName": "CompactionFilesBefore", "Dimensions": dims, "Value": float(totals["files_before"]), "Unit": "Count"},
+        {"MetricName": "CompactionFilesAfter", "Dimensions": dims, "Value": float(totals["files_after"]), "Unit": "Count"},
+        {"MetricName": "CompactionBytesRewritten", "Dimensions": dims, "Value": float(totals["bytes_rewritten"]), "Unit": "Bytes"},
+    ] + perf.metric_data())
+
+job.commit()
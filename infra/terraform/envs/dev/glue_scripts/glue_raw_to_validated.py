@@ -1,44 +1,668 @@
 import sys
+import re
+import json
+import time
 from datetime import datetime, timezone
+from functools import partial
 
+import boto3
 from awsglue.utils import getResolvedOptions
 from pyspark.context import SparkContext
 from awsglue.context import GlueContext
 from awsglue.job import Job
+from pyspark import StorageLevel
+from pyspark.sql import Observation
 from pyspark.sql import functions as F
 from pyspark.sql import types as T
 
-args = getResolvedOptions(sys.argv, [
+from lake_io import advance_checkpoint, is_data_file, open_store, pending_raw_files, read_checkpoint
+from stage_metrics import StageMetrics
+from trip_rules import compile_bad_mask, decode_bad_reason, primary_reason, rules_for
+
+# ----------------------------
+# TLC schema registry (--schema_registry true)
+# ----------------------------
+# Canonical validated layout: every vintage is projected to these names and types.
+CANONICAL_SCHEMA = [
+    ("VendorID", T.IntegerType()),
+    ("tpep_pickup_datetime", T.TimestampType()),
+    ("tpep_dropoff_datetime", T.TimestampType()),
+    ("passenger_count", T.IntegerType()),
+    ("trip_distance", T.DoubleType()),
+    ("RatecodeID", T.IntegerType()),
+    ("store_and_fwd_flag", T.StringType()),
+    ("PULocationID", T.IntegerType()),
+    ("DOLocationID", T.IntegerType()),
+    ("payment_type", T.IntegerType()),
+    ("fare_amount", T.DoubleType()),
+    ("extra", T.DoubleType()),
+    ("mta_tax", T.DoubleType()),
+    ("tip_amount", T.DoubleType()),
+    ("tolls_amount", T.DoubleType()),
+    ("improvement_surcharge", T.DoubleType()),
+    ("total_amount", T.DoubleType()),
+    ("congestion_surcharge", T.DoubleType()),
+    ("airport_fee", T.DoubleType()),
+    ("cbd_congestion_fee", T.DoubleType()),
+]
+
+_MONEY_2015 = ["fare_amount", "extra", "mta_tax", "tip_amount", "tolls_amount",
+               "improvement_surcharge", "total_amount"]
+_FIELDS_2015 = [
+    ("VendorID", T.LongType()),
+    ("tpep_pickup_datetime", T.TimestampType()),
+    ("tpep_dropoff_datetime", T.TimestampType()),
+    ("passenger_count", T.DoubleType()),
+    ("trip_distance", T.DoubleType()),
+    ("RatecodeID", T.DoubleType()),
+    ("store_and_fwd_flag", T.StringType()),
+    ("PULocationID", T.LongType()),
+    ("DOLocationID", T.LongType()),
+    ("payment_type", T.LongType()),
+] + [(c, T.DoubleType()) for c in _MONEY_2015]
+_FIELDS_2024 = [
+    ("VendorID", T.IntegerType()),
+    ("tpep_pickup_datetime", T.TimestampType()),
+    ("tpep_dropoff_datetime", T.TimestampType()),
+    ("passenger_count", T.LongType()),
+    ("trip_distance", T.DoubleType()),
+    ("RatecodeID", T.LongType()),
+    ("store_and_fwd_flag", T.StringType()),
+    ("PULocationID", T.IntegerType()),
+    ("DOLocationID", T.IntegerType()),
+    ("payment_type", T.LongType()),
+] + [(c, T.DoubleType()) for c in _MONEY_2015] + [
+    ("congestion_surcharge", T.DoubleType()),
+    ("Airport_fee", T.DoubleType()),
+]
+
+# Physical layout of each yellow-trip file vintage, keyed by version name:
+#   from    -> first file month (yellow_tripdata_YYYY-MM) the vintage applies to
+#   fields  -> parquet column names and their exact physical types (Spark does not
+#              widen int32/int64/double on read, so these must match the files)
+#   renames -> physical name -> canonical name
+# Canonical columns a vintage does not have are filled with typed NULLs.
+TLC_SCHEMA_VERSIONS = {
+    "2015": {"from": "2015-01", "fields": _FIELDS_2015, "renames": {}},
+    "2019": {"from": "2019-01", "fields": _FIELDS_2015 + [("congestion_surcharge", T.DoubleType())],
+             "renames": {}},
+    "2022": {"from": "2022-01",
+             "fields": _FIELDS_2015 + [("congestion_surcharge", T.DoubleType()), ("airport_fee", T.DoubleType())],
+             "renames": {}},
+    "2024": {"from": "2024-01", "fields": _FIELDS_2024, "renames": {"Airport_fee": "airport_fee"}},
+    "2025": {"from": "2025-01", "fields": _FIELDS_2024 + [("cbd_congestion_fee", T.DoubleType())],
+             "renames": {"Airport_fee": "airport_fee"}},
+}
+
+_FILE_MONTH = re.compile(r"(\d{4})-(\d{2})")
+
+
+# pickup-date partition columns used by --partition_layout date
+DATE_PARTITION_COLS = ["pickup_year", "pickup_month", "pickup_day"]
+
+# --quarantine_layout reason: <base>/reason_code=<rule>/pickup_month=YYYY-MM/segment=<run_id>/
+# (segment is the writing run, or c<timestamp> once compacted; rows keep their run_id)
+QUARANTINE_REASON_BASE = "validated/quarantine/by_reason/"
+QUARANTINE_PARTITION_COLS = ["reason_code", "pickup_month", "segment"]
+QUARANTINE_TARGET_FILE_BYTES = 128 * 1024 * 1024
+
+
+# ----------------------------
+# Helpers
+# ----------------------------
+def _tlc_version_for(key: str, default: str = ""):
+    """Registry version for a raw file by the YYYY-MM in its name (default when the name has none)."""
+    m = _FILE_MONTH.search(key.rsplit("/", 1)[-1])
+    if not m:
+        return default or None
+    month = f"{m.group(1)}-{m.group(2)}"
+    eligible = [v for v, spec in TLC_SCHEMA_VERSIONS.items() if spec["from"] <= month]
+    return max(eligible, key=lambda v: TLC_SCHEMA_VERSIONS[v]["from"]) if eligible else None
+
+
+def _tlc_schema(version: str):
+    return T.StructType([T.StructField(name, typ, True) for name, typ in TLC_SCHEMA_VERSIONS[version]["fields"]])
+
+
+def _to_canonical(df, version: str, keep=()):
+    """Projects a frame read with _tlc_schema(version) to CANONICAL_SCHEMA (plus `keep` columns)."""
+    spec = TLC_SCHEMA_VERSIONS[version]
+    physical = {spec["renames"].get(name, name): name for name, _ in spec["fields"]}
+    return df.select(*[
+        (F.col(physical[name]) if name in physical else F.lit(None)).cast(typ).alias(name)
+        for name, typ in CANONICAL_SCHEMA
+    ], *keep)
+
+
+def _read_tlc_registry(spark, uris_by_version: dict):
+    """
+    Reads each vintage's files with its explicit schema (no footer inference or schema
+    merge, only the registry columns are decoded) and unions them in the canonical layout.
+    """
+    out = None
+    for version, uris in sorted(uris_by_version.items()):
+        part = _to_canonical(spark.read.schema(_tlc_schema(version)).parquet(*uris), version)
+        out = part if out is None else out.union(part)
+    return out
+
+
+def _with_pickup_date_partitions(df):
+    """Adds pickup_year / pickup_month / pickup_day derived from tpep_pickup_datetime."""
+    ts = F.col("tpep_pickup_datetime")
+    return (df.withColumn("pickup_year", F.year(ts))
+              .withColumn("pickup_month", F.month(ts))
+              .withColumn("pickup_day", F.dayofmonth(ts)))
+
+
+def _write_date_partitioned(df, path: str, mode: str = "overwrite"):
+    # one task per day, rows sorted by pickup time inside each file;
+    # dynamic overwrite only replaces the day folders present in df
+    (df.repartition(*DATE_PARTITION_COLS)
+       .sortWithinPartitions(*DATE_PARTITION_COLS, "tpep_pickup_datetime")
+       .write.mode(mode)
+       .option("partitionOverwriteMode", "dynamic")
+       .partitionBy(*DATE_PARTITION_COLS)
+       .parquet(path))
+
+
+def _observed_outputs(df2, active_rules, run_id: str, ingested_at: str, extra_exprs=()):
+    """
+    Splits a frame carrying bad_mask into (good_df, bad_df, good_obs, bad_obs). Row counts,
+    per-rule hit counts and any extra_exprs are observed while the outputs are written.
+    """
+    good_df = df2.filter(F.col("bad_mask") == 0).drop("bad_mask")
+    # reason strings are only built for quarantined rows
+    bad_df = (df2.filter(F.col("bad_mask") != 0)
+              .withColumn("bad_reason", decode_bad_reason(F.col("bad_mask"), active_rules))
+              .withColumn("reason_code", primary_reason(F.col("bad_mask"), active_rules)))
+
+    good_obs = Observation("validated_rows")
+    bad_obs = Observation("quarantine_rows")
+    good_df = good_df.observe(good_obs, F.count(F.lit(1)).alias("rows"), *extra_exprs)
+    bad_df = bad_df.observe(
+        bad_obs,
+        F.count(F.lit(1)).alias("rows"),
+        *[F.sum((F.col("bad_mask").bitwiseAND(F.lit(bit)) != 0).cast("int")).alias(rule["name"])
+          for bit, rule in active_rules],
+        *extra_exprs
+    )
+    bad_df = bad_df.drop("bad_mask")
+
+    # Add governance-ish columns (handy later)
+    good_df = good_df.withColumn("run_id", F.lit(run_id)).withColumn("ingested_at_utc", F.lit(ingested_at))
+    bad_df  = bad_df.withColumn("run_id", F.lit(run_id)).withColumn("ingested_at_utc", F.lit(ingested_at))
+    return good_df, bad_df, good_obs, bad_obs
+
+
+def _write_outputs(good_df, bad_df, validated_out: str, quarantine_out: str, partition_layout: str,
+                   quarantine_layout: str = "flat", validated_mode: str = "overwrite"):
+    # Good rows → validated (append: a stream micro-batch adding to its run folder)
+    if partition_layout == "date":
+        _write_date_partitioned(_with_pickup_date_partitions(good_df), validated_out, validated_mode)
+    else:
+        (good_df
+         .write.mode(validated_mode)
+         .parquet(validated_out)
+        )
+
+    # Bad rows → quarantine (keep bad_reason)
+    if quarantine_layout == "reason":
+        # one file per reason/month for this run; dynamic overwrite only replaces this run's segments
+        (bad_df
+         .withColumn("pickup_month",
+                     F.coalesce(F.date_format("tpep_pickup_datetime", "yyyy-MM"), F.lit("unknown")))
+         .withColumn("segment", F.col("run_id"))
+         .repartition("reason_code", "pickup_month")
+         .write.mode("overwrite")
+         .option("partitionOverwriteMode", "dynamic")
+         .partitionBy(*QUARANTINE_PARTITION_COLS)
+         .parquet(quarantine_out))
+    else:
+        (bad_df
+         .write.mode("overwrite")
+         .parquet(quarantine_out)
+        )
+
+
+def _finish_quarantine(spark, store, run_id: str, bad_rows: int, rule_hits: dict, compact_files: int) -> dict:
+    """Reason summary of the run, then compaction of the reason/month partitions it wrote to."""
+    summary = _quarantine_summary(spark, store, run_id, bad_rows, rule_hits)
+    touched = [(reason, month) for reason, months in summary["by_reason_month"].items() for month in months]
+    summary["compacted"] = _compact_quarantine(spark, store, touched, compact_files)
+    for c in summary["compacted"]:
+        print(f"QUARANTINE COMPACTED: {c}")
+    return summary
+
+
+def _quarantine_summary(spark, store, run_id: str, bad_rows: int, rule_hits: dict) -> dict:
+    """
+    Per-run reason summary (rows by primary reason and pickup month), written next to the
+    data so triage tools get counts without opening parquet. Only this run's segments are read.
+    """
+    by_reason_month = {}
+    if bad_rows:
+        base = store.uri(QUARANTINE_REASON_BASE)
+        counts = (spark.read.option("basePath", base)
+                  .parquet(f"{base}reason_code=*/pickup_month=*/segment={run_id}/")
+                  .groupBy("reason_code", "pickup_month").count()
+                  .collect())
+        for r in counts:
+            by_reason_month.setdefault(r["reason_code"], {})[r["pickup_month"]] = r["count"]
+    summary = {
+        "run_id": run_id,
+        "quarantine_rows": bad_rows,
+        "by_reason": {reason: sum(months.values()) for reason, months in sorted(by_reason_month.items())},
+        "by_reason_month": {reason: dict(sorted(months.items())) for reason, months in sorted(by_reason_month.items())},
+        # every violated rule, not only the primary one
+        "rule_hits": rule_hits,
+        "path": store.uri(QUARANTINE_REASON_BASE),
+        "generated_utc": datetime.now(timezone.utc).isoformat(),
+    }
+    key = f"{QUARANTINE_REASON_BASE}_summaries/run_id={run_id}.json"
+    store.put_json(key, summary)
+    summary["summary_path"] = store.uri(key)
+    return summary
+
+
+def _finish_compaction(store, part_prefix: str, manifest_key: str, manifest: dict):
+    """
+    Completes an interrupted compaction: if the compacted segment was committed (_SUCCESS)
+    the source segments are removed, otherwise the partial target is. Then drops the manifest.
+    """
+    def keys_under(segment):
+        return [o["key"] for o in store.list_objects(f"{part_prefix}{segment}/")]
+
+    target_keys = keys_under(manifest["target"])
+    if any(k.endswith("/_SUCCESS") for k in target_keys):
+        store.delete_keys([k for seg in manifest["sources"] for k in keys_under(seg)])
+    else:
+        store.delete_keys(target_keys)
+    store.delete_keys([manifest_key])
+
+
+def _compact_quarantine(spark, store, partitions, min_files: int):
+    """
+    Rewrites every touched reason/month partition holding >= min_files data files (small
+    per-run files accumulate across runs) into one segment of ~128 MB files.
+    A manifest is written first so a failed compaction is rolled forward/back on the next run.
+    """
+    compacted = []
+    for reason, month in partitions:
+        part_prefix = f"{QUARANTINE_REASON_BASE}reason_code={reason}/pickup_month={month}/"
+        manifest_key = f"{QUARANTINE_REASON_BASE}_compaction/reason_code={reason}/pickup_month={month}.json"
+        pending = store.get_json(manifest_key)
+        if pending:
+            _finish_compaction(store, part_prefix, manifest_key, pending)
+
+        files = [o for o in store.list_objects(part_prefix)
+                 if is_data_file(o["key"]) and o["key"][len(part_prefix):].startswith("segment=")]
+        if len(files) < min_files:
+            continue
+        segments = sorted({o["key"][len(part_prefix):].split("/", 1)[0] for o in files})
+        target = f"segment=c{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}"
+        manifest = {"target": target, "sources": segments}
+        store.put_json(manifest_key, manifest)
+
+        total_bytes = sum(o["size"] for o in files)
+        n_out = max(1, -(-total_bytes // QUARANTINE_TARGET_FILE_BYTES))
+        rows = (spark.read.option("mergeSchema", "true")
+                .option("basePath", store.uri(part_prefix))
+                .parquet(*[store.uri(f"{part_prefix}{seg}/") for seg in segments]))
+        # a re-run run_id has a fresh per-run segment; its older copy inside a compacted segment is dropped
+        reruns = [seg.split("=", 1)[1] for seg in segments if not seg.startswith("segment=c")]
+        if len(reruns) < len(segments):
+            rows = rows.filter(~F.col("segment").startswith("c") | ~F.col("run_id").isin(reruns))
+        (rows.drop("segment")
+         .coalesce(n_out)
+         .write.mode("overwrite")
+         .parquet(store.uri(f"{part_prefix}{target}/")))
+        _finish_compaction(store, part_prefix, manifest_key, manifest)
+        compacted.append({"reason_code": reason, "pickup_month": month, "files_in": len(files),
+                          "files_out": n_out, "segment": target.split("=", 1)[1]})
+    return compacted
+
+
+def _run_data_files(store, run_prefix: str, exclude) -> list:
+    return [o["key"] for o in store.list_objects(run_prefix) if is_data_file(o["key"]) and o["key"] not in exclude]
+
+
+def _process_stream_batch(batch_df, batch_id: int, ctx: dict):
+    """
+    foreachBatch handler of --streaming. A micro-batch goes through the same rules as the
+    batch path and appends its validated rows to the stream run's folder (run_id=<run_id>/);
+    its quarantine output is a run of its own (run_id=<run_id>-<batch_id>). The files each
+    batch added are recorded in the stream run state: a replayed batch (after a failure
+    before the checkpoint commit) that is recorded is skipped, and files of an attempt
+    that never got recorded are removed before the batch is written again. The run's
+    _LATEST pointer is published by the caller once the query stops.
+    """
+    t0 = time.time()
+    store, state = ctx["store"], ctx["state"]
+    if str(batch_id) in state["batches"]:
+        print(f"STREAM BATCH {batch_id}: already written to run {state['run_id']}, skipped")
+        return
+    run_prefix = f"{ctx['validated_prefix']}run_id={state['run_id']}/"
+    batch_run_id = f"{state['run_id']}-{batch_id:06d}"
+    validated_out = store.uri(run_prefix)
+    quarantine_out = (store.uri(QUARANTINE_REASON_BASE) if ctx["quarantine_layout"] == "reason"
+                      else store.uri(f"validated/quarantine/run_id={batch_run_id}/"))
+
+    recorded = {key for batch in state["batches"].values() for key in batch["files"]}
+    store.delete_keys([f"{run_prefix}_MANIFEST.json"] + _run_data_files(store, run_prefix, recorded))
+
+    df2 = batch_df.withColumn("bad_mask", compile_bad_mask(ctx["active_rules"])).persist(StorageLevel.MEMORY_AND_DISK)
+    oldest = F.min(F.expr("unix_micros(_file_mtime)")).alias("oldest_file_us")
+    good_df, bad_df, good_obs, bad_obs = _observed_outputs(
+        df2, ctx["active_rules"], batch_run_id, datetime.now(timezone.utc).isoformat(), [oldest])
+    # validated rows belong to the stream run they are published with
+    good_df = good_df.withColumn("run_id", F.lit(state["run_id"]))
+    _write_outputs(good_df.drop("_file_mtime"), bad_df.drop("_file_mtime"), validated_out, quarantine_out,
+                   ctx["partition_layout"], ctx["quarantine_layout"], validated_mode="append")
+
+    good, bad = good_obs.get, bad_obs.get
+    df2.unpersist()
+    state["batches"][str(batch_id)] = {"files": _run_data_files(store, run_prefix, recorded),
+                                       "rows": good["rows"], "quarantine_rows": bad["rows"]}
+    store.put_json(ctx["state_key"], state)
+    if not good["rows"] and not bad["rows"]:
+        return
+    rule_hits = {rule["name"]: int(bad[rule["name"]] or 0) for _, rule in ctx["active_rules"]}
+    quarantine_summary = None
+    if ctx["quarantine_layout"] == "reason":
+        quarantine_summary = _finish_quarantine(batch_df.sparkSession, store, batch_run_id, bad["rows"],
+                                                rule_hits, ctx["quarantine_compact_files"])
+
+    # latency: oldest input file of the batch landing -> outputs committed
+    committed = time.time()
+    oldest_us = min(v for v in (good["oldest_file_us"], bad["oldest_file_us"]) if v is not None)
+    metrics = {
+        "run_id": state["run_id"],
+        "batch_id": batch_id,
+        "tlc_version": ctx["tlc_version"],
+        "partition_layout": ctx["partition_layout"],
+        "validated_rows": good["rows"],
+        "quarantine_rows": bad["rows"],
+        "rule_hits": rule_hits,
+        "quarantine_layout": ctx["quarantine_layout"],
+        "quarantine_by_reason": quarantine_summary["by_reason"] if quarantine_summary else None,
+        "quarantine_summary_path": quarantine_summary["summary_path"] if quarantine_summary else None,
+        "batch_seconds": round(committed - t0, 3),
+        "latency_seconds": round(committed - oldest_us / 1e6, 3),
+        "validated_write_path": validated_out,
+        "quarantine_write_path": quarantine_out,
+        "generated_utc": datetime.now(timezone.utc).isoformat(),
+    }
+    print(f"STREAM BATCH {batch_id}: {json.dumps(metrics)}")
+    if ctx["metrics_prefix"]:
+        _write_validation_metrics_json(store, f"{ctx['metrics_prefix']}/stream/batch_id={batch_id:06d}", metrics)
+        _write_validation_metrics_json(store, ctx["metrics_prefix"], metrics)
+    if ctx["namespace"]:
+        dims = [{"Name": "JobName", "Value": ctx["job_name"]}]
+        boto3.client("cloudwatch").put_metric_data(Namespace=ctx["namespace"], MetricData=[
+            {"MetricName": name, "Dimensions": dims, "Value": float(value), "Unit": unit}
+            for name, value, unit in [
+                ("StreamBatchValidatedRows", metrics["validated_rows"], "Count"),
+                ("StreamBatchQuarantineRows", metrics["quarantine_rows"], "Count"),
+                ("StreamBatchSeconds", metrics["batch_seconds"], "Seconds"),
+                ("StreamBatchLatency", metrics["latency_seconds"], "Seconds"),
+            ]
+        ])
+
+
+def _publish_latest_pointer(store, base_prefix: str, pointer: dict):
+    """
+    Writes <base_prefix>_LATEST.json once the run folder is fully written, so consumers
+    resolve the newest run in O(1) and never pick up a half-written folder.
+    """
+    key = f"{base_prefix}_LATEST.json"
+    store.put_json(key, pointer)
+    return store.uri(key)
+
+
+def _write_validation_metrics_json(store, metrics_prefix: str, metrics: dict):
+    if metrics_prefix and not metrics_prefix.endswith("/"):
+        metrics_prefix += "/"
+    key = f"{metrics_prefix}_VALIDATION_METRICS.json"
+    store.put_json(key, metrics)
+    return store.uri(key)
+
+
+# NOTE: optional args are only resolved when passed
+argv = sys.argv
+base_args = [
     "JOB_NAME",
     "bucket",
     "raw_trips_prefix",
     "validated_trips_prefix",
     "run_id",
-])
+]
+if "--single_scan" in argv:
+    base_args.append("single_scan")
+if "--tlc_version" in argv:
+    base_args.append("tlc_version")
+if "--metrics_prefix" in argv:
+    base_args.append("metrics_prefix")
+if "--incremental" in argv:
+    base_args.append("incremental")
+if "--checkpoint_prefix" in argv:
+    base_args.append("checkpoint_prefix")
+if "--local_root" in argv:
+    base_args.append("local_root")
+if "--partition_layout" in argv:
+    base_args.append("partition_layout")
+if "--schema_registry" in argv:
+    base_args.append("schema_registry")
+if "--GOV_METRICS_NAMESPACE" in argv:
+    base_args.append("GOV_METRICS_NAMESPACE")
+for optional in ["streaming", "trigger", "trigger_interval", "stream_checkpoint_prefix", "max_files_per_trigger",
+                 "quarantine_layout", "quarantine_compact_files"]:
+    if f"--{optional}" in argv:
+        base_args.append(optional)
+
+args = getResolvedOptions(argv, base_args)
 
 sc = SparkContext()
 glueContext = GlueContext(sc)
 spark = glueContext.spark_session
 job = Job(glueContext)
 job.init(args["JOB_NAME"], args)
+perf = StageMetrics(spark, args["JOB_NAME"])
 
 bucket = args["bucket"]
 raw_prefix = args["raw_trips_prefix"].rstrip("/") + "/"
 validated_prefix = args["validated_trips_prefix"].rstrip("/") + "/"
 run_id = args["run_id"]
 
-raw_path = f"s3://{bucket}/{raw_prefix}"
-validated_out = f"s3://{bucket}/{validated_prefix}run_id={run_id}/"
-quarantine_out = f"s3://{bucket}/validated/quarantine/run_id={run_id}/"
+# single_scan=true: cache the cast/validated frame so raw/trips/ is read once for both writes
+single_scan = args.get("single_scan", "false").strip().lower() == "true"
+tlc_version = args.get("tlc_version", "").strip()
+# schema_registry=true: read each file vintage with its TLC_SCHEMA_VERSIONS schema
+schema_registry = args.get("schema_registry", "false").strip().lower() == "true"
+if tlc_version and schema_registry and tlc_version not in TLC_SCHEMA_VERSIONS:
+    raise Exception(f"Unknown tlc_version '{tlc_version}' (expected one of {sorted(TLC_SCHEMA_VERSIONS)})")
+metrics_prefix = args.get("metrics_prefix", "").strip("/")
+
+# incremental=true: only read raw files that are new/changed since the last checkpoint
+incremental = args.get("incremental", "false").strip().lower() == "true"
+checkpoint_prefix = args.get("checkpoint_prefix", "manifests/checkpoints/raw_trips/").strip("/") + "/"
+checkpoint_key = f"{checkpoint_prefix}_CHECKPOINT.json"
+
+# local_root: read/write <local_root>/<bucket>/... instead of S3 (offline runs)
+local_root = args.get("local_root", "")
+store = open_store(bucket, local_root)
+
+# partition_layout=date: run folder is partitioned by pickup_year/pickup_month/pickup_day
+partition_layout = args.get("partition_layout", "flat").strip().lower()
+if partition_layout not in ("flat", "date"):
+    raise Exception(f"Unsupported partition_layout '{partition_layout}' (expected flat or date)")
+
+# streaming=true: Structured Streaming over raw_trips_prefix, one run folder per micro-batch
+streaming = args.get("streaming", "false").strip().lower() == "true"
+# trigger=available_now (default): drain the files that have landed, then stop
+# trigger=processing_time: keep running, one micro-batch every trigger_interval
+trigger = args.get("trigger", "available_now").strip().lower()
+if trigger not in ("available_now", "processing_time"):
+    raise Exception(f"Unsupported trigger '{trigger}' (expected available_now or processing_time)")
+trigger_interval = args.get("trigger_interval", "1 minute")
+stream_checkpoint_prefix = args.get("stream_checkpoint_prefix", "manifests/checkpoints/raw_trips_stream/").strip("/") + "/"
+max_files_per_trigger = args.get("max_files_per_trigger", "")
+
+# quarantine_layout=reason: quarantine partitioned by primary reason code and pickup month,
+# with a per-run reason summary; partitions holding >= quarantine_compact_files files are compacted
+quarantine_layout = args.get("quarantine_layout", "flat").strip().lower()
+if quarantine_layout not in ("flat", "reason"):
+    raise Exception(f"Unsupported quarantine_layout '{quarantine_layout}' (expected flat or reason)")
+quarantine_compact_files = int(args.get("quarantine_compact_files", "16"))
+
+raw_path = store.uri(raw_prefix)
+validated_out = store.uri(f"{validated_prefix}run_id={run_id}/")
+quarantine_out = (store.uri(QUARANTINE_REASON_BASE) if quarantine_layout == "reason"
+                  else store.uri(f"validated/quarantine/run_id={run_id}/"))
+
+# ----------------------------
+# 0) Streaming mode: same rules per micro-batch, then exit
+# ----------------------------
+if streaming:
+    # a streaming file source has one schema: files are read as the tlc_version
+    # vintage (default: the newest registry version)
+    stream_version = tlc_version or max(TLC_SCHEMA_VERSIONS, key=lambda v: TLC_SCHEMA_VERSIONS[v]["from"])
+    if stream_version not in TLC_SCHEMA_VERSIONS:
+        raise Exception(f"Unknown tlc_version '{stream_version}' (expected one of {sorted(TLC_SCHEMA_VERSIONS)})")
+    reader = spark.readStream.schema(_tlc_schema(stream_version))
+    if max_files_per_trigger:
+        reader = reader.option("maxFilesPerTrigger", int(max_files_per_trigger))
+    stream_df = _to_canonical(reader.parquet(raw_path), stream_version,
+                              keep=[F.col("_metadata.file_modification_time").alias("_file_mtime")])
+
+    active_rules = rules_for(stream_df.columns, stream_version)
+    print("STREAM:", {"version": stream_version, "trigger": trigger, "rules": [r["name"] for _, r in active_rules]})
+
+    # One validated run per stream execution. _STREAM_RUN.json (next to the stream checkpoint)
+    # records the batches written to it; a run a failed execution left unpublished is
+    # resumed, so the batches it committed to the stream checkpoint are still published.
+    stream_state_key = f"{stream_checkpoint_prefix}_STREAM_RUN.json"
+    stream_state = store.get_json(stream_state_key)
+    if stream_state and not stream_state.get("published_utc"):
+        print(f"STREAM: resuming unpublished run {stream_state['run_id']} ({len(stream_state['batches'])} batches)")
+    else:
+        # the run holds only new files when the stream checkpoint already committed batches
+        stream_state = {
+            "run_id": run_id,
+            "incremental": any(True for _ in store.list_objects(f"{stream_checkpoint_prefix}commits/")),
+            "batches": {},
+        }
+    handler = partial(_process_stream_batch, ctx={
+        "store": store,
+        "state": stream_state,
+        "state_key": stream_state_key,
+        "validated_prefix": validated_prefix,
+        "partition_layout": partition_layout,
+        "quarantine_layout": quarantine_layout,
+        "quarantine_compact_files": quarantine_compact_files,
+        "active_rules": active_rules,
+        "tlc_version": stream_version,
+        "metrics_prefix": metrics_prefix,
+        "namespace": args.get("GOV_METRICS_NAMESPACE", ""),
+        "job_name": args["JOB_NAME"],
+    })
+    writer = (stream_df.writeStream
+              .queryName(f"raw_to_validated_{run_id}")
+              .foreachBatch(handler)
+              .option("checkpointLocation", store.uri(stream_checkpoint_prefix)))
+    if trigger == "available_now":
+        writer = writer.trigger(availableNow=True)
+    else:
+        writer = writer.trigger(processingTime=trigger_interval)
+
+    perf.start("stream")
+    query = writer.start()
+    query.awaitTermination()
+    print(f"STREAM DONE: last progress {json.dumps(query.lastProgress)}")
+
+    # publish the run once, with every batch of this execution (and of a resumed one) in it
+    perf.start("publish")
+    batches = stream_state["batches"]
+    if any(b["rows"] or b["quarantine_rows"] for b in batches.values()):
+        stream_run_id = stream_state["run_id"]
+        latest_uri = _publish_latest_pointer(store, validated_prefix, {
+            "dataset": "trips_validated",
+            "run_id": stream_run_id,
+            "bucket": bucket,
+            "prefix": f"{validated_prefix}run_id={stream_run_id}/",
+            "path": store.uri(f"{validated_prefix}run_id={stream_run_id}/"),
+            "partition_layout": partition_layout,
+            "row_count": sum(b["rows"] for b in batches.values()),
+            "stream_batches": sorted(int(b) for b in batches),
+            # false when the first batch of a fresh stream checkpoint read every raw file
+            "incremental": stream_state["incremental"],
+            "committed_utc": datetime.now(timezone.utc).isoformat(),
+        })
+        print(f"LATEST POINTER: {latest_uri}")
+    else:
+        print("STREAM: no new rows - _LATEST pointer left as it is")
+    if batches:
+        stream_state["published_utc"] = datetime.now(timezone.utc).isoformat()
+        store.put_json(stream_state_key, stream_state)
+    print(f"STAGE METRICS: {json.dumps(perf.summary())}")
+    job.commit()
+    sys.exit(0)
 
 # ----------------------------
 # 1) Read raw parquet
 # ----------------------------
-df = spark.read.parquet(raw_path)
+perf.start("read")
+changed_files = []
+if incremental:
+    checkpoint = read_checkpoint(store, checkpoint_key)
+    raw_files, pending_files = pending_raw_files(store, raw_prefix, checkpoint)
+    print(f"RAW FILES: {len(raw_files)} total, {len(pending_files)} new/changed since checkpoint")
+
+    if not pending_files:
+        print(f"Nothing to process - checkpoint {store.uri(checkpoint_key)} is up to date")
+        job.commit()
+        sys.exit(0)
+
+    # a changed file (same key, new ETag/size) replaces trips an earlier run already
+    # validated: the run reads every raw file and is published as a full run, so
+    # downstream rebuilds instead of adding the file's rows a second time
+    changed_files = [o["key"] for o in pending_files if o["key"] in checkpoint["files"]]
+    if changed_files:
+        print(f"CHANGED RAW FILES: {changed_files[:5]} ({len(changed_files)}) - reprocessing all {len(raw_files)} files")
+        pending_files = raw_files
+
+
+tlc_versions_read = None
+if schema_registry:
+    read_files = pending_files if incremental else [
+        o for o in store.list_objects(raw_prefix) if is_data_file(o["key"])
+    ]
+    uris_by_version = {}
+    unversioned = []
+    for obj in read_files:
+        version = _tlc_version_for(obj["key"], tlc_version)
+        if version is None:
+            unversioned.append(obj["key"])
+        else:
+            uris_by_version.setdefault(version, []).append(store.uri(obj["key"]))
+    if unversioned:
+        raise Exception(f"No TLC schema version for {unversioned[:5]} (pass --tlc_version)")
+    if not uris_by_version:
+        raise Exception(f"No raw files under {raw_path}")
+    tlc_versions_read = {v: len(uris) for v, uris in sorted(uris_by_version.items())}
+    print(f"TLC SCHEMA VERSIONS: {tlc_versions_read}")
+    df = _read_tlc_registry(spark, uris_by_version)
+elif incremental:
+    # basePath keeps any partition columns encoded in the raw folder layout
+    df = (spark.read
+          .option("basePath", raw_path)
+          .parquet(*[store.uri(o["key"]) for o in pending_files]))
+else:
+    df = spark.read.parquet(raw_path)
 
 # ----------------------------
 # 2) Standardize / cast columns (keep IDs!)
 # ----------------------------
+perf.start("cast")
 # NYC TLC schema fields can vary slightly by month/version.
 # We'll only cast the ones that exist.
 casts = {
@@ -62,92 +686,124 @@ casts = {
     "cbd_congestion_fee": T.DoubleType(),
 }
 
-for col, typ in casts.items():
-    if col in df.columns:
-        df = df.withColumn(col, F.col(col).cast(typ))
+# (registry reads are already in the canonical layout)
+if not schema_registry:
+    for col, typ in casts.items():
+        if col in df.columns:
+            df = df.withColumn(col, F.col(col).cast(typ))
 
-# timestamps (these usually exist)
-if "tpep_pickup_datetime" in df.columns:
-    df = df.withColumn("tpep_pickup_datetime", F.to_timestamp("tpep_pickup_datetime"))
-if "tpep_dropoff_datetime" in df.columns:
-    df = df.withColumn("tpep_dropoff_datetime", F.to_timestamp("tpep_dropoff_datetime"))
+    # timestamps (these usually exist)
+    if "tpep_pickup_datetime" in df.columns:
+        df = df.withColumn("tpep_pickup_datetime", F.to_timestamp("tpep_pickup_datetime"))
+    if "tpep_dropoff_datetime" in df.columns:
+        df = df.withColumn("tpep_dropoff_datetime", F.to_timestamp("tpep_dropoff_datetime"))
 
 # ----------------------------
-# 3) Null/validity checks (minimal, practical)
+# 3) Null/validity checks (rule registry -> one int bitmask per row)
 # ----------------------------
-required_cols = []
-for c in ["PULocationID", "DOLocationID", "tpep_pickup_datetime", "tpep_dropoff_datetime", "trip_distance", "total_amount"]:
-    if c in df.columns:
-        required_cols.append(c)
-
-# Build "bad_reason" string (collect reasons)
-bad_reason = F.lit("")
+perf.start("validate")
+# a registry read of a single vintage enables that vintage's rules
+rules_version = tlc_version or (next(iter(tlc_versions_read)) if tlc_versions_read and len(tlc_versions_read) == 1 else "")
+active_rules = rules_for(df.columns, rules_version)
+print("ACTIVE RULES:", [rule["name"] for _, rule in active_rules])
 
-def add_reason(cond, msg):
-    return F.when(cond, F.concat_ws("|", bad_reason, F.lit(msg))).otherwise(bad_reason)
+df2 = df.withColumn("bad_mask", compile_bad_mask(active_rules))
 
-# start with empty string
-bad_reason = F.lit("")
+if single_scan:
+    # Both outputs are served from this cache, so raw/trips/ is scanned and cast only once
+    df2 = df2.persist(StorageLevel.MEMORY_AND_DISK)
 
-# Required null checks
-if "PULocationID" in df.columns:
-    bad_reason = F.when(F.col("PULocationID").isNull(), F.concat_ws("|", bad_reason, F.lit("PULocationID_NULL"))).otherwise(bad_reason)
-if "DOLocationID" in df.columns:
-    bad_reason = F.when(F.col("DOLocationID").isNull(), F.concat_ws("|", bad_reason, F.lit("DOLocationID_NULL"))).otherwise(bad_reason)
+# Row counts and per-rule hit counts are observed during the writes themselves
+ingested_at = datetime.now(timezone.utc).isoformat()
+good_df, bad_df, good_obs, bad_obs = _observed_outputs(df2, active_rules, run_id, ingested_at)
 
-if "tpep_pickup_datetime" in df.columns:
-    bad_reason = F.when(F.col("tpep_pickup_datetime").isNull(), F.concat_ws("|", bad_reason, F.lit("PICKUP_TS_NULL"))).otherwise(bad_reason)
-if "tpep_dropoff_datetime" in df.columns:
-    bad_reason = F.when(F.col("tpep_dropoff_datetime").isNull(), F.concat_ws("|", bad_reason, F.lit("DROPOFF_TS_NULL"))).otherwise(bad_reason)
+# ----------------------------
+# 4) Write outputs
+# ----------------------------
+perf.start("write")
+# a compaction manifest (glue_compact_trips.py) of an earlier attempt of this run is stale now
+store.delete_keys([f"{validated_prefix}run_id={run_id}/_MANIFEST.json"])
+_write_outputs(good_df, bad_df, validated_out, quarantine_out, partition_layout, quarantine_layout)
 
-# Basic sanity checks
-if "trip_distance" in df.columns:
-    bad_reason = F.when(F.col("trip_distance").isNull(), F.concat_ws("|", bad_reason, F.lit("TRIP_DISTANCE_NULL"))) \
-                  .when(F.col("trip_distance") < 0, F.concat_ws("|", bad_reason, F.lit("TRIP_DISTANCE_NEG"))) \
-                  .otherwise(bad_reason)
+perf.start("metrics")
+good_rows = good_obs.get["rows"]
+bad_metrics = bad_obs.get
+bad_rows = bad_metrics["rows"]
+rule_hits = {rule["name"]: int(bad_metrics[rule["name"]] or 0) for _, rule in active_rules}
 
-if "total_amount" in df.columns:
-    bad_reason = F.when(F.col("total_amount").isNull(), F.concat_ws("|", bad_reason, F.lit("TOTAL_AMOUNT_NULL"))) \
-                  .otherwise(bad_reason)
+if single_scan:
+    df2.unpersist()
 
-# pickup <= dropoff
-if "tpep_pickup_datetime" in df.columns and "tpep_dropoff_datetime" in df.columns:
-    bad_reason = F.when(
-        F.col("tpep_pickup_datetime").isNotNull() &
-        F.col("tpep_dropoff_datetime").isNotNull() &
-        (F.col("tpep_dropoff_datetime") < F.col("tpep_pickup_datetime")),
-        F.concat_ws("|", bad_reason, F.lit("DROPOFF_BEFORE_PICKUP"))
-    ).otherwise(bad_reason)
+quarantine_summary = None
+if quarantine_layout == "reason":
+    perf.start("compact")
+    quarantine_summary = _finish_quarantine(spark, store, run_id, bad_rows, rule_hits, quarantine_compact_files)
+    perf.start("metrics")
 
-df2 = df.withColumn("bad_reason", F.regexp_replace(bad_reason, r"^\|+", ""))
+print(f"RAW PATH:        {raw_path}")
+print(f"VALIDATED OUT:   {validated_out}")
+print(f"QUARANTINE OUT:  {quarantine_out}")
+print(f"GOOD ROWS: {good_rows}")
+print(f"BAD ROWS:  {bad_rows}")
+print(f"RULE HITS: {rule_hits}")
 
-good_df = df2.filter(F.col("bad_reason") == "")
-bad_df  = df2.filter(F.col("bad_reason") != "")
+# ----------------------------
+# 4b) Publish _LATEST pointer (outputs are committed at this point)
+# ----------------------------
+latest_uri = _publish_latest_pointer(store, validated_prefix, {
+    "dataset": "trips_validated",
+    "run_id": run_id,
+    "bucket": bucket,
+    "prefix": f"{validated_prefix}run_id={run_id}/",
+    "path": validated_out,
+    "partition_layout": partition_layout,
+    "row_count": good_rows,
+    # true when the run holds only trips no earlier run has (downstream merges vs. rebuilds);
+    # the first incremental run (no checkpoint yet) and a run with changed files read every raw file
+    "incremental": incremental and bool(checkpoint["files"]) and not changed_files,
+    "committed_utc": datetime.now(timezone.utc).isoformat(),
+})
+print(f"LATEST POINTER: {latest_uri}")
 
-# Add governance-ish columns (handy later)
-ingested_at = datetime.now(timezone.utc).isoformat()
-good_df = good_df.withColumn("run_id", F.lit(run_id)).withColumn("ingested_at_utc", F.lit(ingested_at))
-bad_df  = bad_df.withColumn("run_id", F.lit(run_id)).withColumn("ingested_at_utc", F.lit(ingested_at))
+# ----------------------------
+# 4c) Advance checkpoint (only after both outputs are written)
+# ----------------------------
+if incremental:
+    checkpoint = advance_checkpoint(store, checkpoint_key, checkpoint, raw_prefix, raw_files, pending_files, run_id)
+    print(f"CHECKPOINT: {store.uri(checkpoint_key)} ({len(checkpoint['files'])} files)")
 
 # ----------------------------
-# 4) Write outputs
+# 5) Run metrics (optional) + stage timings / Spark task metrics
 # ----------------------------
-# Good rows → validated
-(good_df.drop("bad_reason")
- .write.mode("overwrite")
- .parquet(validated_out)
-)
+stage_metrics = perf.summary()
+print(f"STAGE METRICS: {json.dumps(stage_metrics)}")
 
-# Bad rows → quarantine (keep bad_reason)
-(bad_df
- .write.mode("overwrite")
- .parquet(quarantine_out)
-)
+if metrics_prefix:
+    metrics = {
+        "run_id": run_id,
+        "tlc_version": rules_version or None,
+        "tlc_versions_read": tlc_versions_read,
+        "partition_layout": partition_layout,
+        "validated_rows": good_rows,
+        "quarantine_rows": bad_rows,
+        "rule_hits": rule_hits,
+        "raw_read_path": raw_path,
+        "validated_write_path": validated_out,
+        "quarantine_write_path": quarantine_out,
+        "quarantine_layout": quarantine_layout,
+        "quarantine_by_reason": quarantine_summary["by_reason"] if quarantine_summary else None,
+        "quarantine_summary_path": quarantine_summary["summary_path"] if quarantine_summary else None,
+        "quarantine_compacted": quarantine_summary["compacted"] if quarantine_summary else None,
+        "raw_files_processed": len(pending_files) if incremental else None,
+        "raw_files_changed": len(changed_files) if incremental else None,
+        "stage_metrics": stage_metrics,
+        "generated_utc": datetime.now(timezone.utc).isoformat(),
+    }
+    print("Wrote metrics:", _write_validation_metrics_json(store, metrics_prefix, metrics))
 
-print(f"RAW PATH:        {raw_path}")
-print(f"VALIDATED OUT:   {validated_out}")
-print(f"QUARANTINE OUT:  {quarantine_out}")
-print(f"GOOD ROWS: {good_df.count()}")
-print(f"BAD ROWS:  {bad_df.count()}")
+# One batched PutMetricData per run (optional)
+namespace = args.get("GOV_METRICS_NAMESPACE", "")
+if namespace:
+    boto3.client("cloudwatch").put_metric_data(Namespace=namespace, MetricData=perf.metric_data())
 
 job.commit()
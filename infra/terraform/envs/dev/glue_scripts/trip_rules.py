@@ -0,0 +1,113 @@
+"""
+Validation rule registry of the raw-to-validated job.
+
+Each rule sets one bit of the bad_mask column (bit = position in VALIDATION_RULES,
+so only ever append new rules). Rows with a non-zero mask are quarantined with the
+first violated rule as reason_code and every violated rule in bad_reason.
+
+    active = rules_for(df.columns, tlc_version)
+    df = df.withColumn("bad_mask", compile_bad_mask(active))
+    bad = df.filter("bad_mask != 0").withColumn("reason_code", primary_reason(F.col("bad_mask"), active))
+
+Ship with --extra-py-files <s3 path>/trip_rules.py.
+"""
+from pyspark.sql import functions as F
+
+#   name      -> reason code written into bad_reason for quarantined rows
+#   columns   -> raw columns the predicate needs (the rule is skipped when one is missing)
+#   predicate -> builds the Column that is True when the row violates the rule
+#   versions  -> TLC schema versions (TLC_SCHEMA_VERSIONS keys of the job) the rule is
+#                enabled for; None = all
+VALIDATION_RULES = [
+    {
+        "name": "PULocationID_NULL",
+        "columns": ["PULocationID"],
+        "predicate": lambda: F.col("PULocationID").isNull(),
+        "versions": None,
+    },
+    {
+        "name": "DOLocationID_NULL",
+        "columns": ["DOLocationID"],
+        "predicate": lambda: F.col("DOLocationID").isNull(),
+        "versions": None,
+    },
+    {
+        "name": "PICKUP_TS_NULL",
+        "columns": ["tpep_pickup_datetime"],
+        "predicate": lambda: F.col("tpep_pickup_datetime").isNull(),
+        "versions": None,
+    },
+    {
+        "name": "DROPOFF_TS_NULL",
+        "columns": ["tpep_dropoff_datetime"],
+        "predicate": lambda: F.col("tpep_dropoff_datetime").isNull(),
+        "versions": None,
+    },
+    {
+        "name": "TRIP_DISTANCE_NULL",
+        "columns": ["trip_distance"],
+        "predicate": lambda: F.col("trip_distance").isNull(),
+        "versions": None,
+    },
+    {
+        "name": "TRIP_DISTANCE_NEG",
+        "columns": ["trip_distance"],
+        "predicate": lambda: F.col("trip_distance") < 0,
+        "versions": None,
+    },
+    {
+        "name": "TOTAL_AMOUNT_NULL",
+        "columns": ["total_amount"],
+        "predicate": lambda: F.col("total_amount").isNull(),
+        "versions": None,
+    },
+    {
+        "name": "DROPOFF_BEFORE_PICKUP",
+        "columns": ["tpep_pickup_datetime", "tpep_dropoff_datetime"],
+        "predicate": lambda: F.col("tpep_dropoff_datetime") < F.col("tpep_pickup_datetime"),
+        "versions": None,
+    },
+]
+
+
+def rules_for(columns, tlc_version: str = ""):
+    """
+    Returns [(bit, rule)] for the rules that apply to this dataset.
+    Without a tlc_version every rule whose columns exist is applied.
+    """
+    active = []
+    for pos, rule in enumerate(VALIDATION_RULES):
+        if tlc_version and rule["versions"] is not None and tlc_version not in rule["versions"]:
+            continue
+        if any(c not in columns for c in rule["columns"]):
+            continue
+        active.append((1 << pos, rule))
+    return active
+
+
+def compile_bad_mask(active):
+    # NULL predicate results count as "not violated" (same as the old when/otherwise chain)
+    mask = F.lit(0)
+    for bit, rule in active:
+        mask = mask.bitwiseOR(F.when(rule["predicate"](), F.lit(bit)).otherwise(F.lit(0)))
+    return mask
+
+
+def primary_reason(mask, active):
+    # first violated rule in registry order (NULL when no rule is active)
+    if not active:
+        return F.lit(None).cast("string")
+    return F.coalesce(*[
+        F.when(mask.bitwiseAND(F.lit(bit)) != 0, F.lit(rule["name"]))
+        for bit, rule in active
+    ])
+
+
+def decode_bad_reason(mask, active):
+    # concat_ws skips NULLs, so only the violated rules end up in the string
+    if not active:
+        return F.lit("")
+    return F.concat_ws("|", *[
+        F.when(mask.bitwiseAND(F.lit(bit)) != 0, F.lit(rule["name"]))
+        for bit, rule in active
+    ])
@@ -43,10 +43,27 @@ data "aws_iam_policy_document" "glue_policy" {
         # CURATED
         "${var.curated_trips_prefix}",
         "${var.curated_trips_prefix}*",
+        "${var.rollup_prefix}",
+        "${var.rollup_prefix}*",
+        "${var.fact_prefix}",
+        "${var.fact_prefix}*",
+
+        # COMPACTED RUN FILES (siblings of the trip prefixes, see glue_compact_trips.py)
+        "${trimsuffix(var.validated_trips_prefix, "/")}_compacted/*",
+        "${trimsuffix(var.curated_trips_prefix, "/")}_compacted/*",
+        "${trimsuffix(var.fact_prefix, "/")}_compacted/*",
+
+        # DIMENSION KEY MAPS (Redshift UNLOAD)
+        "${var.dim_keys_prefix}",
+        "${var.dim_keys_prefix}*",
 
         # MASTER SNAPSHOT
         "${var.snapshot_prefix}",
         "${var.snapshot_prefix}*",
+        "${var.vendor_snapshot_prefix}",
+        "${var.vendor_snapshot_prefix}*",
+        "${var.ratecode_snapshot_prefix}",
+        "${var.ratecode_snapshot_prefix}*",
 
         # METRICS
         "${var.metrics_prefix}",
@@ -56,6 +73,10 @@ data "aws_iam_policy_document" "glue_policy" {
         "${var.quarantine_prefix}",
         "${var.quarantine_prefix}*",
 
+        # CHECKPOINTS
+        "${var.checkpoint_prefix}",
+        "${var.checkpoint_prefix}*",
+
         # SCRIPTS
         "${local.glue_scripts_prefix}",
         "${local.glue_scripts_prefix}*",
@@ -85,9 +106,18 @@ data "aws_iam_policy_document" "glue_policy" {
       "arn:aws:s3:::${var.bucket_name}/${var.raw_trips_prefix}*",
       "arn:aws:s3:::${var.bucket_name}/${var.validated_trips_prefix}*",
       "arn:aws:s3:::${var.bucket_name}/${var.curated_trips_prefix}*",
+      "arn:aws:s3:::${var.bucket_name}/${var.rollup_prefix}*",
+      "arn:aws:s3:::${var.bucket_name}/${var.fact_prefix}*",
+      "arn:aws:s3:::${var.bucket_name}/${trimsuffix(var.validated_trips_prefix, "/")}_compacted/*",
+      "arn:aws:s3:::${var.bucket_name}/${trimsuffix(var.curated_trips_prefix, "/")}_compacted/*",
+      "arn:aws:s3:::${var.bucket_name}/${trimsuffix(var.fact_prefix, "/")}_compacted/*",
+      "arn:aws:s3:::${var.bucket_name}/${var.dim_keys_prefix}*",
       "arn:aws:s3:::${var.bucket_name}/${var.snapshot_prefix}*",
+      "arn:aws:s3:::${var.bucket_name}/${var.vendor_snapshot_prefix}*",
+      "arn:aws:s3:::${var.bucket_name}/${var.ratecode_snapshot_prefix}*",
       "arn:aws:s3:::${var.bucket_name}/${var.metrics_prefix}*",
       "arn:aws:s3:::${var.bucket_name}/${var.quarantine_prefix}*",
+      "arn:aws:s3:::${var.bucket_name}/${var.checkpoint_prefix}*",
       "arn:aws:s3:::${var.bucket_name}/${local.glue_scripts_prefix}*",
       "arn:aws:s3:::${var.bucket_name}/glue-temp/*"
     ]
@@ -103,6 +133,21 @@ data "aws_iam_policy_document" "glue_policy" {
     resources = ["*"]
   }
 
+  # ----------------------------
+  # Glue Catalog partitions (compaction re-points them at the compacted files)
+  # ----------------------------
+  statement {
+    sid    = "GlueCatalogPartitions"
+    effect = "Allow"
+    actions = [
+      "glue:GetTable",
+      "glue:GetPartition",
+      "glue:CreatePartition",
+      "glue:UpdatePartition"
+    ]
+    resources = ["*"]
+  }
+
   # ----------------------------
   # Governance metrics
   # ----------------------------
@@ -11,3 +11,42 @@ resource "aws_s3_object" "glue_job_2" {
   source = "${path.module}/glue_scripts/glue_enrich_to_curated.py"
   etag   = filemd5("${path.module}/glue_scripts/glue_enrich_to_curated.py")
 }
+
+# Shared stage timing / Spark task metrics module (--extra-py-files of both jobs)
+resource "aws_s3_object" "glue_stage_metrics" {
+  bucket = var.bucket_name
+  key    = "${local.glue_scripts_prefix}stage_metrics.py"
+  source = "${path.module}/glue_scripts/stage_metrics.py"
+  etag   = filemd5("${path.module}/glue_scripts/stage_metrics.py")
+}
+
+# Validation rule registry (--extra-py-files of the raw-to-validated job)
+resource "aws_s3_object" "glue_trip_rules" {
+  bucket = var.bucket_name
+  key    = "${local.glue_scripts_prefix}trip_rules.py"
+  source = "${path.module}/glue_scripts/trip_rules.py"
+  etag   = filemd5("${path.module}/glue_scripts/trip_rules.py")
+}
+
+# Shared object-store / checkpoint helpers (--extra-py-files of raw-to-validated, enrich and compaction)
+resource "aws_s3_object" "glue_lake_io" {
+  bucket = var.bucket_name
+  key    = "${local.glue_scripts_prefix}lake_io.py"
+  source = "${path.module}/glue_scripts/lake_io.py"
+  etag   = filemd5("${path.module}/glue_scripts/lake_io.py")
+}
+
+# BI rollup merge / rebuild / retention (--extra-py-files of the enrich-to-curated job)
+resource "aws_s3_object" "glue_trip_rollup" {
+  bucket = var.bucket_name
+  key    = "${local.glue_scripts_prefix}trip_rollup.py"
+  source = "${path.module}/glue_scripts/trip_rollup.py"
+  etag   = filemd5("${path.module}/glue_scripts/trip_rollup.py")
+}
+
+resource "aws_s3_object" "glue_job_compact" {
+  bucket = var.bucket_name
+  key    = "${local.glue_scripts_prefix}glue_compact_trips.py"
+  source = "${path.module}/glue_scripts/glue_compact_trips.py"
+  etag   = filemd5("${path.module}/glue_scripts/glue_compact_trips.py")
+}
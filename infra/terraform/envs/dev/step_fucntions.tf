@@ -40,10 +40,13 @@ resource "aws_sfn_state_machine" "pipeline" {
 
         Arguments = {
           FunctionName = aws_lambda_function.freshness.arn
+          # last_snapshot_id (optional input): newest snapshot id known to the caller; bounds
+          # the listing fallback used when the snapshot prefix has no _LATEST.json pointer
           Payload = {
-            bucket          = "{% $states.input.bucket %}"
-            snapshot_prefix = "{% $states.input.snapshot_prefix %}"
-            max_age_hours   = "{% $states.input.max_age_hours %}"
+            bucket           = "{% $states.input.bucket %}"
+            snapshot_prefix  = "{% $states.input.snapshot_prefix %}"
+            max_age_hours    = "{% $states.input.max_age_hours %}"
+            last_snapshot_id = "{% $exists($states.input.last_snapshot_id) ? $states.input.last_snapshot_id : '' %}"
           }
         }
 
@@ -91,7 +94,7 @@ resource "aws_sfn_state_machine" "pipeline" {
         Arguments = {
           TopicArn = aws_sns_topic.alerts.arn
           Subject  = "Master data snapshot stale - approval required"
-          Message  = "{% 'Master snapshot is STALE. Approval required to proceed.\\n\\n' & 'RunId: ' & $states.context.Execution.Name & '\\n' & 'LastModified: ' & $states.input.freshness.lastModified & '\\n' & 'AgeHours: ' & $string($states.input.freshness.ageHours) & ' (max ' & $string($states.input.freshness.maxAgeHours) & ')\\n' & 'SnapshotPrefix: ' & $states.input.snapshot_prefix %}"
+          Message  = "{% 'Master snapshot is STALE (or its age is unknown). Approval required to proceed.\\n\\n' & ($exists($states.input.freshness.reason) ? 'Reason: ' & $states.input.freshness.reason & '\\n' : '') & 'RunId: ' & $states.context.Execution.Name & '\\n' & 'SnapshotId: ' & $string($states.input.freshness.snapshotId) & '\\n' & 'LastModified: ' & $states.input.freshness.lastModified & '\\n' & 'AgeHours: ' & $string($states.input.freshness.ageHours) & ' (max ' & $string($states.input.freshness.maxAgeHours) & ')\\n' & 'SnapshotPrefix: ' & $states.input.snapshot_prefix %}"
         }
 
         Output = "{% $states.input %}"
@@ -138,6 +141,7 @@ resource "aws_sfn_state_machine" "pipeline" {
             "--bucket"                 = "{% $states.input.bucket %}"
             "--raw_trips_prefix"       = "{% $states.input.raw_trips_prefix %}"
             "--validated_trips_prefix" = "{% $states.input.validated_prefix %}"
+            "--metrics_prefix"         = "{% $states.input.metrics_prefix %}"
             "--run_id"                 = "{% $states.context.Execution.Name %}"
           }
         }
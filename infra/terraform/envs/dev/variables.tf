@@ -19,6 +19,18 @@ variable "snapshot_prefix" {
   default = "validated/master_snapshot/"
 }
 
+# vendor / ratecode golden snapshots: the enrich job reads them only on runs that pass
+# --vendor_snapshot_prefix / --ratecode_snapshot_prefix (no deployed job publishes them)
+variable "vendor_snapshot_prefix" {
+  type    = string
+  default = "validated/vendor_snapshot/"
+}
+
+variable "ratecode_snapshot_prefix" {
+  type    = string
+  default = "validated/ratecode_snapshot/"
+}
+
 variable "raw_trips_prefix" {
   type    = string
   default = "raw/trips/"
@@ -39,6 +51,12 @@ variable "metrics_prefix" {
   default = "audit/metrics/"
 }
 
+variable "checkpoint_prefix" {
+  type        = string
+  description = "S3 prefix for incremental-ingestion checkpoint manifests"
+  default     = "manifests/checkpoints/"
+}
+
 variable "max_age_hours" {
   type    = number
   default = 24
@@ -70,3 +88,21 @@ variable "quarantine_prefix" {
   description = "S3 prefix for quarantined (bad) rows written by Glue job 1"
   default     = "validated/quarantine/"
 }
+
+variable "rollup_prefix" {
+  type        = string
+  description = "S3 prefix of the BI trip rollup merged by Glue job 2 (versions, per-run deltas, _LATEST.json)"
+  default     = "curated/rollups/trip_daily/"
+}
+
+variable "fact_prefix" {
+  type        = string
+  description = "S3 prefix of the load-ready final_fact.trip_fact rows (surrogate keys resolved) written by Glue job 2"
+  default     = "curated/trip_fact/"
+}
+
+variable "dim_keys_prefix" {
+  type        = string
+  description = "S3 prefix of the dimension key maps unloaded by sql/redshift/16_fact_key_maps.sql"
+  default     = "exports/dim_keys/"
+}
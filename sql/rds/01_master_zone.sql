@@ -5,6 +5,8 @@
 --  3) mdm_zone_golden_v2  : SCD2 golden records
 --  Procedure:
 --    sp_publish_zone_golden_v2(p_batch_id TEXT)
+--  Function:
+--    fn_publish_zone_golden_batches_v2(p_batch_ids TEXT[])
 --  View:
 --    v_mdm_zone_golden_current_v2
 -- ============================================================
@@ -25,12 +27,19 @@ CREATE TABLE IF NOT EXISTS mdm_zone_record_v2 (
   status         TEXT        NOT NULL CHECK (status IN ('APPROVED','PENDING','REJECTED')),
   source_file    TEXT,
 
+  -- md5(borough|zone|service_zone), computed at ingest (mdm_zones_ingest_final.py)
+  record_hash    TEXT,
+
   created_at     TIMESTAMPTZ NOT NULL DEFAULT now(),
   updated_at     TIMESTAMPTZ NOT NULL DEFAULT now(),
 
   PRIMARY KEY (batch_id, location_id)
 );
 
+-- Existing deployments: rows ingested before the column existed keep NULL
+-- and are hashed on the fly by the publish function.
+ALTER TABLE mdm_zone_record_v2 ADD COLUMN IF NOT EXISTS record_hash TEXT;
+
 CREATE INDEX IF NOT EXISTS ix_mdm_zone_record_v2_status
   ON mdm_zone_record_v2 (status);
 
@@ -40,6 +49,9 @@ CREATE INDEX IF NOT EXISTS ix_mdm_zone_record_v2_batch
 CREATE INDEX IF NOT EXISTS ix_mdm_zone_record_v2_location
   ON mdm_zone_record_v2 (location_id);
 
+CREATE INDEX IF NOT EXISTS ix_mdm_zone_record_v2_location_hash
+  ON mdm_zone_record_v2 (location_id, record_hash);
+
 
 -- ----------------------------
 -- 2) Match table (pairs + score + target + zone names)
@@ -74,6 +86,46 @@ CREATE INDEX IF NOT EXISTS ix_mdm_zone_match_v2_action
   ON mdm_zone_match_v2 (action);
 
 
+-- ----------------------------
+-- 2b) Staging tables for the COPY bulk writer (src/glue/pg_bulk.py)
+--     Rows are COPY'd per Spark partition (part_id), then merged into the
+--     target per batch_id in one transaction and removed from staging.
+-- ----------------------------
+CREATE UNLOGGED TABLE IF NOT EXISTS mdm_zone_record_v2_stage (
+  part_id        INT         NOT NULL,
+  batch_id       TEXT        NOT NULL,
+  location_id    INT,
+  borough        TEXT,
+  zone           TEXT,
+  service_zone   TEXT,
+  status         TEXT,
+  source_file    TEXT,
+  record_hash    TEXT
+);
+
+ALTER TABLE mdm_zone_record_v2_stage ADD COLUMN IF NOT EXISTS record_hash TEXT;
+
+CREATE INDEX IF NOT EXISTS ix_mdm_zone_record_v2_stage_batch
+  ON mdm_zone_record_v2_stage (batch_id, part_id);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS mdm_zone_match_v2_stage (
+  part_id               INT         NOT NULL,
+  batch_id              TEXT        NOT NULL,
+  location_id_1         INT,
+  location_id_2         INT,
+  borough               TEXT,
+  zone_1                TEXT,
+  zone_2                TEXT,
+  score                 INT,
+  confidence_tier       TEXT,
+  action                TEXT,
+  recommended_golden_id INT
+);
+
+CREATE INDEX IF NOT EXISTS ix_mdm_zone_match_v2_stage_batch
+  ON mdm_zone_match_v2_stage (batch_id, part_id);
+
+
 -- ----------------------------
 -- 3) Golden table (SCD2)
 -- ----------------------------
@@ -106,34 +158,73 @@ CREATE INDEX IF NOT EXISTS ix_mdm_zone_golden_v2_location
 CREATE INDEX IF NOT EXISTS ix_mdm_zone_golden_v2_batch
   ON mdm_zone_golden_v2 (source_batch_id);
 
+-- Delta snapshots read rows created/expired after a watermark
+CREATE INDEX IF NOT EXISTS ix_mdm_zone_golden_v2_created
+  ON mdm_zone_golden_v2 (created_at);
+
+CREATE INDEX IF NOT EXISTS ix_mdm_zone_golden_v2_expired
+  ON mdm_zone_golden_v2 (effective_to);
+
 
 -- ============================================================
--- Procedure: publish APPROVED records from mdm_zone_record_v2 into mdm_zone_golden_v2 (SCD2)
--- Idempotent per batch: re-running will not duplicate identical current records.
+-- Function: publish APPROVED records of many batches into mdm_zone_golden_v2 (SCD2)
+-- One set-based pass, batches applied in array order:
+--   - per LocationID, consecutive versions with the same record_hash collapse, so
+--     rows identical to the current golden (or to the previous batch) are untouched
+--   - the current golden row is expired once, intermediate versions are inserted
+--     already expired and only the last changed version stays current
+-- Returns one row per input batch: golden rows inserted / expired by that batch.
 -- ============================================================
-CREATE OR REPLACE PROCEDURE sp_publish_zone_golden_v2(p_batch_id TEXT)
+CREATE OR REPLACE FUNCTION fn_publish_zone_golden_batches_v2(p_batch_ids TEXT[])
+RETURNS TABLE (batch_id TEXT, inserted INT, expired INT)
 LANGUAGE plpgsql
 AS $$
+#variable_conflict use_column
 BEGIN
-  -- Expire current golden rows if incoming approved differs (hash mismatch)
+  DROP TABLE IF EXISTS tmp_zone_golden_publish;
+
+  CREATE TEMP TABLE tmp_zone_golden_publish ON COMMIT DROP AS
+  WITH batches AS (
+    SELECT b.batch_id, b.ord
+    FROM unnest(p_batch_ids) WITH ORDINALITY AS b(batch_id, ord)
+  ),
+  incoming AS (
+    SELECT
+      r.location_id, r.borough, r.zone, r.service_zone,
+      coalesce(r.record_hash,
+               md5(coalesce(r.borough,'') || '|' || coalesce(r.zone,'') || '|' || coalesce(r.service_zone,''))) AS record_hash,
+      b.batch_id,
+      b.ord,
+      g.golden_sk   AS current_sk,
+      g.record_hash AS current_hash
+    FROM batches b
+    JOIN mdm_zone_record_v2 r
+      ON r.batch_id = b.batch_id AND r.status = 'APPROVED'
+    LEFT JOIN mdm_zone_golden_v2 g
+      ON g.location_id = r.location_id AND g.is_current = TRUE
+  ),
+  versions AS (
+    SELECT
+      i.*,
+      coalesce(lag(i.record_hash) OVER (PARTITION BY i.location_id ORDER BY i.ord), i.current_hash) AS prev_hash
+    FROM incoming i
+  )
+  SELECT
+    v.location_id, v.borough, v.zone, v.service_zone, v.record_hash, v.batch_id, v.ord, v.current_sk,
+    row_number() OVER (PARTITION BY v.location_id ORDER BY v.ord)      = 1 AS is_first,
+    row_number() OVER (PARTITION BY v.location_id ORDER BY v.ord DESC) = 1 AS is_last
+  FROM versions v
+  WHERE v.record_hash IS DISTINCT FROM v.prev_hash;
+
+  -- Expire current golden rows replaced in this pass
   UPDATE mdm_zone_golden_v2 g
   SET effective_to = now(),
       is_current = FALSE
-  FROM (
-    SELECT
-      r.location_id,
-      md5(coalesce(r.borough,'') || '|' || coalesce(r.zone,'') || '|' || coalesce(r.service_zone,'')) AS new_hash
-    FROM mdm_zone_record_v2 r
-    WHERE r.batch_id = p_batch_id
-      AND r.status = 'APPROVED'
-  ) incoming
-  WHERE g.location_id = incoming.location_id
-    AND g.is_current = TRUE
-    AND g.record_hash <> incoming.new_hash;
-
-  -- Insert new current golden rows for:
-  -- - new LocationIDs (no current row)
-  -- - changed LocationIDs (hash differs from current)
+  FROM tmp_zone_golden_publish t
+  WHERE t.is_first
+    AND g.golden_sk = t.current_sk;
+
+  -- Insert every changed version; only the last one per LocationID stays current
   INSERT INTO mdm_zone_golden_v2 (
     location_id, borough, zone, service_zone,
     record_hash,
@@ -141,25 +232,39 @@ BEGIN
     source_batch_id
   )
   SELECT
-    r.location_id,
-    r.borough,
-    r.zone,
-    r.service_zone,
-    md5(coalesce(r.borough,'') || '|' || coalesce(r.zone,'') || '|' || coalesce(r.service_zone,'')) AS record_hash,
+    t.location_id, t.borough, t.zone, t.service_zone,
+    t.record_hash,
     now(),
-    NULL,
-    TRUE,
-    p_batch_id
-  FROM mdm_zone_record_v2 r
-  LEFT JOIN mdm_zone_golden_v2 g
-    ON g.location_id = r.location_id AND g.is_current = TRUE
-  WHERE r.batch_id = p_batch_id
-    AND r.status = 'APPROVED'
-    AND (
-      g.location_id IS NULL OR
-      g.record_hash <> md5(coalesce(r.borough,'') || '|' || coalesce(r.zone,'') || '|' || coalesce(r.service_zone,''))
-    );
+    CASE WHEN t.is_last THEN NULL ELSE now() END,
+    t.is_last,
+    t.batch_id
+  FROM tmp_zone_golden_publish t
+  ORDER BY t.ord, t.location_id;
 
+  RETURN QUERY
+  SELECT
+    b.batch_id,
+    count(t.location_id)::INT,
+    (count(*) FILTER (WHERE NOT t.is_first OR t.current_sk IS NOT NULL))::INT
+  FROM unnest(p_batch_ids) WITH ORDINALITY AS b(batch_id, ord)
+  LEFT JOIN tmp_zone_golden_publish t ON t.ord = b.ord
+  GROUP BY b.batch_id, b.ord
+  ORDER BY b.ord;
+END;
+$$;
+-- Example call:
+-- SELECT * FROM fn_publish_zone_golden_batches_v2(ARRAY['batch_a', 'batch_b']);
+
+
+-- ============================================================
+-- Procedure: publish APPROVED records from mdm_zone_record_v2 into mdm_zone_golden_v2 (SCD2)
+-- Idempotent per batch: re-running will not duplicate identical current records.
+-- ============================================================
+CREATE OR REPLACE PROCEDURE sp_publish_zone_golden_v2(p_batch_id TEXT)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM fn_publish_zone_golden_batches_v2(ARRAY[p_batch_id]);
 END;
 $$;
 -- Example call:
@@ -99,6 +99,13 @@ CREATE INDEX IF NOT EXISTS ix_mdm_vendor_golden_v2_vendor
 CREATE INDEX IF NOT EXISTS ix_mdm_vendor_golden_v2_batch
   ON mdm_vendor_golden_v2 (source_batch_id);
 
+-- Delta snapshots read rows created/expired after a watermark
+CREATE INDEX IF NOT EXISTS ix_mdm_vendor_golden_v2_created
+  ON mdm_vendor_golden_v2 (created_at);
+
+CREATE INDEX IF NOT EXISTS ix_mdm_vendor_golden_v2_expired
+  ON mdm_vendor_golden_v2 (effective_to);
+
 
 -- ============================================================
 -- Procedure: publish APPROVED records into golden (SCD2)
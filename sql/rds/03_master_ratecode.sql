@@ -100,6 +100,13 @@ CREATE INDEX IF NOT EXISTS ix_mdm_rate_code_golden_v2_code
 CREATE INDEX IF NOT EXISTS ix_mdm_rate_code_golden_v2_batch
   ON mdm_rate_code_golden_v2 (source_batch_id);
 
+-- Delta snapshots read rows created/expired after a watermark
+CREATE INDEX IF NOT EXISTS ix_mdm_rate_code_golden_v2_created
+  ON mdm_rate_code_golden_v2 (created_at);
+
+CREATE INDEX IF NOT EXISTS ix_mdm_rate_code_golden_v2_expired
+  ON mdm_rate_code_golden_v2 (effective_to);
+
 -- recommended for audit/history lookups
 CREATE INDEX IF NOT EXISTS ix_mdm_rate_code_golden_v2_hist
   ON mdm_rate_code_golden_v2 (rate_code_id, effective_from DESC);
@@ -8,12 +8,17 @@
 -- Dependencies:
 --   - AWS Glue Data Catalog database: final_glue_db
 --   - Spectrum table: spectrum.finalrun_id_test_15
+--     (partitioned by run_id, plus the pickup date columns with the date layout:
+--      glue_compact_trips.py re-points a compacted run's partitions at its
+--      compacted files, so Spectrum never lists old and new files together)
 --   - final_dim.vendor_dim
 --   - final_dim.ratecode_dim
 --   - final_dim.payment_type_dim
 --   - final_dim.zone_dim
 -- Quality expectations:
 --   - Fact rows are appendable per run_id
+--     (full rebuild; per-run loads use src/glue/trip_fact_loader.py, see 14_fact_incremental.sql)
+--     (keys can also be resolved upstream by Glue Job 2, see 16_fact_key_maps.sql)
 --   - All joins are LEFT joins (no row loss)
 --   - Unknown dimension values handled via COALESCE
 -- Change Log:
@@ -48,6 +53,9 @@ INSERT INTO final_staging.trips_curated
 SELECT *
 FROM spectrum.finalrun_id_test_15;
 -- WHERE run_id = 'test-15';  -- optional slice control
+-- Date-partitioned curated layout (--partition_layout date): filtering on the
+-- partition columns makes Spectrum scan only the matching day folders, e.g.
+-- WHERE pickup_year = 2024 AND pickup_month = 1 AND pickup_day BETWEEN 1 AND 7;
 
 -- -----------------------------------------------------------------------------
 -- 2) Fact table in final_fact
@@ -10,6 +10,8 @@
 -- Quality expectations:
 --   - Each assertion writes exactly one row to final_dq.test_results
 --   - Thresholds are explicit and reviewable in code
+--     (one block and one scan per assertion; src/glue/dq_assertions.py evaluates the
+--     same tests in a single pass and records them with one INSERT)
 -- Change Log:
 --   - 2026-01-21: Initial version
 -- =============================================================================
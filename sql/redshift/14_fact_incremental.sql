@@ -0,0 +1,49 @@
+-- =============================================================================
+-- Author: Data Engineering Team
+-- Owner: Analytics Engineering
+-- Purpose:
+--   - Objects used by the incremental fact loader (src/glue/trip_fact_loader.py)
+--   - The per-run load log
+--   - No COPY staging table: COPY ... FORMAT AS PARQUET maps columns by position and
+--     the curated parquet layout varies (enrich engine, partition layout, TLC vintage),
+--     so the loader declares a TEMP table from the parquet footer of each run
+-- Dependencies:
+--   - 09_fact.sql (final_fact.trip_fact) run once
+-- Quality expectations:
+--   - Each load is DELETE + INSERT in one transaction (reruns replace):
+--     --scope run (default) replaces the run_id's rows, --scope full the whole fact
+--   - Every load appends exactly one row to final_fact.trip_fact_load_log
+-- Change Log:
+--   - 2026-10-17: Initial version
+-- =============================================================================
+
+BEGIN;
+
+-- -----------------------------------------------------------------------------
+-- 1) Load log: rows loaded and duration per run
+-- -----------------------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS final_fact.trip_fact_load_log (
+  run_id          VARCHAR(256),
+  source          VARCHAR(32),
+  layout          VARCHAR(16) DEFAULT 'curated',   -- curated | fact (16_fact_key_maps.sql)
+  source_path     VARCHAR(1024),
+  rows_loaded     BIGINT,
+  stage_seconds   DOUBLE PRECISION,
+  merge_seconds   DOUBLE PRECISION,
+  total_seconds   DOUBLE PRECISION,
+  loaded_at_utc   VARCHAR(64)
+)
+DISTSTYLE AUTO
+SORTKEY (loaded_at_utc);
+
+COMMIT;
+
+-- -----------------------------------------------------------------------------
+-- Per run (instead of re-running 09_fact.sql):
+--   python src/glue/trip_fact_loader.py --source copy --run_id <run_id> --scope run \
+--     --bucket <bucket> --host <cluster endpoint> --user <user> --database analytics
+-- --scope run (default) only when glue_raw_to_validated.py runs with --incremental true;
+-- otherwise every run holds the whole history: pass --scope full.
+-- --source spectrum reads the run straight from a Spectrum table partitioned by run:
+--   --spectrum_table spectrum.trips_curated --spectrum_run_column run_id
+-- -----------------------------------------------------------------------------
@@ -0,0 +1,124 @@
+-- =============================================================================
+-- Author: Analytics Engineering
+-- Owner: Analytics
+-- Purpose:
+--   - Rollup table for BI: pickup date x pickup zone x vendor x ratecode x payment type
+--   - Rollup versions of the 10_analytical_queries.sql queries
+--   - Reconciliation of the rollup against final_fact.trip_fact
+-- Dependencies:
+--   - curated/rollups/trip_daily/ written by Glue Job 2 (--rollup_prefix)
+--   - final_fact.trip_fact, final_dim.* (for names and reconciliation)
+-- Quality expectations:
+--   - trips and DECIMAL sums match the fact exactly for the same set of runs
+--   - The table is reloaded from the version named in _LATEST.json (small: one row per key)
+--   - Every version is complete (merged per incremental run, rebuilt from a full run), and
+--     only the newest few are kept, so always reload from the current pointer
+-- Change Log:
+--   - 2026-10-17: Initial version
+-- =============================================================================
+
+BEGIN;
+
+-- -----------------------------------------------------------------------------
+-- 1) Rollup table (column order = parquet column order, required by COPY)
+-- -----------------------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS final_fact.trip_rollup_daily (
+  trip_date                DATE,
+  pulocationid             INTEGER,
+  vendorid                 INTEGER,
+  ratecodeid               INTEGER,       -- unknown -> 99, as in the fact load
+  payment_type             INTEGER,       -- unknown -> 5, as in the fact load
+  trips                    BIGINT,
+  total_amount_count       BIGINT,        -- non-null total_amount rows (for averages)
+  negative_duration_trips  BIGINT,
+  total_amount_sum         DECIMAL(38,2),
+  fare_amount_sum          DECIMAL(38,2),
+  trip_distance_sum        DECIMAL(38,2)
+)
+DISTSTYLE ALL
+SORTKEY (trip_date);
+
+-- -----------------------------------------------------------------------------
+-- 2) Reload from the current version (path = "path" of curated/rollups/trip_daily/_LATEST.json)
+-- -----------------------------------------------------------------------------
+TRUNCATE TABLE final_fact.trip_rollup_daily;
+
+COPY final_fact.trip_rollup_daily
+FROM 's3://<bucket>/curated/rollups/trip_daily/version=<version>/'
+IAM_ROLE default
+FORMAT AS PARQUET;
+
+COMMIT;
+
+
+-- -----------------------------------------------------------------------------
+-- 3) Analytical queries on the rollup (same results as 10_analytical_queries.sql)
+-- -----------------------------------------------------------------------------
+-- 1. Daily trips & revenue trend
+SELECT trip_date, SUM(trips) AS trips, SUM(total_amount_sum) AS total_revenue
+FROM final_fact.trip_rollup_daily
+GROUP BY 1
+ORDER BY 1;
+
+-- 2. Top pickup zones by trip count
+SELECT z.zone, z.borough, SUM(r.trips) AS trips
+FROM final_fact.trip_rollup_daily r
+JOIN final_dim.zone_dim z
+  ON z.location_id = r.pulocationid
+GROUP BY 1,2
+ORDER BY trips DESC
+LIMIT 10;
+
+-- 3. Revenue by vendor
+SELECT v.vendor_name, SUM(r.trips) AS trips, SUM(r.total_amount_sum) AS revenue
+FROM final_fact.trip_rollup_daily r
+JOIN final_dim.vendor_dim v
+  ON v.vendor_id = r.vendorid
+GROUP BY 1
+ORDER BY revenue DESC;
+
+-- 4. Average fare by ratecode
+SELECT rc.rate_code_name, SUM(r.total_amount_sum) / NULLIF(SUM(r.total_amount_count), 0) AS avg_fare
+FROM final_fact.trip_rollup_daily r
+JOIN final_dim.ratecode_dim rc
+  ON rc.rate_code_id = r.ratecodeid
+GROUP BY 1
+ORDER BY avg_fare DESC;
+
+-- 5. Payment type distribution
+SELECT p.payment_type_name, SUM(r.trips) AS trips
+FROM final_fact.trip_rollup_daily r
+JOIN final_dim.payment_type_dim p
+  ON p.payment_type_id = r.payment_type
+GROUP BY 1
+ORDER BY trips DESC;
+
+-- 6. Trip duration sanity check
+SELECT SUM(negative_duration_trips) AS negative_duration_trips
+FROM final_fact.trip_rollup_daily;
+
+
+-- -----------------------------------------------------------------------------
+-- 4) Reconciliation: rollup vs fact per date (expect no rows)
+-- -----------------------------------------------------------------------------
+WITH f AS (
+  SELECT DATE(pickup_datetime) AS trip_date,
+         COUNT(*) AS trips,
+         SUM(CAST(total_amount AS DECIMAL(38,2))) AS total_amount_sum
+  FROM final_fact.trip_fact
+  GROUP BY 1
+),
+r AS (
+  SELECT trip_date, SUM(trips) AS trips, SUM(total_amount_sum) AS total_amount_sum
+  FROM final_fact.trip_rollup_daily
+  GROUP BY 1
+)
+SELECT COALESCE(f.trip_date, r.trip_date) AS trip_date,
+       f.trips AS fact_trips, r.trips AS rollup_trips,
+       f.total_amount_sum AS fact_revenue, r.total_amount_sum AS rollup_revenue
+FROM f
+FULL OUTER JOIN r
+  ON f.trip_date = r.trip_date
+  OR (f.trip_date IS NULL AND r.trip_date IS NULL)
+WHERE COALESCE(f.trips, -1) <> COALESCE(r.trips, -1)
+   OR COALESCE(f.total_amount_sum, -1) <> COALESCE(r.total_amount_sum, -1);
@@ -0,0 +1,102 @@
+-- =============================================================================
+-- Author: Data Engineering Team
+-- Owner: Analytics Engineering
+-- Purpose:
+--   - Export the dimension key maps (natural id -> surrogate key) for Glue Job 2
+--   - Staging table for the load-ready fact rows (keys resolved in Spark)
+-- Dependencies:
+--   - 05_payment_dim.sql, 06_zone_dim.sql, 07_vendor_dim.sql, 08_ratecode_dim.sql
+--   - 14_fact_incremental.sql (final_fact.trip_fact_load_log, including its layout column)
+--   - Glue Job 2 run with --fact_prefix curated/trip_fact/ --dim_keys_prefix exports/dim_keys/
+-- Quality expectations:
+--   - Key maps are re-exported after every dimension rebuild, before the next Job 2 run
+--     (a key missing from a map stays NULL in the fact, as with the 09_fact.sql LEFT JOINs)
+--   - Fact-layout loads run no joins: COPY + INSERT ... SELECT of the staged columns
+-- Change Log:
+--   - 2026-10-17: Initial version
+-- =============================================================================
+
+-- -----------------------------------------------------------------------------
+-- 1) Dimension key maps -> s3://<bucket>/exports/dim_keys/<dimension>/
+--    Two columns each; Job 2 compiles them into in-memory lookups (no Spark join).
+--    Unknown members (ratecode 99, payment type 5) are ordinary rows of the maps.
+-- -----------------------------------------------------------------------------
+UNLOAD ('SELECT vendor_id, vendor_sk FROM final_dim.vendor_dim')
+TO 's3://<bucket>/exports/dim_keys/vendor_dim/'
+IAM_ROLE default
+FORMAT AS PARQUET
+ALLOWOVERWRITE;
+
+UNLOAD ('SELECT rate_code_id, ratecode_sk FROM final_dim.ratecode_dim')
+TO 's3://<bucket>/exports/dim_keys/ratecode_dim/'
+IAM_ROLE default
+FORMAT AS PARQUET
+ALLOWOVERWRITE;
+
+UNLOAD ('SELECT payment_type_id, payment_type_sk FROM final_dim.payment_type_dim')
+TO 's3://<bucket>/exports/dim_keys/payment_type_dim/'
+IAM_ROLE default
+FORMAT AS PARQUET
+ALLOWOVERWRITE;
+
+UNLOAD ('SELECT location_id, zone_sk FROM final_dim.zone_dim')
+TO 's3://<bucket>/exports/dim_keys/zone_dim/'
+IAM_ROLE default
+FORMAT AS PARQUET
+ALLOWOVERWRITE;
+
+BEGIN;
+
+-- -----------------------------------------------------------------------------
+-- 2) COPY staging table for --layout fact
+--    Column order = parquet column order of curated/trip_fact/run_id=<id>/
+--    (final_fact.trip_fact without trip_fact_sk IDENTITY and created_at, which
+--    COPY cannot skip); rows are deleted per run_id after each load.
+-- -----------------------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS final_staging.trip_fact_run (
+  vendor_sk             BIGINT,
+  ratecode_sk           BIGINT,
+  payment_type_sk       BIGINT,
+  pickup_zone_sk        BIGINT,
+  dropoff_zone_sk       BIGINT,
+
+  pickup_datetime       TIMESTAMP,
+  dropoff_datetime      TIMESTAMP,
+
+  passenger_count       INTEGER,
+  trip_distance         DOUBLE PRECISION,
+
+  fare_amount           DOUBLE PRECISION,
+  extra                 DOUBLE PRECISION,
+  mta_tax               DOUBLE PRECISION,
+  tip_amount            DOUBLE PRECISION,
+  tolls_amount          DOUBLE PRECISION,
+  improvement_surcharge DOUBLE PRECISION,
+  total_amount          DOUBLE PRECISION,
+  congestion_surcharge  DOUBLE PRECISION,
+  airport_fee           DOUBLE PRECISION,
+  cbd_congestion_fee    DOUBLE PRECISION,
+
+  run_id                VARCHAR(256),
+  ingested_at_utc       VARCHAR(256)
+)
+DISTSTYLE AUTO;
+
+COMMIT;
+
+-- -----------------------------------------------------------------------------
+-- Per run, instead of the joins of 09_fact.sql / --layout curated:
+--   python src/glue/trip_fact_loader.py --layout fact --source copy --run_id <run_id> \
+--     --bucket <bucket> --host <cluster endpoint> --user <user> --database analytics
+-- --source spectrum reads a Glue Catalog table over curated/trip_fact/ partitioned
+-- by run_id (default spectrum.trip_fact_run).
+--
+-- Keys left unresolved by missing dimension members (per run, also in the "fact"
+-- section of the Job 2 metrics JSON):
+--   SELECT run_id,
+--          SUM(CASE WHEN vendor_sk IS NULL THEN 1 ELSE 0 END)       AS no_vendor,
+--          SUM(CASE WHEN pickup_zone_sk IS NULL THEN 1 ELSE 0 END)  AS no_pickup_zone,
+--          SUM(CASE WHEN dropoff_zone_sk IS NULL THEN 1 ELSE 0 END) AS no_dropoff_zone
+--   FROM final_fact.trip_fact
+--   GROUP BY run_id;
+-- -----------------------------------------------------------------------------
@@ -0,0 +1,263 @@
+"""
+Single-pass DQ assertions for final_fact.trip_fact and its curated parquet.
+
+The assertions are declared once in ASSERTIONS and evaluated together: every
+metric becomes one aggregate of a single SELECT over the table (or one scan of the
+parquet files), so adding an assertion adds an aggregate, not a scan. The results
+go to final_dq.test_results (11_dq_schema.sql) in one multi-row INSERT, all rows
+sharing one test_run_id. Same test names and thresholds as 13_dq_assertions.sql,
+which stays as the per-assertion SQL version.
+
+Sources (--source):
+  table     final_fact.trip_fact (--table), optionally only one --run_id
+  parquet   fact-layout parquet (glue_enrich_to_curated.py --fact_prefix), e.g.
+            curated/trip_fact/run_id=<id>/ as a local folder or s3:// URI, read through
+            its compaction _MANIFEST.json when present; only the columns the assertions
+            use are read. Other layouts (curated rows have no *_sk keys) are rejected:
+            check them after the load with --source table.
+
+Needs pg8000 (and pyarrow for --source parquet). tests/test_dq_assertions.py runs both
+sources against a local Postgres.
+"""
+import json
+import operator
+import os
+import uuid
+
+RESULTS_TABLE = "final_dq.test_results"
+
+# kind: row_count (rows), count_where (rows where `left op right`; a string right side is a
+# column, a number a literal; NULL comparisons do not count, as in SQL) or fill_rate (share
+# of rows where `column` is not NULL). A test passes when `metric check threshold`.
+ASSERTIONS = [
+    {"test": "row_count_gt_0", "kind": "row_count", "check": ">=", "threshold": 1,
+     "details": "Row count should be greater than 0"},
+    {"test": "negative_distance_count_eq_0", "kind": "count_where", "where": ("trip_distance", "<", 0),
+     "check": "<=", "threshold": 0, "details": "Trip distance must not be negative"},
+    {"test": "bad_time_order_count_eq_0", "kind": "count_where",
+     "where": ("dropoff_datetime", "<", "pickup_datetime"),
+     "check": "<=", "threshold": 0, "details": "Dropoff must not be earlier than pickup"},
+    {"test": "pickup_ts_fill_rate_ge_0_999", "kind": "fill_rate", "column": "pickup_datetime",
+     "check": ">=", "threshold": 0.999, "details": "pickup_datetime fill rate should be at least 0.999"},
+    {"test": "dropoff_ts_fill_rate_ge_0_999", "kind": "fill_rate", "column": "dropoff_datetime",
+     "check": ">=", "threshold": 0.999, "details": "dropoff_datetime fill rate should be at least 0.999"},
+    {"test": "total_amount_fill_rate_ge_0_999", "kind": "fill_rate", "column": "total_amount",
+     "check": ">=", "threshold": 0.999, "details": "total_amount fill rate should be at least 0.999"},
+    {"test": "vendor_fk_fill_rate_ge_0_995", "kind": "fill_rate", "column": "vendor_sk",
+     "check": ">=", "threshold": 0.995, "details": "vendor_sk should be present for at least 99.5% of rows"},
+    {"test": "ratecode_fk_fill_rate_ge_0_995", "kind": "fill_rate", "column": "ratecode_sk",
+     "check": ">=", "threshold": 0.995, "details": "ratecode_sk should be present for at least 99.5% of rows"},
+    {"test": "payment_fk_fill_rate_ge_0_995", "kind": "fill_rate", "column": "payment_type_sk",
+     "check": ">=", "threshold": 0.995, "details": "payment_type_sk should be present for at least 99.5% of rows"},
+    {"test": "pickup_zone_fk_fill_rate_ge_0_995", "kind": "fill_rate", "column": "pickup_zone_sk",
+     "check": ">=", "threshold": 0.995, "details": "pickup_zone_sk should be present for at least 99.5% of rows"},
+    {"test": "dropoff_zone_fk_fill_rate_ge_0_995", "kind": "fill_rate", "column": "dropoff_zone_sk",
+     "check": ">=", "threshold": 0.995, "details": "dropoff_zone_sk should be present for at least 99.5% of rows"},
+]
+
+_CHECKS = {">=": operator.ge, ">": operator.gt, "<=": operator.le, "<": operator.lt, "=": operator.eq}
+_COMPARE_SQL = {"<": "<", "<=": "<=", ">": ">", ">=": ">=", "=": "=", "!=": "<>"}
+_COMPARE_ARROW = {"<": "less", "<=": "less_equal", ">": "greater", ">=": "greater_equal",
+                  "=": "equal", "!=": "not_equal"}
+
+
+def _connect(params: dict):
+    import pg8000.dbapi
+
+    return pg8000.dbapi.connect(**params)
+
+
+def _columns(assertions) -> list:
+    """Columns the assertions read, in first-use order."""
+    cols = []
+    for a in assertions:
+        if a["kind"] == "fill_rate":
+            cols.append(a["column"])
+        elif a["kind"] == "count_where":
+            left, _, right = a["where"]
+            cols += [left] + ([right] if isinstance(right, str) else [])
+    return list(dict.fromkeys(cols))
+
+
+# ----------------------------
+# Metrics (one pass per source)
+# ----------------------------
+def _sql_metric(a: dict) -> str:
+    if a["kind"] == "row_count":
+        return "COUNT(*)"
+    if a["kind"] == "fill_rate":
+        return f"AVG(CASE WHEN {a['column']} IS NOT NULL THEN 1.0 ELSE 0.0 END)"
+    if a["kind"] == "count_where":
+        left, op, right = a["where"]
+        return f"COALESCE(SUM(CASE WHEN {left} {_COMPARE_SQL[op]} {right} THEN 1 ELSE 0 END), 0)"
+    raise Exception(f"Unsupported assertion kind '{a['kind']}' ({a['test']})")
+
+
+def table_metrics(cur, table: str, assertions, run_id: str = None) -> list:
+    """One SELECT with an aggregate per assertion; metric values in assertion order."""
+    sql = f"SELECT {', '.join(_sql_metric(a) for a in assertions)} FROM {table}"
+    if run_id:
+        cur.execute(f"{sql} WHERE run_id = %s", (run_id,))
+    else:
+        cur.execute(sql)
+    return list(cur.fetchone())
+
+
+def _parquet_dataset(path: str):
+    """The run's files: _MANIFEST.json entries of a compacted run folder, else the folder."""
+    import pyarrow.dataset as ds
+    from pyarrow import fs
+
+    filesystem, base = fs.FileSystem.from_uri(path if "://" in path else os.path.abspath(path))
+    manifest = f"{base.rstrip('/')}/_MANIFEST.json"
+    if filesystem.get_file_info(manifest).type == fs.FileType.NotFound:
+        return ds.dataset(path, format="parquet", partitioning="hive")
+    with filesystem.open_input_stream(manifest) as fh:
+        urls = [e["url"] for e in json.loads(fh.read().decode("utf-8"))["entries"]]
+    return ds.dataset([u.split("://", 1)[1] for u in urls], format="parquet", filesystem=filesystem)
+
+
+def parquet_metrics(path: str, assertions) -> list:
+    """
+    One scan of the parquet files under `path` (only the referenced columns), with the
+    per-assertion counters folded batch by batch; metric values in assertion order.
+    """
+    import pyarrow.compute as pc
+
+    dataset = _parquet_dataset(path)
+    by_lower = {name.lower(): name for name in dataset.schema.names}
+    cols = _columns(assertions)
+    missing = [c for c in cols if c not in by_lower]
+    if missing:
+        # a NULL fill would fail the key tests of every curated run, not report on it
+        raise Exception(f"{path} is not fact-layout parquet (missing columns {missing}); "
+                        "check curated runs after the load with --source table")
+    present = [by_lower[c] for c in cols]
+
+    rows = 0
+    counts = [0] * len(assertions)
+    for batch in dataset.to_batches(columns=present, batch_size=100000):
+        rows += batch.num_rows
+        col = {name.lower(): batch.column(name) for name in present}
+        for i, a in enumerate(assertions):
+            if a["kind"] == "fill_rate":
+                counts[i] += batch.num_rows - col[a["column"]].null_count
+            elif a["kind"] == "count_where":
+                left, op, right = a["where"]
+                hit = getattr(pc, _COMPARE_ARROW[op])(col[left], col[right] if isinstance(right, str) else right)
+                counts[i] += pc.sum(hit.cast("int64")).as_py() or 0
+            elif a["kind"] != "row_count":
+                raise Exception(f"Unsupported assertion kind '{a['kind']}' ({a['test']})")
+
+    metrics = []
+    for a, count in zip(assertions, counts):
+        if a["kind"] == "row_count":
+            metrics.append(rows)
+        elif a["kind"] == "fill_rate":
+            metrics.append(count / rows if rows else None)
+        else:
+            metrics.append(count)
+    return metrics
+
+
+# ----------------------------
+# Results
+# ----------------------------
+def evaluate(metrics, assertions, target: str, run_id: str = None) -> list:
+    """test_results rows: a metric that cannot be computed (empty source) fails its test."""
+    scope = f" (run_id={run_id})" if run_id else ""
+    results = []
+    for a, metric in zip(assertions, metrics):
+        value = None if metric is None else round(float(metric), 6)
+        passed = value is not None and _CHECKS[a["check"]](value, a["threshold"])
+        results.append({
+            "test_name": f"{target}.{a['test']}",
+            "passed": passed,
+            "metric_value": value,
+            "threshold": a["threshold"],
+            "details": a["details"] + scope,
+        })
+    return results
+
+
+def write_results(cur, results, test_run_id: str) -> None:
+    """All results in one multi-row INSERT (test_run_id shared; created_at/created_by default)."""
+    values = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(results))
+    args = []
+    for r in results:
+        args += [test_run_id, r["test_name"], r["passed"], r["metric_value"], r["threshold"], r["details"]]
+    cur.execute(f"INSERT INTO {RESULTS_TABLE} (test_run_id, test_name, passed, metric_value, threshold, details) "
+                f"VALUES {values}", tuple(args))
+
+
+def run_assertions(params: dict, source: str, table: str = "final_fact.trip_fact", path: str = None,
+                   run_id: str = None, target: str = None, assertions=ASSERTIONS, write: bool = True) -> dict:
+    """Evaluates the assertions in one pass over the source and records them; returns the summary."""
+    if source == "table":
+        target = target or table
+    elif source == "parquet":
+        target = target or "curated.trip_fact"
+    else:
+        raise Exception(f"Unsupported source '{source}' (expected table or parquet)")
+
+    conn = _connect(params) if (write or source == "table") else None
+    try:
+        if source == "table":
+            metrics = table_metrics(conn.cursor(), table, assertions, run_id)
+        else:
+            metrics = parquet_metrics(path, assertions)
+        results = evaluate(metrics, assertions, target, run_id)
+        test_run_id = str(uuid.uuid4())
+        if write:
+            write_results(conn.cursor(), results, test_run_id)
+            conn.commit()
+        return {
+            "test_run_id": test_run_id,
+            "target": target,
+            "source_path": path or table,
+            "run_id": run_id,
+            "passed": sum(r["passed"] for r in results),
+            "failed": sum(not r["passed"] for r in results),
+            "results": results,
+        }
+    except Exception:
+        if conn is not None:
+            conn.rollback()
+        raise
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Single-pass DQ assertions into final_dq.test_results")
+    ap.add_argument("--source", default="table", choices=["table", "parquet"])
+    ap.add_argument("--table", default="final_fact.trip_fact")
+    ap.add_argument("--path", help="fact-layout parquet folder or s3:// URI (--source parquet)")
+    ap.add_argument("--run_id", help="only this run's rows (--source table)")
+    ap.add_argument("--target", help="test_name prefix (default: the table, or curated.trip_fact)")
+    ap.add_argument("--dry_run", action="store_true", help="print the results without recording them")
+    ap.add_argument("--host")
+    ap.add_argument("--port", type=int, default=5439)
+    ap.add_argument("--unix-sock")
+    ap.add_argument("--user", default="postgres")
+    ap.add_argument("--password", default=os.environ.get("PGPASSWORD"))
+    ap.add_argument("--database", default="analytics")
+    # Glue Python shell jobs append their own --job-bookmark-option etc.
+    a, _ = ap.parse_known_args()
+
+    params = {"user": a.user, "database": a.database}
+    if a.unix_sock:
+        params["unix_sock"] = a.unix_sock
+    else:
+        params.update(host=a.host or "localhost", port=a.port)
+    if a.password:
+        params["password"] = a.password
+
+    summary = run_assertions(params, a.source, table=a.table, path=a.path, run_id=a.run_id,
+                             target=a.target, write=not a.dry_run)
+    print(json.dumps(summary, indent=2))
+    if summary["failed"]:
+        raise SystemExit(1)
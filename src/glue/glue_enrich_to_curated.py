@@ -3,11 +3,18 @@ import json
 from datetime import datetime, timezone
 
 import boto3
+from botocore.exceptions import ClientError
 from awsglue.utils import getResolvedOptions
 from pyspark.context import SparkContext
 from awsglue.context import GlueContext
 from awsglue.job import Job
+from pyspark.sql import Observation, Window
 from pyspark.sql import functions as F
+from pyspark.sql.functions import broadcast
+
+from lake_io import S3ObjectStore
+from stage_metrics import StageMetrics
+from trip_rollup import DEFAULT_KEEP_RUNS, DEFAULT_KEEP_VERSIONS, update_rollup
 
 
 # ----------------------------
@@ -16,6 +23,23 @@ from pyspark.sql import functions as F
 s3 = boto3.client("s3")
 cw = boto3.client("cloudwatch")
 
+# pickup-date partition columns used by --partition_layout date
+DATE_PARTITION_COLS = ["pickup_year", "pickup_month", "pickup_day"]
+
+def _read_run_manifest(bucket: str, run_prefix: str):
+    """
+    Data file URIs of <run_prefix>_MANIFEST.json, written by glue_compact_trips.py as the
+    commit point of a compaction (None if the run was never compacted).
+    """
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=f"{run_prefix}_MANIFEST.json")
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None
+        raise
+    return [e["url"] for e in json.loads(obj["Body"].read().decode("utf-8")).get("entries", [])]
+
+
 def _latest_prefix_by_last_modified(bucket: str, base_prefix: str) -> str:
     """
     Finds the most recently modified object under base_prefix and returns the 'directory'
@@ -32,6 +56,9 @@ def _latest_prefix_by_last_modified(bucket: str, base_prefix: str) -> str:
             key = obj["Key"]
             if key.endswith("/"):
                 continue
+            # skip markers/manifests such as _LATEST.json and _SUCCESS
+            if key.rsplit("/", 1)[-1].startswith("_"):
+                continue
             lm = obj["LastModified"]
             if latest is None or lm > latest[0]:
                 latest = (lm, key)
@@ -44,6 +71,134 @@ def _latest_prefix_by_last_modified(bucket: str, base_prefix: str) -> str:
     return latest_dir
 
 
+def _read_latest_pointer(bucket: str, base_prefix: str):
+    """Reads <base_prefix>_LATEST.json written by the producing job (None if missing)."""
+    if base_prefix and not base_prefix.endswith("/"):
+        base_prefix += "/"
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=f"{base_prefix}_LATEST.json")
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None
+        raise
+    return json.loads(obj["Body"].read().decode("utf-8"))
+
+
+def _resolve_latest_prefix(bucket: str, base_prefix: str):
+    """
+    O(1) lookup of the newest committed folder via the _LATEST pointer manifest;
+    falls back to listing the whole base prefix when no pointer has been published yet.
+    Returns (prefix, pointer): the pointer is read once, so its other fields describe the
+    same run as the prefix (None when the prefix comes from the listing).
+    """
+    pointer = _read_latest_pointer(bucket, base_prefix)
+    return _prefix_from_pointer(bucket, base_prefix, pointer), _usable_pointer(bucket, pointer)
+
+
+def _usable_pointer(bucket: str, pointer):
+    return pointer if pointer and pointer.get("prefix") and pointer.get("bucket", bucket) == bucket else None
+
+
+def _prefix_from_pointer(bucket: str, base_prefix: str, pointer) -> str:
+    if _usable_pointer(bucket, pointer):
+        print(f"Resolved latest under {base_prefix} from _LATEST pointer")
+        return pointer["prefix"]
+
+    print(f"No _LATEST pointer under {base_prefix} - falling back to listing")
+    return _latest_prefix_by_last_modified(bucket, base_prefix)
+
+
+def _current_golden_view(df):
+    """
+    Reduces a golden snapshot to its current SCD2 rows. With a _chain_pos column
+    (base + deltas) the newest version of every golden_sk wins first, so rows
+    expired by a later delta drop out.
+    """
+    lower = {c.lower(): c for c in df.columns}
+    if "_chain_pos" in df.columns and "golden_sk" in lower:
+        newest = Window.partitionBy(lower["golden_sk"]).orderBy(F.col("_chain_pos").desc())
+        df = (df.withColumn("_rn", F.row_number().over(newest))
+                .where(F.col("_rn") == 1)
+                .drop("_rn", "_chain_pos"))
+    if "is_current" in lower:
+        df = df.where(F.col(lower["is_current"]))
+    return df
+
+
+def _read_golden_snapshot(bucket: str, base_prefix: str):
+    """
+    Current view of the latest golden snapshot under base_prefix. Delta-mode pointers
+    list the base snapshot's current/ folder plus the deltas written since; only those
+    are read, never the base's full history. Returns (df, [paths read]).
+    """
+    pointer = _read_latest_pointer(bucket, base_prefix)
+    if pointer and pointer.get("base", {}).get("current_path") and pointer.get("bucket", bucket) == bucket:
+        paths = [pointer["base"]["current_path"]] + [d["path"] for d in pointer.get("deltas", [])]
+        print(f"Resolved latest under {base_prefix} from _LATEST pointer ({len(paths) - 1} deltas)")
+        df = None
+        for pos, path in enumerate(paths):
+            part = spark.read.parquet(path).withColumn("_chain_pos", F.lit(pos))
+            df = part if df is None else df.unionByName(part, allowMissingColumns=True)
+        return _current_golden_view(df), paths
+
+    path = f"s3://{bucket}/{_prefix_from_pointer(bucket, base_prefix, pointer)}"
+    return _current_golden_view(spark.read.parquet(path)), [path]
+
+
+def _strip_date_partitions(prefix: str) -> str:
+    """
+    With the date layout the newest object sits under run_id=.../pickup_year=.../pickup_day=.../;
+    cut back to the run folder so the whole run is read (no-op for the flat layout).
+    """
+    marker = "pickup_year="
+    if marker in prefix:
+        prefix = prefix[:prefix.index(marker)]
+    return prefix
+
+
+def _with_pickup_date_partitions(df):
+    """Adds pickup_year / pickup_month / pickup_day from tpep_pickup_datetime (if not already read as partitions)."""
+    ts = F.col("tpep_pickup_datetime")
+    if "pickup_year" not in df.columns:
+        df = df.withColumn("pickup_year", F.year(ts))
+    if "pickup_month" not in df.columns:
+        df = df.withColumn("pickup_month", F.month(ts))
+    if "pickup_day" not in df.columns:
+        df = df.withColumn("pickup_day", F.dayofmonth(ts))
+    return df
+
+
+def _pickup_date_filter(columns, date_from: str, date_to: str):
+    """
+    Inclusive YYYY-MM-DD range. On a date-partitioned input the predicate only touches the
+    partition columns, so Spark prunes to the matching day folders.
+    """
+    if all(c in columns for c in DATE_PARTITION_COLS):
+        day = F.col("pickup_year") * 10000 + F.col("pickup_month") * 100 + F.col("pickup_day")
+        to_key = lambda d: int(d.replace("-", ""))
+    else:
+        day = F.to_date(F.col("tpep_pickup_datetime"))
+        to_key = lambda d: F.lit(d).cast("date")
+
+    cond = F.lit(True)
+    if date_from:
+        cond = cond & (day >= to_key(date_from))
+    if date_to:
+        cond = cond & (day <= to_key(date_to))
+    return cond
+
+
+def _write_date_partitioned(df, path: str):
+    # one task per day, rows sorted by pickup time inside each file;
+    # dynamic overwrite only replaces the day folders present in df
+    (df.repartition(*DATE_PARTITION_COLS)
+       .sortWithinPartitions(*DATE_PARTITION_COLS, "tpep_pickup_datetime")
+       .write.mode("overwrite")
+       .option("partitionOverwriteMode", "dynamic")
+       .partitionBy(*DATE_PARTITION_COLS)
+       .parquet(path))
+
+
 def _write_metrics_json(bucket: str, metrics_prefix: str, metrics: dict):
     if metrics_prefix and not metrics_prefix.endswith("/"):
         metrics_prefix += "/"
@@ -57,11 +212,12 @@ def _write_metrics_json(bucket: str, metrics_prefix: str, metrics: dict):
     return f"s3://{bucket}/{key}"
 
 
-def _put_governance_metrics(namespace: str, metrics: dict):
+def _put_governance_metrics(namespace: str, metrics: dict, extra_metric_data=()):
+    """Governance gauges plus any extra datums (stage metrics) in one PutMetricData call."""
     if not namespace:
         return
 
-    metric_data = []
+    metric_data = list(extra_metric_data)
     for name, value in metrics.items():
         if isinstance(value, (int, float)):
             metric_data.append({
@@ -133,6 +289,254 @@ def _normalize_master_snapshot(zones_df):
     return zones_df
 
 
+# ----------------------------
+# Lookup enrichment engine
+# ----------------------------
+# Reference dimensions: snapshot key/attribute column variants (lower-case)
+ZONE_DIM = {
+    "key": ["locationid", "location_id"],
+    "attrs": {
+        "borough": ["borough"],
+        "zone": ["zone"],
+        "service_zone": ["service_zone", "servicezone", "service zone"],
+    },
+}
+VENDOR_DIM = {
+    "key": ["vendor_id", "vendorid"],
+    "attrs": {"vendor_name": ["vendor_name", "vendorname"]},
+}
+RATECODE_DIM = {
+    "key": ["rate_code_id", "ratecodeid", "ratecode_id"],
+    "attrs": {"rate_code_name": ["rate_code_name", "ratecodename", "ratecode_name"]},
+}
+
+
+def _dim_columns(ref_df, dim: dict, label: str):
+    """(key column, {attr: column}, is_current column, effective_from column) of a reference snapshot."""
+    lower = {c.strip().lower(): c for c in ref_df.columns}
+
+    def pick(candidates):
+        for cand in candidates:
+            if cand in lower:
+                return lower[cand]
+        return None
+
+    key_col = pick(dim["key"])
+    attr_cols = {name: pick(cands) for name, cands in dim["attrs"].items()}
+    missing = [name for name, col in attr_cols.items() if col is None]
+    if key_col is None or missing:
+        raise Exception(f"{label} snapshot missing key/columns {missing or dim['key']}. Found: {ref_df.columns}")
+    return key_col, attr_cols, lower.get("is_current"), lower.get("effective_from")
+
+
+def _collect_lookup(ref_df, dim: dict, label: str) -> dict:
+    """
+    Collects a small reference snapshot into {key: {attr: value}} on the driver.
+    Golden snapshots carry SCD2 history, so each key keeps one row:
+    is_current rows win, then the latest effective_from.
+    """
+    key_col, attr_cols, cur_col, eff_col = _dim_columns(ref_df, dim, label)
+    select_cols = [key_col] + list(attr_cols.values()) + [c for c in (cur_col, eff_col) if c]
+
+    best = {}
+    for row in ref_df.select(*select_cols).collect():
+        if row[key_col] is None:
+            continue
+        key = int(row[key_col])
+        rank = (
+            bool(row[cur_col]) if cur_col else False,
+            row[eff_col].isoformat() if eff_col and row[eff_col] is not None else "",
+        )
+        if key not in best or rank > best[key][0]:
+            best[key] = (rank, {name: row[col] for name, col in attr_cols.items()})
+
+    return {key: attrs for key, (_, attrs) in best.items()}
+
+
+def _dim_frame(ref_df, dim: dict, label: str):
+    """
+    Join-engine counterpart of _collect_lookup: one row per key with the same precedence,
+    the key as _ref_key (int) and the attributes as strings, like the lookup maps.
+    """
+    key_col, attr_cols, cur_col, eff_col = _dim_columns(ref_df, dim, label)
+    order = []
+    if cur_col:
+        order.append(F.coalesce(F.col(cur_col).cast("boolean"), F.lit(False)).desc())
+    if eff_col:
+        order.append(F.col(eff_col).desc_nulls_last())
+    newest = Window.partitionBy("_ref_key").orderBy(*(order or [F.lit(0)]))
+    return (
+        ref_df.where(F.col(key_col).isNotNull())
+              .withColumn("_ref_key", F.col(key_col).cast("int"))
+              .withColumn("_rn", F.row_number().over(newest))
+              .where(F.col("_rn") == 1)
+              .select("_ref_key", *[F.col(col).cast("string").alias(name) for name, col in attr_cols.items()])
+    )
+
+
+def _lookup_map(lookup: dict, attr_names):
+    """
+    Compiles the lookup into a literal MAP<int, STRUCT<attrs>> expression. It ships with
+    the task plan (a few KB for ~265 zones), so every row is resolved map-side with no join.
+    """
+    if not lookup:
+        return None
+    entries = []
+    for key in sorted(lookup):
+        entries.append(F.lit(key))
+        entries.append(F.struct(*[
+            F.lit(lookup[key][name]).cast("string").alias(name) for name in attr_names
+        ]))
+    return F.create_map(*entries)
+
+
+def _enrich_with_lookups(trips, resolutions):
+    """
+    resolutions: [(dimension, trip_key_col, lookup_map, {attr: output_col})]
+    Resolves every dimension in one projection and returns (enriched_df, {dimension: hit_expr}).
+    """
+    new_cols = []
+    hit_exprs = {}
+    for dimension, key_col, lookup, outputs in resolutions:
+        if lookup is None:
+            new_cols += [F.lit(None).cast("string").alias(out) for out in outputs.values()]
+            hit_exprs[dimension] = F.lit(False)
+            continue
+        resolved = lookup[F.col(key_col)]
+        new_cols += [resolved.getField(attr).alias(out) for attr, out in outputs.items()]
+        hit_exprs[dimension] = resolved.isNotNull()
+
+    # keep the column order of the old USING joins: dolocationid, pulocationid, trip columns, lookups
+    keys = ["dolocationid", "pulocationid"]
+    rest = [c for c in trips.columns if c.lower() not in keys]
+    return trips.select(*keys, *rest, *new_cols), hit_exprs
+
+
+# ----------------------------
+# Curated metrics (observed during the write)
+# ----------------------------
+MONEY_COLS = [
+    "fare_amount", "extra", "mta_tax", "tip_amount", "tolls_amount",
+    "improvement_surcharge", "total_amount", "congestion_surcharge",
+    "airport_fee", "cbd_congestion_fee",
+]
+
+
+def _curated_metric_exprs(df, hit_exprs):
+    """
+    Every _METRICS.json number as one aggregation, evaluated while the curated output
+    is written: row count, per-column non-null counts, pickup time range, money sums
+    and lookup hits.
+    """
+    exprs = [F.count(F.lit(1)).alias("rows")]
+    exprs += [F.count(F.col(c)).alias(f"nonnull__{c}") for c in df.columns]
+    if "tpep_pickup_datetime" in df.columns:
+        # observed metrics come back through py4j, so timestamps are formatted in Spark
+        iso = "yyyy-MM-dd'T'HH:mm:ss"
+        exprs += [
+            F.date_format(F.min("tpep_pickup_datetime"), iso).alias("pickup_min"),
+            F.date_format(F.max("tpep_pickup_datetime"), iso).alias("pickup_max"),
+        ]
+    exprs += [F.sum(F.col(c)).alias(f"sum__{c}") for c in df.columns if c.lower() in MONEY_COLS]
+    exprs += [F.sum(expr.cast("int")).alias(f"hit__{dimension}") for dimension, expr in hit_exprs.items()]
+    return exprs
+
+
+def _summarize_curated_metrics(observed: dict, columns, hit_dims) -> dict:
+    rows = observed["rows"] or 0
+
+    def rate(n):
+        return round((n or 0) / rows, 4) if rows else 0.0
+
+    return {
+        "total_rows": rows,
+        "column_nonnull_rates": {c: rate(observed[f"nonnull__{c}"]) for c in columns},
+        "pickup_datetime_min": observed.get("pickup_min"),
+        "pickup_datetime_max": observed.get("pickup_max"),
+        "money_sums": {
+            c: round(float(observed[f"sum__{c}"] or 0.0), 2)
+            for c in columns if c.lower() in MONEY_COLS
+        },
+        "lookup_hit_rates": {dim: rate(observed[f"hit__{dim}"]) for dim in hit_dims},
+    }
+
+
+# ----------------------------
+# Load-ready fact output (surrogate keys resolved here, not in Redshift)
+# ----------------------------
+# (fact column, key map folder under --dim_keys_prefix, natural id, surrogate key,
+#  curated column, unknown-member default) - same lookups and COALESCE defaults as 09_fact.sql
+FACT_KEYS = [
+    ("vendor_sk", "vendor_dim", "vendor_id", "vendor_sk", "vendorid", None),
+    ("ratecode_sk", "ratecode_dim", "rate_code_id", "ratecode_sk", "ratecodeid", 99),
+    ("payment_type_sk", "payment_type_dim", "payment_type_id", "payment_type_sk", "payment_type", 5),
+    ("pickup_zone_sk", "zone_dim", "location_id", "zone_sk", "pulocationid", None),
+    ("dropoff_zone_sk", "zone_dim", "location_id", "zone_sk", "dolocationid", None),
+]
+# final_fact.trip_fact columns after the surrogate keys: (fact column, curated column, type)
+FACT_MEASURES = [
+    ("pickup_datetime", "tpep_pickup_datetime", "timestamp"),
+    ("dropoff_datetime", "tpep_dropoff_datetime", "timestamp"),
+    ("passenger_count", "passenger_count", "int"),
+    ("trip_distance", "trip_distance", "double"),
+] + [(c, c, "double") for c in MONEY_COLS] + [
+    ("ingested_at_utc", "ingested_at_utc", "string"),
+]
+
+
+def _read_key_maps(bucket: str, keys_base: str) -> dict:
+    """
+    {key map folder: {natural id: surrogate key}} from the dimension key maps exported by
+    16_fact_key_maps.sql. A natural id listed twice keeps its highest surrogate key.
+    """
+    maps = {}
+    for _, folder, id_col, sk_col, _, _ in FACT_KEYS:
+        if folder in maps:
+            continue
+        df = spark.read.parquet(f"s3://{bucket}/{keys_base}{folder}/")
+        lower = {c.lower(): c for c in df.columns}
+        rows = df.select(F.col(lower[id_col]).cast("int"), F.col(lower[sk_col]).cast("long")).collect()
+        pairs = {}
+        for natural, sk in rows:
+            if natural is not None and sk is not None:
+                pairs[natural] = max(sk, pairs.get(natural, sk))
+        maps[folder] = pairs
+        print(f"Key map {folder}: {len(pairs)} keys")
+    return maps
+
+
+def _fact_frame(curated, key_maps: dict, run_id: str, obs: Observation):
+    """
+    Curated rows in final_fact.trip_fact column order with every surrogate key resolved
+    map-side (literal MAP<int, bigint> per dimension, no join). `obs` counts the rows and,
+    per key, the ids missing from their dimension (NULL key, as with 09_fact.sql's LEFT JOIN).
+    """
+    lower = {c.lower(): c for c in curated.columns}
+
+    def col(name, cast):
+        return F.col(lower[name]).cast(cast) if name in lower else F.lit(None).cast(cast)
+
+    keyed, misses = [], []
+    for fact_col, folder, _, _, trip_col, default in FACT_KEYS:
+        natural = col(trip_col, "int")
+        if default is not None:
+            natural = F.coalesce(natural, F.lit(default))
+        pairs = key_maps[folder]
+        if pairs:
+            entries = [e for k in sorted(pairs) for e in (F.lit(k), F.lit(pairs[k]).cast("long"))]
+            sk = F.create_map(*entries)[natural]
+        else:
+            sk = F.lit(None).cast("long")
+        keyed += [sk.alias(fact_col), natural.alias(f"_id_{fact_col}")]
+        misses.append(F.sum((F.col(f"_id_{fact_col}").isNotNull() & F.col(fact_col).isNull()).cast("int")).alias(fact_col))
+
+    measures = [col(src, cast).alias(fact_col) for fact_col, src, cast in FACT_MEASURES]
+    fact_cols = [k[0] for k in FACT_KEYS] + [m[0] for m in FACT_MEASURES[:-1]] + ["run_id", FACT_MEASURES[-1][0]]
+    return (curated.select(*keyed, *measures, F.lit(run_id).alias("run_id"))
+            .observe(obs, F.count(F.lit(1)).alias("rows"), *misses)
+            .select(*fact_cols))
+
+
 # ----------------------------
 # Main
 # ----------------------------
@@ -149,6 +553,11 @@ base_args = [
 ]
 if "--GOV_METRICS_NAMESPACE" in argv:
     base_args.append("GOV_METRICS_NAMESPACE")
+for optional in ["partition_layout", "pickup_date_from", "pickup_date_to",
+                 "enrich_engine", "vendor_snapshot_prefix", "ratecode_snapshot_prefix", "rollup_prefix",
+                 "rollup_keep_runs", "rollup_keep_versions", "fact_prefix", "dim_keys_prefix"]:
+    if f"--{optional}" in argv:
+        base_args.append(optional)
 
 args = getResolvedOptions(argv, base_args)
 
@@ -157,6 +566,7 @@ glueContext = GlueContext(sc)
 spark = glueContext.spark_session
 job = Job(glueContext)
 job.init(args["JOB_NAME"], args)
+perf = StageMetrics(spark, args["JOB_NAME"])
 
 bucket = args["bucket"]
 
@@ -166,58 +576,196 @@ curated_base   = args["curated_trips_prefix"].strip("/") + "/"
 metrics_prefix = args["metrics_prefix"].strip("/") + "/"
 run_id         = args["run_id"]
 
-# 1) Find latest validated run folder + latest snapshot folder
-latest_validated_prefix = _latest_prefix_by_last_modified(bucket, validated_base)
-latest_snapshot_prefix  = _latest_prefix_by_last_modified(bucket, snapshot_base)
-
+# partition_layout=date: curated run folder is partitioned by pickup_year/pickup_month/pickup_day
+partition_layout = args.get("partition_layout", "flat").strip().lower()
+if partition_layout not in ("flat", "date"):
+    raise Exception(f"Unsupported partition_layout '{partition_layout}' (expected flat or date)")
+pickup_date_from = args.get("pickup_date_from", "").strip()
+pickup_date_to   = args.get("pickup_date_to", "").strip()
+
+# enrich_engine=join (default): broadcast join per reference dimension
+# enrich_engine=lookup: all reference dims resolved map-side in one pass (same output columns)
+enrich_engine = args.get("enrich_engine", "join").strip().lower()
+if enrich_engine not in ("lookup", "join"):
+    raise Exception(f"Unsupported enrich_engine '{enrich_engine}' (expected lookup or join)")
+# optional vendor / ratecode golden snapshots (vendor_name / rate_code_name); not deployed by default
+vendor_base   = args.get("vendor_snapshot_prefix", "").strip("/")
+ratecode_base = args.get("ratecode_snapshot_prefix", "").strip("/")
+# rollup_prefix: merge this run into the BI rollup (date x zone x vendor x ratecode x payment type)
+rollup_base = args.get("rollup_prefix", "").strip("/")
+rollup_base = f"{rollup_base}/" if rollup_base else ""
+# runs whose delta the rollup pointer keeps for reruns / published versions kept after a flip
+rollup_keep_runs = int(args.get("rollup_keep_runs", DEFAULT_KEEP_RUNS))
+rollup_keep_versions = int(args.get("rollup_keep_versions", DEFAULT_KEEP_VERSIONS))
+# fact_prefix + dim_keys_prefix: also write the run as load-ready final_fact.trip_fact rows
+# (surrogate keys resolved from the exported dimension key maps)
+fact_base = args.get("fact_prefix", "").strip("/")
+fact_base = f"{fact_base}/" if fact_base else ""
+dim_keys_base = args.get("dim_keys_prefix", "").strip("/")
+dim_keys_base = f"{dim_keys_base}/" if dim_keys_base else ""
+if fact_base and not dim_keys_base:
+    raise Exception("--fact_prefix needs --dim_keys_prefix (dimension key maps exported by 16_fact_key_maps.sql)")
+
+# 1) Find latest validated run folder + latest snapshot folder(s)
+perf.start("read")
+latest_validated_prefix, validated_pointer = _resolve_latest_prefix(bucket, validated_base)
+latest_validated_prefix = _strip_date_partitions(latest_validated_prefix)
 validated_path = f"s3://{bucket}/{latest_validated_prefix}"
-snapshot_path  = f"s3://{bucket}/{latest_snapshot_prefix}"
+# the rollup merges runs that hold only new trips (incremental raw-to-validated) and is
+# rebuilt from any other run, which holds every trip (no pointer: treated as such);
+# the flag comes from the same pointer read as the run folder
+validated_new_trips_only = bool((validated_pointer or {}).get("incremental"))
+if rollup_base and not validated_new_trips_only and (pickup_date_from or pickup_date_to):
+    raise Exception("--rollup_prefix with a pickup date range needs an incremental validated run "
+                    "(the rollup would be rebuilt from the range alone)")
+
+# key maps before anything is written: a missing export (16_fact_key_maps.sql not run
+# yet) fails the run before curated and the rollup are published
+key_maps = _read_key_maps(bucket, dim_keys_base) if fact_base else None
+
+# 3) Master snapshot (parquet expected) as its current view: base + deltas in delta mode
+zones_raw, snapshot_paths = _read_golden_snapshot(bucket, snapshot_base)
+snapshot_path = snapshot_paths[0]
 
 print("Latest validated:", validated_path)
-print("Latest snapshot :", snapshot_path)
+print("Latest snapshot :", ", ".join(snapshot_paths))
 
-# 2) Read validated trips
-trips = spark.read.parquet(validated_path)
+# 2) Read validated trips (a compacted run is read through its manifest, never a mix of old and new files)
+validated_files = _read_run_manifest(bucket, latest_validated_prefix)
+if validated_files:
+    print(f"Validated run manifest: {len(validated_files)} files")
+    trips = spark.read.option("basePath", validated_path).parquet(*validated_files)
+else:
+    trips = spark.read.parquet(validated_path)
 
 # Ensure join keys are int (yellow taxi usually int)
 trips = trips.withColumn("pulocationid", F.col("pulocationid").cast("int")) \
              .withColumn("dolocationid", F.col("dolocationid").cast("int"))
 
-# 3) Read master snapshot (parquet expected)
-zones_raw = spark.read.parquet(snapshot_path)
-
-# 4) Normalize master snapshot schema
-zones = _normalize_master_snapshot(zones_raw)
-
-# 5) Join for PU
-pu = zones.select(
-    F.col("locationid").alias("pulocationid"),
-    F.col("borough").alias("pu_borough"),
-    F.col("zone").alias("pu_zone"),
-    F.col("service_zone").alias("pu_servicezone"),
-)
-
-# 6) Join for DO
-do = zones.select(
-    F.col("locationid").alias("dolocationid"),
-    F.col("borough").alias("do_borough"),
-    F.col("zone").alias("do_zone"),
-    F.col("service_zone").alias("do_servicezone"),
-)
-
-enriched = (trips
-    .join(pu, on="pulocationid", how="left")
-    .join(do, on="dolocationid", how="left")
-)
+# Optional pickup-date slice (prunes partitions when validated uses the date layout)
+if pickup_date_from or pickup_date_to:
+    trips = trips.filter(_pickup_date_filter(trips.columns, pickup_date_from, pickup_date_to))
+    print(f"Pickup date range: {pickup_date_from or '-'} .. {pickup_date_to or '-'}")
+
+perf.start("join")
+hit_exprs = {}
+# optional reference dimensions (resolved by both engines into the same columns)
+reference_dims = [
+    ("vendor", vendor_base, VENDOR_DIM, "vendorid"),
+    ("ratecode", ratecode_base, RATECODE_DIM, "ratecodeid"),
+]
+if enrich_engine == "lookup":
+    # 4) Load every reference snapshot once into compact lookup maps
+    zone_lookup = _collect_lookup(zones_raw, ZONE_DIM, "Master")
+    zone_map = _lookup_map(zone_lookup, list(ZONE_DIM["attrs"]))
+    resolutions = [
+        ("pu_zone", "pulocationid", zone_map,
+         {"borough": "pu_borough", "zone": "pu_zone", "service_zone": "pu_servicezone"}),
+        ("do_zone", "dolocationid", zone_map,
+         {"borough": "do_borough", "zone": "do_zone", "service_zone": "do_servicezone"}),
+    ]
+    print(f"Zone lookup: {len(zone_lookup)} keys")
+
+    for dimension, base, dim, trip_key in reference_dims:
+        if not base:
+            continue
+        dim_df, dim_paths = _read_golden_snapshot(bucket, base)
+        dim_lookup = _collect_lookup(dim_df, dim, dimension)
+        print(f"Latest {dimension} snapshot: {', '.join(dim_paths)} ({len(dim_lookup)} keys)")
+        trips = trips.withColumn(trip_key, F.col(trip_key).cast("int"))
+        resolutions.append((dimension, trip_key, _lookup_map(dim_lookup, list(dim["attrs"])),
+                            {name: name for name in dim["attrs"]}))
+
+    # 5) Resolve PU zone, DO zone, vendor and ratecode in a single map-side projection
+    enriched, hit_exprs = _enrich_with_lookups(trips, resolutions)
+else:
+    # 4) Normalize master snapshot schema
+    zones = _normalize_master_snapshot(zones_raw)
+
+    # 5) Join for PU (attributes typed as in the lookup maps)
+    pu = zones.select(
+        F.col("locationid").alias("pulocationid"),
+        F.col("borough").cast("string").alias("pu_borough"),
+        F.col("zone").cast("string").alias("pu_zone"),
+        F.col("service_zone").cast("string").alias("pu_servicezone"),
+    )
+
+    # 6) Join for DO
+    do = zones.select(
+        F.col("locationid").alias("dolocationid"),
+        F.col("borough").cast("string").alias("do_borough"),
+        F.col("zone").cast("string").alias("do_zone"),
+        F.col("service_zone").cast("string").alias("do_servicezone"),
+    )
+
+    enriched = (trips
+        .join(broadcast(pu), on="pulocationid", how="left")
+        .join(broadcast(do), on="dolocationid", how="left")
+    )
+
+    # 6b) Vendor / ratecode: joined on a condition (not USING) so the columns stay in
+    # place and the names are appended after the zones, as the lookup engine writes them
+    for dimension, base, dim, trip_key in reference_dims:
+        if not base:
+            continue
+        dim_df, dim_paths = _read_golden_snapshot(bucket, base)
+        print(f"Latest {dimension} snapshot: {', '.join(dim_paths)}")
+        enriched = (enriched
+            .withColumn(trip_key, F.col(trip_key).cast("int"))
+            .join(broadcast(_dim_frame(dim_df, dim, dimension)), F.col(trip_key) == F.col("_ref_key"), "left")
+            .drop("_ref_key")
+        )
+
+# All curated metrics are observed while the output is written (no extra scans)
+curated_obs = Observation("curated_metrics")
+curated_df = enriched.observe(curated_obs, *_curated_metric_exprs(enriched, hit_exprs))
 
 # 7) Output curated
+perf.start("write")
 curated_out = f"s3://{bucket}/{curated_base}run_id={run_id}/"
-(enriched.write.mode("overwrite").parquet(curated_out))
+# a compaction manifest (glue_compact_trips.py) of an earlier attempt of this run is stale now
+s3.delete_object(Bucket=bucket, Key=f"{curated_base}run_id={run_id}/_MANIFEST.json")
+if partition_layout == "date":
+    _write_date_partitioned(_with_pickup_date_partitions(curated_df), curated_out)
+else:
+    (curated_df.write.mode("overwrite").parquet(curated_out))
+
+# 7b) Rollup: aggregates of the curated rows just written, merged into the latest version
+# (or replacing it when the run holds every trip)
+rollup = None
+if rollup_base:
+    perf.start("rollup")
+    rollup = update_rollup(spark, S3ObjectStore(bucket, s3), rollup_base, run_id, curated_out,
+                           rebuild=not validated_new_trips_only, keep_runs=rollup_keep_runs,
+                           keep_versions=rollup_keep_versions)
+    print(f"ROLLUP: {json.dumps(rollup)}")
+
+# 7c) Load-ready fact rows of the run (COPY target of the fact load, no joins left in Redshift)
+fact = None
+if fact_base:
+    perf.start("fact")
+    fact_obs = Observation("fact_metrics")
+    fact_df = _fact_frame(spark.read.parquet(curated_out), key_maps, run_id, fact_obs)
+    fact_out = f"s3://{bucket}/{fact_base}run_id={run_id}/"
+    # a compaction manifest (glue_compact_trips.py) of an earlier attempt of this run is stale now
+    s3.delete_object(Bucket=bucket, Key=f"{fact_base}run_id={run_id}/_MANIFEST.json")
+    fact_df.write.mode("overwrite").parquet(fact_out)
+    fact_observed = fact_obs.get
+    fact = {
+        "path": fact_out,
+        "rows": fact_observed["rows"],
+        "unresolved_keys": {k[0]: int(fact_observed[k[0]] or 0) for k in FACT_KEYS},
+    }
+    print(f"FACT: {json.dumps(fact)}")
 
 # 8) Metrics (single fixed file, no run_id in metrics path)
-total_rows = enriched.count()
-pu_rate = enriched.filter(F.col("pu_zone").isNotNull()).count() / total_rows if total_rows else 0.0
-do_rate = enriched.filter(F.col("do_zone").isNotNull()).count() / total_rows if total_rows else 0.0
+perf.start("metrics")
+observed = curated_obs.get
+summary = _summarize_curated_metrics(observed, enriched.columns, list(hit_exprs))
+
+total_rows = summary["total_rows"]
+pu_rate = (observed["nonnull__pu_zone"] or 0) / total_rows if total_rows else 0.0
+do_rate = (observed["nonnull__do_zone"] or 0) / total_rows if total_rows else 0.0
 
 metrics = {
     "total_rows": total_rows,
@@ -225,20 +773,31 @@ metrics = {
     "do_zone_nonnull_rate": round(do_rate, 4),
     "validated_read_path": validated_path,
     "snapshot_read_path": snapshot_path,
+    "snapshot_delta_paths": snapshot_paths[1:],
     "curated_write_path": curated_out,
+    "enrich_engine": enrich_engine,
+    "lookup_hit_rates": summary["lookup_hit_rates"],
+    "column_nonnull_rates": summary["column_nonnull_rates"],
+    "pickup_datetime_min": summary["pickup_datetime_min"],
+    "pickup_datetime_max": summary["pickup_datetime_max"],
+    "money_sums": summary["money_sums"],
+    "rollup": rollup,
+    "fact": fact,
     "generated_utc": datetime.now(timezone.utc).isoformat(),
 }
+metrics["stage_metrics"] = perf.summary()
+print(f"STAGE METRICS: {json.dumps(metrics['stage_metrics'])}")
 
 metrics_s3 = _write_metrics_json(bucket, metrics_prefix, metrics)
 print("Wrote metrics:", metrics_s3)
 
-# 9) Governance CloudWatch metrics (optional)
+# 9) Governance + stage CloudWatch metrics in one batched call (optional)
 namespace = args.get("GOV_METRICS_NAMESPACE", "")
 _put_governance_metrics(namespace, {
     "TotalRows": total_rows,
     "PUZoneNonNullRate": pu_rate,
     "DOZoneNonNullRate": do_rate
-})
+}, perf.metric_data())
 
 print("SUCCESS - curated:", curated_out)
 job.commit()
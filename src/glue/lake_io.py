@@ -0,0 +1,236 @@
+"""
+Object-store access shared by the trip jobs: raw listings, checkpoint manifests,
+_LATEST / _MANIFEST pointers (plain or compare-and-swap writes) and metrics JSON.
+
+    store = open_store(bucket, local_root)      # S3 (or moto), or <local_root>/<bucket>/...
+    checkpoint = read_checkpoint(store, key)
+    raw_files, pending = pending_raw_files(store, "raw/trips/", checkpoint)
+    ...                                         # process `pending`, write the outputs
+    advance_checkpoint(store, key, checkpoint, "raw/trips/", raw_files, pending, run_id)
+
+Ship with --extra-py-files <s3 path>/lake_io.py.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+
+class S3ObjectStore:
+    """
+    Minimal object-store API used for raw listing, checkpoint manifests and metrics.
+    Works against real S3 or a moto mock (anything boto3 can talk to).
+    """
+
+    def __init__(self, bucket: str, client=None):
+        import boto3
+
+        self.bucket = bucket
+        self.client = client or boto3.client("s3")
+
+    def uri(self, key: str) -> str:
+        return f"s3://{self.bucket}/{key}"
+
+    def list_objects(self, prefix: str):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield {"key": obj["Key"], "etag": obj["ETag"].strip('"'), "size": obj["Size"]}
+
+    def get_json(self, key: str):
+        from botocore.exceptions import ClientError
+
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+        return json.loads(obj["Body"].read().decode("utf-8"))
+
+    def get_json_with_etag(self, key: str):
+        """(payload, ETag) of a JSON object, (None, None) if missing; see put_json_if_match."""
+        from botocore.exceptions import ClientError
+
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None, None
+            raise
+        return json.loads(obj["Body"].read().decode("utf-8")), obj["ETag"].strip('"')
+
+    def put_json(self, key: str, payload: dict):
+        # a single PUT is atomic: readers see either the old or the new object
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=json.dumps(payload, indent=2).encode("utf-8"),
+            ContentType="application/json",
+        )
+
+    def put_json_if_match(self, key: str, payload: dict, etag) -> bool:
+        """
+        Compare-and-swap of a pointer: writes only when the object still has `etag`
+        (etag=None: only when it does not exist yet). False when another writer got there
+        first. S3 conditional writes need boto3 >= 1.36 (Glue 4.0 ships an older one).
+        """
+        from botocore.exceptions import ClientError
+
+        condition = {"IfMatch": f'"{etag}"'} if etag else {"IfNoneMatch": "*"}
+        try:
+            self.client.put_object(
+                Bucket=self.bucket,
+                Key=key,
+                Body=json.dumps(payload, indent=2).encode("utf-8"),
+                ContentType="application/json",
+                **condition,
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("PreconditionFailed", "ConditionalRequestConflict"):
+                return False
+            raise
+        return True
+
+    def delete_keys(self, keys):
+        keys = list(keys)
+        for i in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": k} for k in keys[i:i + 1000]], "Quiet": True},
+            )
+
+
+class LocalObjectStore:
+    """
+    Same API as S3ObjectStore on a local directory (<root>/<bucket>/<key>).
+    Used with --local_root for offline runs; ETag is the md5 of the file content.
+    """
+
+    def __init__(self, root: str, bucket: str):
+        self.bucket = bucket
+        self.base = os.path.join(os.path.abspath(root), bucket)
+
+    def uri(self, key: str) -> str:
+        return f"file://{self.base}/{key}"
+
+    def list_objects(self, prefix: str):
+        start = os.path.join(self.base, prefix)
+        walk_root = start if os.path.isdir(start) else os.path.dirname(start)
+        for dirpath, _, filenames in os.walk(walk_root):
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                key = os.path.relpath(path, self.base).replace(os.sep, "/")
+                if not key.startswith(prefix):
+                    continue
+                with open(path, "rb") as fh:
+                    etag = hashlib.md5(fh.read()).hexdigest()
+                yield {"key": key, "etag": etag, "size": os.path.getsize(path)}
+
+    def get_json(self, key: str):
+        path = os.path.join(self.base, key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+
+    def get_json_with_etag(self, key: str):
+        path = os.path.join(self.base, key)
+        if not os.path.exists(path):
+            return None, None
+        with open(path, "rb") as fh:
+            body = fh.read()
+        return json.loads(body.decode("utf-8")), hashlib.md5(body).hexdigest()
+
+    def put_json(self, key: str, payload: dict):
+        path = os.path.join(self.base, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(payload, fh, indent=2)
+        os.replace(tmp, path)
+
+    def put_json_if_match(self, key: str, payload: dict, etag) -> bool:
+        # <path>.lock (O_EXCL) serializes writers on this machine, like S3's conditional PUT
+        path = os.path.join(self.base, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            fd = os.open(f"{path}.lock", os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        try:
+            if self.get_json_with_etag(key)[1] != etag:
+                return False
+            self.put_json(key, payload)
+            return True
+        finally:
+            os.close(fd)
+            os.remove(f"{path}.lock")
+
+    def delete_keys(self, keys):
+        for key in keys:
+            path = os.path.join(self.base, key)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def open_store(bucket: str, local_root: str = ""):
+    """LocalObjectStore under local_root when given (offline runs), else S3ObjectStore."""
+    return LocalObjectStore(local_root, bucket) if local_root else S3ObjectStore(bucket)
+
+
+def is_data_file(key: str) -> bool:
+    # same convention Spark uses: skip folders and _SUCCESS / _MANIFEST.json / .crc style files
+    name = key.rsplit("/", 1)[-1]
+    return bool(name) and not name.startswith(("_", "."))
+
+
+# ----------------------------
+# Raw-file checkpoint manifest (--incremental)
+# ----------------------------
+def read_checkpoint(store, key: str) -> dict:
+    """The checkpoint manifest, or an empty one before the first incremental run."""
+    return store.get_json(key) or {"files": {}}
+
+
+def pending_raw_files(store, raw_prefix: str, checkpoint: dict):
+    """
+    Returns (all_files, pending_files): raw objects under raw_prefix, and the ones that are
+    new or changed (ETag/size differ) compared to the checkpoint manifest. Manifest entries
+    of files that are gone from the listing are ignored.
+    """
+    seen = (checkpoint or {}).get("files", {})
+    all_files = [o for o in store.list_objects(raw_prefix) if is_data_file(o["key"])]
+    pending = []
+    for obj in all_files:
+        prev = seen.get(obj["key"])
+        if prev is None or prev.get("etag") != obj["etag"] or prev.get("size") != obj["size"]:
+            pending.append(obj)
+    return all_files, pending
+
+
+def advance_checkpoint(store, key: str, checkpoint: dict, raw_prefix: str, all_files, pending, run_id: str) -> dict:
+    """
+    Records `pending` as processed by run_id. Call only after the run's outputs are
+    written: a run that fails before this point leaves the checkpoint untouched, so its
+    rerun picks up the same files. Entries of files no longer listed are dropped (a file
+    uploaded again under the same key is then processed again).
+    """
+    processed_utc = datetime.now(timezone.utc).isoformat()
+    listed = {o["key"] for o in all_files}
+    files = {k: v for k, v in (checkpoint or {}).get("files", {}).items() if k in listed}
+    for obj in pending:
+        files[obj["key"]] = {
+            "etag": obj["etag"],
+            "size": obj["size"],
+            "run_id": run_id,
+            "processed_utc": processed_utc,
+        }
+    manifest = {
+        "raw_prefix": raw_prefix,
+        "last_run_id": run_id,
+        "updated_utc": processed_utc,
+        "files": files,
+    }
+    store.put_json(key, manifest)
+    return manifest
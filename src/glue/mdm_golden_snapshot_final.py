@@ -1,13 +1,223 @@
+"""
+MDM golden snapshot: exports the zone / vendor / ratecode golden views from RDS to
+S3 snapshot folders (full, delta or compacted) and publishes each entity's
+_LATEST.json pointer once all three are written.
+
+Stages (extract, publish) are timed with stage_metrics.py and printed as STAGE
+METRICS; with --GOV_METRICS_NAMESPACE they are also published to CloudWatch.
+
+Not deployed by Terraform. Job arguments:
+    --extra-py-files <scripts path>/stage_metrics.py
+"""
 import sys
+import time
 import boto3, json
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from awsglue.utils import getResolvedOptions
 from pyspark.context import SparkContext
 from awsglue.context import GlueContext
 from awsglue.job import Job
+from pyspark.sql import Observation, Window
 from pyspark.sql import functions as F
 
+from stage_metrics import StageMetrics
+
+
+def _split_s3_url(url: str):
+    # s3://bucket/some/prefix -> ("bucket", "some/prefix")
+    bucket, _, key = url.replace("s3://", "", 1).partition("/")
+    return bucket, key.strip("/")
+
+
+def _read_latest_pointer(base_url: str):
+    bucket, base_key = _split_s3_url(base_url)
+    try:
+        obj = boto3.client("s3").get_object(Bucket=bucket, Key=f"{base_key}/_LATEST.json")
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None
+        raise
+    return json.loads(obj["Body"].read().decode("utf-8"))
+
+
+def _publish_latest_pointer(base_url: str, out_url: str, pointer: dict):
+    """
+    Writes <base>/_LATEST.json after the snapshot folder is committed. Consumers
+    (enrich job, freshness check) resolve the newest snapshot from it in O(1)
+    instead of listing every snapshot ever written.
+    """
+    bucket, base_key = _split_s3_url(base_url)
+    _, out_key = _split_s3_url(out_url)
+    body = dict(pointer, bucket=bucket, prefix=f"{out_key}/", path=f"{out_url}/")
+    boto3.client("s3").put_object(
+        Bucket=bucket,
+        Key=f"{base_key}/_LATEST.json",
+        Body=json.dumps(body, indent=2).encode("utf-8"),
+        ContentType="application/json",
+    )
+    return f"s3://{bucket}/{base_key}/_LATEST.json"
+
+
+def _jdbc_reader():
+    return (
+        spark.read.format("jdbc")
+          .option("url", PG_URL)
+          .option("user", PG_USER)
+          .option("password", PG_PW)
+          .option("driver", "org.postgresql.Driver")
+    )
+
+
+def _golden_sk_bounds(view: str):
+    # min/max on the golden_sk primary key is an index lookup, not a scan
+    row = (
+        _jdbc_reader()
+          .option("query", f"SELECT min(golden_sk) AS lo, max(golden_sk) AS hi FROM {view}")
+          .load()
+          .first()
+    )
+    return row[0], row[1]
+
+
+def _utc_iso(micros):
+    # watermarks are observed as epoch micros (Observation does not convert timestamps)
+    if micros is None:
+        return None
+    return (datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(microseconds=micros)).isoformat()
+
+
+def _snapshot_plan(prev: dict):
+    """
+    Decides how one entity is exported from its previous _LATEST pointer:
+      full    - complete export from RDS (no usable delta chain, or --snapshot_mode full)
+      delta   - only rows created/expired after the chain watermark
+      compact - a delta, then base + deltas merged into a new full snapshot
+    Returns (mode, chain, since_utc).
+    """
+    if SNAPSHOT_MODE != "delta" or not prev or not prev.get("base") or not prev.get("watermark_utc"):
+        return "full", None, None
+    if prev["base"]["snapshot_id"] == SNAPSHOT_ID:
+        # re-run of a full/compacted snapshot
+        return "full", None, None
+
+    deltas = list(prev.get("deltas", []))
+    since = prev["watermark_utc"]
+    if prev.get("snapshot_id") == SNAPSHOT_ID:
+        # re-run of this delta: export again from the watermark it started at
+        since = prev.get("since_utc") or since
+        deltas = [d for d in deltas if d["snapshot_id"] != SNAPSHOT_ID]
+    chain = {"base": prev["base"], "deltas": deltas}
+    mode = "compact" if len(deltas) + 1 >= COMPACT_EVERY else "delta"
+    return mode, chain, since
+
 
-args = getResolvedOptions(sys.argv, [
+def _write_current(full_path: str, current_path: str):
+    # Readers rebuild the current view from base/current + deltas, never the full history
+    spark.read.parquet(full_path).where(F.col("is_current")).write.mode("overwrite").parquet(current_path)
+
+
+def _compact(chain: dict, delta_path: str, full_path: str, obs: Observation):
+    """Merges base + deltas + this delta: the newest version of every golden_sk survives."""
+    parts = [chain["base"]["path"]] + [d["path"] for d in chain["deltas"]] + [delta_path]
+    merged = None
+    for pos, path in enumerate(parts):
+        df = spark.read.parquet(path).withColumn("_chain_pos", F.lit(pos))
+        merged = df if merged is None else merged.unionByName(df, allowMissingColumns=True)
+    newest = Window.partitionBy("golden_sk").orderBy(F.col("_chain_pos").desc())
+    (
+        merged.withColumn("_rn", F.row_number().over(newest))
+          .where(F.col("_rn") == 1)
+          .drop("_rn", "_chain_pos")
+          .withColumn("snapshot_id", F.lit(SNAPSHOT_ID))
+          .withColumn("snapshot_ts", F.current_timestamp())
+          .observe(obs, F.count(F.lit(1)).alias("rows"))
+          .write.mode("overwrite").parquet(full_path)
+    )
+    return obs.get["rows"]
+
+
+def _extract_entity(entity: str, view: str, base_url: str, folder: str):
+    """
+    Reads one golden view and writes its snapshot folder. Views whose golden_sk span
+    reaches jdbc_partition_rows are read as jdbc_num_partitions parallel range
+    queries. The row count is observed during the write instead of a second query.
+
+    In delta mode only rows with created_at / effective_to past the previous
+    watermark are read; every compact_every deltas the chain is folded into a new
+    full snapshot.
+    """
+    t0 = time.time()
+    perf.attach()
+    full_path    = f"{base_url}/{SNAPSHOT_ID}/{folder}"
+    current_path = f"{base_url}/{SNAPSHOT_ID}/current"
+    delta_path   = f"{base_url}/{SNAPSHOT_ID}/delta"
+    mode, chain, since = _snapshot_plan(_read_latest_pointer(base_url) if SNAPSHOT_MODE == "delta" else None)
+
+    reader = _jdbc_reader().option("dbtable", view).option("fetchsize", "10000")
+    num_partitions = 1
+    if mode == "full":
+        lo, hi = _golden_sk_bounds(view)
+        if lo is not None and hi - lo + 1 >= PARTITION_ROWS:
+            num_partitions = NUM_PARTITIONS
+            reader = (
+                reader.option("partitionColumn", "golden_sk")
+                      .option("lowerBound", str(lo))
+                      .option("upperBound", str(hi + 1))
+                      .option("numPartitions", str(num_partitions))
+            )
+
+    src = reader.load()
+    if mode != "full":
+        # pushed down to RDS; the overlap re-reads rows from transactions that committed late
+        after = datetime.fromisoformat(since) - timedelta(minutes=OVERLAP_MINUTES)
+        src = src.where((F.col("created_at") > F.lit(after)) | (F.col("effective_to") > F.lit(after)))
+
+    obs = Observation(f"{entity}_snapshot")
+    df = (
+        src.withColumn("snapshot_id", F.lit(SNAPSHOT_ID))
+           .withColumn("snapshot_ts", F.current_timestamp())
+           .observe(obs,
+                    F.count(F.lit(1)).alias("rows"),
+                    F.max(F.expr("unix_micros(greatest(created_at, effective_to))")).alias("watermark"))
+    )
+    df.write.mode("overwrite").parquet(full_path if mode == "full" else delta_path)
+    rows = obs.get["rows"]
+    watermark = _utc_iso(obs.get["watermark"])
+
+    if mode == "full":
+        base, deltas, out_path, full_rows = {"snapshot_id": SNAPSHOT_ID}, [], full_path, rows
+    else:
+        watermark = max(filter(None, [since, watermark]), key=datetime.fromisoformat)
+        deltas = chain["deltas"]
+        if rows:
+            deltas = deltas + [{"snapshot_id": SNAPSHOT_ID, "path": f"{delta_path}/",
+                                "since_utc": since, "row_count": rows}]
+        base, out_path, full_rows = chain["base"], delta_path, None
+        if mode == "compact":
+            full_rows = _compact(chain, delta_path, full_path, Observation(f"{entity}_compact"))
+            base, deltas, out_path = {"snapshot_id": SNAPSHOT_ID}, [], full_path
+
+    if full_rows is not None:
+        _write_current(full_path, current_path)
+        base.update(path=f"{full_path}/", current_path=f"{current_path}/")
+
+    return {
+        "entity": entity,
+        "mode": mode,
+        "rows": rows,
+        "full_rows": full_rows,
+        "partitions": num_partitions,
+        "seconds": round(time.time() - t0, 2),
+        "base_url": base_url,
+        "out_path": out_path,
+        "chain": {"since_utc": since, "watermark_utc": watermark, "base": base, "deltas": deltas},
+    }
+
+
+argv = sys.argv
+base_args = [
     "JOB_NAME",
     "pg_jdbc_url",
     "pg_secret_id",
@@ -16,7 +226,18 @@ args = getResolvedOptions(sys.argv, [
     "s3_validated_base",
     "s3_validated_base2",
     "s3_validated_base3",
-])
+]
+# Optional: golden_sk span from which views are read with partitioned JDBC queries
+if "--jdbc_partition_rows" in argv:
+    base_args.append("jdbc_partition_rows")
+if "--jdbc_num_partitions" in argv:
+    base_args.append("jdbc_num_partitions")
+# Optional: snapshot_mode=delta exports only changes since the last snapshot's watermark
+for optional in ["snapshot_mode", "compact_every", "delta_overlap_minutes", "GOV_METRICS_NAMESPACE"]:
+    if f"--{optional}" in argv:
+        base_args.append(optional)
+
+args = getResolvedOptions(argv, base_args)
 
 
 secret_id = args["pg_secret_id"]
@@ -38,67 +259,59 @@ SNAPSHOT_ID = args["snapshot_id"]
 S3_BASE  = args["s3_validated_base"].rstrip("/")
 S3_BASE2 = args["s3_validated_base2"].rstrip("/")
 S3_BASE3 = args["s3_validated_base3"].rstrip("/")
+PARTITION_ROWS = int(args.get("jdbc_partition_rows", "1000000"))
+NUM_PARTITIONS = int(args.get("jdbc_num_partitions", "8"))
+SNAPSHOT_MODE  = args.get("snapshot_mode", "full").strip().lower()
+COMPACT_EVERY  = int(args.get("compact_every", "7"))
+OVERLAP_MINUTES = int(args.get("delta_overlap_minutes", "15"))
+if SNAPSHOT_MODE not in ("full", "delta"):
+    raise Exception(f"Unsupported snapshot_mode '{SNAPSHOT_MODE}' (expected full or delta)")
 
 sc = SparkContext()
 glueContext = GlueContext(sc)
 spark = glueContext.spark_session
 job = Job(glueContext)
 job.init(args["JOB_NAME"], args)
+perf = StageMetrics(spark, args["JOB_NAME"])
+
+# Extract the three entities concurrently; Spark schedules jobs from each thread
+perf.start("extract")
+entities = [
+    ("zone", "v_mdm_zone_golden_all_v2", S3_BASE, "parquet"),
+    ("vendor", "v_mdm_vendor_golden_all_v2", S3_BASE2, "vendor"),
+    ("ratecode", "v_mdm_rate_code_golden_all_v2", S3_BASE3, "ratecode"),
+]
+with ThreadPoolExecutor(max_workers=len(entities)) as pool:
+    results = list(pool.map(lambda e: _extract_entity(*e), entities))
+
+for r in results:
+    print(f"EXTRACT {r['entity']}: mode={r['mode']} rows={r['rows']} full_rows={r['full_rows']} "
+          f"deltas={len(r['chain']['deltas'])} partitions={r['partitions']} seconds={r['seconds']}")
+
+# Empty snapshots fail the run before any _LATEST pointer moves (an empty delta is just "no changes")
+# row counts are for the folder each pointer targets (the delta folder for a delta run)
+row_counts = {r["entity"]: r["rows"] if r["full_rows"] is None else r["full_rows"] for r in results}
+empty = [r["entity"] for r in results if r["full_rows"] == 0]
+if empty:
+    raise Exception(f"Snapshot is empty for: {empty}")
+
+# Publish _LATEST pointers only after all three snapshot folders are written
+perf.start("publish")
+committed_utc = datetime.now(timezone.utc).isoformat()
+for r in results:
+    pointer_uri = _publish_latest_pointer(r["base_url"], r["out_path"], {
+        "dataset": f"{r['entity']}_snapshot",
+        "snapshot_id": SNAPSHOT_ID,
+        "snapshot_mode": r["mode"],
+        "row_count": row_counts[r["entity"]],
+        "row_counts": row_counts,
+        "committed_utc": committed_utc,
+        **r["chain"],
+    })
+    print(f"LATEST POINTER ({r['entity']}): {pointer_uri}")
 
-out_path_zone   = f"{S3_BASE}/{SNAPSHOT_ID}/parquet"
-out_path_vendor = f"{S3_BASE2}/{SNAPSHOT_ID}/vendor"
-out_path_rate   = f"{S3_BASE3}/{SNAPSHOT_ID}/ratecode"
-
-zone_df = (
-    spark.read.format("jdbc")
-      .option("url", PG_URL)
-      .option("dbtable", "v_mdm_zone_golden_all_v2")
-      .option("user", PG_USER)
-      .option("password", PG_PW)
-      .option("driver", "org.postgresql.Driver")
-      .load()
-      .withColumn("snapshot_id", F.lit(SNAPSHOT_ID))
-      .withColumn("snapshot_ts", F.current_timestamp())
-)
-
-if zone_df.count() == 0:
-    raise Exception("Zone snapshot is empty")
-
-zone_df.write.mode("overwrite").parquet(out_path_zone)
-
-
-vendor_df = (
-    spark.read.format("jdbc")
-      .option("url", PG_URL)
-      .option("dbtable", "v_mdm_vendor_golden_all_v2")
-      .option("user", PG_USER)
-      .option("password", PG_PW)
-      .option("driver", "org.postgresql.Driver")
-      .load()
-      .withColumn("snapshot_id", F.lit(SNAPSHOT_ID))
-      .withColumn("snapshot_ts", F.current_timestamp())
-)
-
-if vendor_df.count() == 0:
-    raise Exception("Vendor snapshot is empty")
-
-vendor_df.write.mode("overwrite").parquet(out_path_vendor)
-
-rate_df = (
-    spark.read.format("jdbc")
-      .option("url", PG_URL)
-      .option("dbtable", "v_mdm_rate_code_golden_all_v2")
-      .option("user", PG_USER)
-      .option("password", PG_PW)
-      .option("driver", "org.postgresql.Driver")
-      .load()
-      .withColumn("snapshot_id", F.lit(SNAPSHOT_ID))
-      .withColumn("snapshot_ts", F.current_timestamp())
-)
-
-if rate_df.count() == 0:
-    raise Exception("Rate code snapshot is empty")
-
-rate_df.write.mode("overwrite").parquet(out_path_rate)
+print(f"STAGE METRICS: {json.dumps(perf.summary())}")
+if args.get("GOV_METRICS_NAMESPACE"):
+    boto3.client("cloudwatch").put_metric_data(Namespace=args["GOV_METRICS_NAMESPACE"], MetricData=perf.metric_data())
 
 job.commit()
@@ -1,13 +1,42 @@
+"""
+MDM zone ingest: reads the zone CSV, scores candidate duplicate pairs and writes the
+batch's records and matches to RDS (idempotent per batch_id).
+
+Small inputs (--local_engine_max_bytes) run in-process without Spark. The Spark path
+times its stages (read, match, write) with stage_metrics.py and prints them as
+STAGE METRICS; with --GOV_METRICS_NAMESPACE they are also published to CloudWatch.
+
+Not deployed by Terraform. Job arguments for the Spark path:
+    --extra-py-files <scripts path>/stage_metrics.py[,<scripts path>/pg_bulk.py]
+    (pg_bulk.py and --additional-python-modules pg8000 only with --pg_writer copy)
+"""
 import sys
+import io
+import re
+import csv
+import math
+import hashlib
+from collections import Counter
+from urllib.parse import urlparse
 import boto3,json
+import numpy as np
+from botocore.exceptions import ClientError
 from awsglue.utils import getResolvedOptions
-from pyspark.context import SparkContext
-from awsglue.context import GlueContext
-from awsglue.job import Job
-from awsglue.dynamicframe import DynamicFrame
-from pyspark.sql import functions as F
 
-args = getResolvedOptions(sys.argv, [
+try:
+    from pyspark.context import SparkContext
+    from awsglue.context import GlueContext
+    from awsglue.job import Job
+    from awsglue.dynamicframe import DynamicFrame
+    from pyspark import StorageLevel
+    from pyspark.sql import functions as F
+    from pyspark.sql import types as T
+except ImportError:
+    # Glue Python shell: only the local engine is available
+    SparkContext = None
+
+argv = sys.argv
+base_args = [
     "JOB_NAME",
     "s3_input_csv",
     "pg_jdbc_url",
@@ -16,7 +45,23 @@ args = getResolvedOptions(sys.argv, [
     "batch_id",
     "auto_merge_threshold",
     "steward_min_threshold",
-])
+]
+# Optional: candidate blocking (none | comma list of token, ngram, sorted_token, phonetic)
+if "--blocking" in argv:
+    base_args.append("blocking")
+if "--ngram_size" in argv:
+    base_args.append("ngram_size")
+# Optional: inputs up to this size run in-process without Spark (needs pg8000)
+if "--local_engine_max_bytes" in argv:
+    base_args.append("local_engine_max_bytes")
+# Optional: RDS writer for the Spark path (glue | copy); copy needs pg_bulk.py via --extra-py-files
+if "--pg_writer" in argv:
+    base_args.append("pg_writer")
+# Optional: CloudWatch namespace for the Spark path's stage metrics
+if "--GOV_METRICS_NAMESPACE" in argv:
+    base_args.append("GOV_METRICS_NAMESPACE")
+
+args = getResolvedOptions(argv, base_args)
 
 secret_id = args["pg_secret_id"]
 
@@ -35,22 +80,382 @@ DB_NAME = args["db_name"]
 BATCH_ID = args["batch_id"]
 AUTO_T = int(args["auto_merge_threshold"])
 STEWARD_T = int(args["steward_min_threshold"])
+BLOCKING = [k.strip() for k in args.get("blocking", "ngram").lower().split(",") if k.strip()]
+NGRAM_Q = int(args.get("ngram_size", "3"))
+LOCAL_MAX_BYTES = int(args["local_engine_max_bytes"]) if "local_engine_max_bytes" in args else None
+PG_WRITER = args.get("pg_writer", "glue").lower()
+if PG_WRITER not in ("glue", "copy"):
+    raise Exception(f"Invalid --pg_writer {PG_WRITER}. Expected glue or copy")
+
+BLOCK_KINDS = ("none", "token", "ngram", "sorted_token", "phonetic")
+unknown = [k for k in BLOCKING if k not in BLOCK_KINDS]
+if not BLOCKING or unknown:
+    raise Exception(f"Invalid --blocking {args.get('blocking')}. Expected none or a list of {BLOCK_KINDS[1:]}")
+
+def norm_col(c):
+    return F.upper(F.trim(F.regexp_replace(F.col(c), r"[^A-Za-z0-9 ]", " ")))
+
+def score_col(dist, max_len):
+    return (
+        F.when(max_len == 0, F.lit(0))
+         .otherwise(F.round((F.lit(1) - (dist / max_len)) * 100).cast("int"))
+    )
+
+def record_hash_col():
+    # same md5(borough|zone|service_zone) the golden SCD2 publish compares on
+    return F.md5(F.concat_ws("|", *[F.coalesce(F.col(c), F.lit("")) for c in ("borough", "zone", "service_zone")]))
+
+# ---------- Run instrumentation ----------
+def _file_scans(spark):
+    """
+    File scans executed so far: scan nodes whose files-read metric fired, per SQL
+    execution. Reads of a persisted frame do not count.
+    """
+    try:
+        store = spark._jsparkSession.sharedState().statusStore()
+        scans = set()
+        it = store.executionsList().iterator()
+        while it.hasNext():
+            e = it.next()
+            vals = store.executionMetrics(e.executionId())
+            mit = e.metrics().iterator()
+            while mit.hasNext():
+                m = mit.next()
+                if m.name() != "number of files read":
+                    continue
+                v = vals.get(m.accumulatorId())
+                if v.isDefined() and v.get() not in ("", "0"):
+                    scans.add((e.executionId(), m.accumulatorId()))
+        return len(scans)
+    except Exception as e:
+        print(f"WARN: could not read SQL scan metrics: {e}")
+        return None
+
+# ---------- Candidate blocking ----------
+def _ngram_short_max(q: int, steward_t: int):
+    """
+    Longest max_len at which a pair can reach steward_t without sharing a q-gram.
+    Each edit destroys at most q q-grams, so strings with max_len L and distance <= k
+    still share L - q + 1 - k*q of them. Pairs up to this length are compared
+    exhaustively; None means no length is safe and n-gram blocking cannot be exact.
+    """
+    c = 1 - (steward_t - 1.5) / 100.0   # slack for score rounding
+    if q * c >= 1:
+        return None
+    short_max = 0
+    for L in range(0, int(q / (1 - q * c)) + 2):
+        k = max(0, math.floor(L * c))
+        if L - q + 1 - k * q < 1:
+            short_max = L
+    return short_max
+
+def _block_keys(dfn, kinds, q):
+    tokens = F.filter(F.split(F.col("zone_norm"), " "), lambda t: t != "")
+    key_exprs = {
+        "token": F.transform(tokens, lambda t: F.concat(F.lit("t:"), t)),
+        "sorted_token": F.array(F.concat(F.lit("s:"), F.concat_ws(" ", F.array_sort(tokens)))),
+        "phonetic": F.transform(tokens, lambda t: F.concat(F.lit("p:"), F.soundex(t))),
+        "ngram": F.expr(
+            f"transform(sequence(1, greatest(length(zone_norm) - {q} + 1, 1)), "
+            f"i -> concat('n:', substring(zone_norm, i, {q})))"
+        ),
+    }
+    keys = F.array_distinct(F.flatten(F.array(*[key_exprs[k] for k in kinds])))
+    return dfn.select("location_id", "borough_norm", F.explode(keys).alias("block_key"))
+
+def _self_pairs(df, on):
+    a = df.alias("a")
+    b = df.alias("b")
+    cond = F.col("a.location_id") < F.col("b.location_id")
+    for c in on:
+        cond = cond & (F.col(f"a.{c}") == F.col(f"b.{c}"))
+    return a.join(b, cond, "inner").select(
+        F.col("a.location_id").alias("location_id_1"),
+        F.col("b.location_id").alias("location_id_2"),
+    )
+
+def _candidate_ids(dfn, kinds, q, steward_t):
+    """
+    Candidate (location_id_1, location_id_2) pairs within a borough. token,
+    sorted_token and phonetic keys trade recall for speed; ngram keys are exact
+    because pairs too short for the q-gram bound are added back exhaustively.
+    """
+    ids = dfn.select("location_id", "borough_norm", "zone_norm")
+    if "none" in kinds:
+        return _self_pairs(ids, ["borough_norm"])
+
+    short = None
+    if "ngram" in kinds:
+        # shorter n-grams keep blocking exact at lower thresholds
+        while _ngram_short_max(q, steward_t) is None and q > 2:
+            q -= 1
+        short_max = _ngram_short_max(q, steward_t)
+        if short_max is None:
+            print(f"BLOCKING: ngram cannot be exact at steward_min_threshold={steward_t}; comparing all pairs")
+            return _self_pairs(ids, ["borough_norm"])
+        short = ids.filter(F.length("zone_norm") <= F.lit(short_max))
+        print(f"BLOCKING: kinds={kinds} q={q} exhaustive_max_len={short_max}")
+    else:
+        print(f"BLOCKING: kinds={kinds}")
+
+    cand = _self_pairs(_block_keys(ids, kinds, q), ["borough_norm", "block_key"])
+    if short is not None:
+        cand = cand.union(_self_pairs(short, ["borough_norm"]))
+    return cand.distinct()
+
+# ---------- Local (Spark-free) engine ----------
+# Same normalize -> dedupe gate -> pair scoring -> classification -> outputs as the
+# Spark path below, reproducing its cast, regex, levenshtein and HALF_UP rounding
+# semantics so both engines write identical rows.
+RECORD_COLS = ["location_id", "borough", "zone", "service_zone", "batch_id", "status", "source_file", "record_hash"]
+MATCH_COLS = [
+    "batch_id", "location_id_1", "location_id_2", "borough", "zone_1", "zone_2",
+    "score", "confidence_tier", "action", "recommended_golden_id",
+]
+
+_NON_ALNUM = re.compile(r"[^A-Za-z0-9 ]")
+_WS = re.compile(r"\s+")
+_INT_STR = re.compile(r"([+-]?)([0-9]*)(\.[0-9]*)?")
+# UTF8String.trimAll: the ASCII bytes Java's Character.isWhitespace accepts (not NUL or DEL)
+_CAST_TRIM = "\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f "
+
+def _split_s3_url(url: str):
+    p = urlparse(url)
+    return p.netloc, p.path.lstrip("/")
+
+def _input_size_bytes(s3_url: str):
+    bucket, key = _split_s3_url(s3_url)
+    try:
+        return boto3.client("s3").head_object(Bucket=bucket, Key=key)["ContentLength"]
+    except ClientError:
+        return None   # prefix or missing object: leave it to Spark
+
+def _to_int(v):
+    # Spark's non-ANSI string -> int cast: trims whitespace, truncates a fraction
+    if v is None:
+        return None
+    t = v.strip(_CAST_TRIM)
+    m = _INT_STR.fullmatch(t)
+    if not m or t in ("", "+", "-"):
+        return None
+    n = int(m.group(2) or "0") * (-1 if m.group(1) == "-" else 1)
+    return n if -2**31 <= n < 2**31 else None
+
+def _norm_local(v: str):
+    return _NON_ALNUM.sub(" ", v).strip(" ").upper()
+
+def _record_hash_local(r):
+    return hashlib.md5("|".join(r[c] or "" for c in ("borough", "zone", "service_zone")).encode("utf-8")).hexdigest()
+
+def _first_data_key(s3, bucket: str, prefix: str):
+    """First non-empty object under a folder prefix, skipping the _ / . files Spark ignores."""
+    prefix = prefix if not prefix or prefix.endswith("/") else prefix + "/"
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        for o in page.get("Contents", []):
+            parts = o["Key"][len(prefix):].split("/")
+            if o["Size"] > 0 and not any(p.startswith(("_", ".")) for p in parts):
+                return o["Key"]
+    return None
+
+def _csv_header(s3_url: str):
+    """
+    Header row of the CSV from a ranged GET of its first 64 KiB (no Spark job). A folder
+    input takes the header of its first data file; None when there is none to read.
+    """
+    bucket, key = _split_s3_url(s3_url)
+    s3 = boto3.client("s3")
+    head = None
+    if key and not key.endswith("/"):
+        try:
+            head = s3.get_object(Bucket=bucket, Key=key, Range="bytes=0-65535")["Body"].read()
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404", "InvalidRange"):
+                raise
+    if head is None:
+        first = _first_data_key(s3, bucket, key)
+        if first is None:
+            return None
+        head = s3.get_object(Bucket=bucket, Key=first, Range="bytes=0-65535")["Body"].read()
+    for row in csv.reader(io.StringIO(head.decode("utf-8", errors="replace"), newline=""), escapechar="\\"):
+        if row:
+            return row
+    raise Exception(f"No header row in {s3_url}")
+
+def _read_csv_local(s3_url: str):
+    bucket, key = _split_s3_url(s3_url)
+    body = boto3.client("s3").get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8")
+    rows = [r for r in csv.reader(io.StringIO(body, newline=""), escapechar="\\") if r]
+    header = [c.strip().lower() for c in rows[0]]
+    missing_cols = [c for c in ["locationid", "borough", "zone", "service_zone"] if c not in header]
+    if missing_cols:
+        raise Exception(f"Missing columns in CSV: {missing_cols}. Found: {header}")
+
+    out = []
+    for r in rows[1:]:
+        # empty fields read as null, short rows padded, like Spark's CSV reader
+        rec = dict(zip(header, [v if v != "" else None for v in r] + [None] * (len(header) - len(r))))
+        out.append({
+            "location_id": _to_int(rec["locationid"]),
+            "borough": rec["borough"],
+            "zone": rec["zone"],
+            "service_zone": rec["service_zone"],
+        })
+    return [r for r in out if r["location_id"] is not None and r["borough"] is not None and r["zone"] is not None]
+
+def _levenshtein_many(left, right, chunk: int = 4096):
+    """
+    Edit distance for aligned lists of ASCII strings, vectorized across pairs.
+    Each DP row is built with whole-array ops; the insertion chain is a running
+    minimum of (x[k] - k) + j. Pairs are processed in length-sorted chunks so the
+    padded arrays stay small.
+    """
+    la = np.array([len(v) for v in left], dtype=np.int32)
+    lb = np.array([len(v) for v in right], dtype=np.int32)
+    out = np.where(la == 0, lb, 0).astype(np.int32)
+    order = np.argsort(la, kind="stable")
+    for start in range(0, len(order), chunk):
+        idx = order[start:start + chunk]
+        n, wa, wb = len(idx), int(la[idx].max()), int(lb[idx].max())
+        if wa == 0:
+            continue
+        A = np.frombuffer("".join(left[k].ljust(wa, "\0") for k in idx).encode("ascii"), dtype=np.uint8).reshape(n, wa)
+        B = np.frombuffer("".join(right[k].ljust(wb, "\0") for k in idx).encode("ascii"), dtype=np.uint8).reshape(n, wb)
+        ca, cb = la[idx], lb[idx]
+
+        steps = np.arange(wb + 1, dtype=np.int32)
+        prev = np.broadcast_to(steps, (n, wb + 1))
+        res = out[idx]
+        x = np.empty((n, wb + 1), dtype=np.int32)
+        for i in range(1, wa + 1):
+            x[:, 0] = i
+            np.minimum(prev[:, :-1] + (A[:, i - 1][:, None] != B), prev[:, 1:] + 1, out=x[:, 1:])
+            cur = np.minimum.accumulate(x - steps, axis=1) + steps
+            done = ca == i
+            res[done] = cur[done, cb[done]]
+            prev = cur
+        out[idx] = res
+    return out
+
+def _score_local(dist, max_len):
+    # F.round on a double is HALF_UP; x - floor(x) is exact for these magnitudes
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = (1 - dist / max_len) * 100.0
+        fl = np.floor(x)
+        score = fl + ((x - fl) >= 0.5)
+    return np.where(max_len == 0, 0, score).astype(np.int64)
+
+def _match_local(df_rows):
+    by_borough = {}
+    for r in sorted(df_rows, key=lambda r: r["location_id"]):
+        by_borough.setdefault(_norm_local(r["borough"]), []).append(r)
+
+    matches = []
+    for group in by_borough.values():
+        zn = [_WS.sub(" ", _norm_local(r["zone"])) for r in group]
+        i1, i2 = np.triu_indices(len(group), k=1)   # ids ascend, so i1 is location_id_1
+        if len(i1) == 0:
+            continue
+        zl = np.array([len(v) for v in zn], dtype=np.int64)
+        max_len = np.maximum(zl[i1], zl[i2])
+
+        # Length pruning: dist >= |len1 - len2| bounds the score from above
+        keep = _score_local(np.abs(zl[i1] - zl[i2]), max_len) >= STEWARD_T
+        i1, i2, max_len = i1[keep], i2[keep], max_len[keep]
+        dist = _levenshtein_many([zn[i] for i in i1], [zn[j] for j in i2])
+        score = _score_local(dist.astype(np.int64), max_len)
+        keep = score >= STEWARD_T
+        for i, j, sc_ in zip(i1[keep], i2[keep], score[keep]):
+            a, b = group[i], group[j]
+            if len(a["zone"]) > len(b["zone"]):
+                golden = a["location_id"]
+            elif len(b["zone"]) > len(a["zone"]):
+                golden = b["location_id"]
+            else:
+                golden = min(a["location_id"], b["location_id"])
+            auto = sc_ >= AUTO_T
+            matches.append({
+                "batch_id": BATCH_ID,
+                "location_id_1": a["location_id"],
+                "location_id_2": b["location_id"],
+                "borough": a["borough"],
+                "zone_1": a["zone"],
+                "zone_2": b["zone"],
+                "score": int(sc_),
+                "confidence_tier": "HIGH" if auto else "MEDIUM",
+                "action": "AUTO_MERGE" if auto else "STEWARD_REVIEW",
+                "recommended_golden_id": golden,
+            })
+    return matches
+
+def _run_local_engine():
+    df_rows = _read_csv_local(S3_INPUT)
+
+    dup_cnt = sum(1 for c in Counter(r["location_id"] for r in df_rows).values() if c > 1)
+    if dup_cnt > 0:
+        raise Exception(f"Data quality failed: duplicate LocationID found: {dup_cnt}")
+
+    matches = _match_local(df_rows)
+    pending = {m[k] for m in matches if m["action"] == "STEWARD_REVIEW" for k in ("location_id_1", "location_id_2")}
+    records = [
+        {
+            "location_id": r["location_id"],
+            "borough": r["borough"],
+            "zone": r["zone"],
+            "service_zone": r["service_zone"],
+            "batch_id": BATCH_ID,
+            "status": "PENDING" if r["location_id"] in pending else "APPROVED",
+            "source_file": S3_INPUT,
+            "record_hash": _record_hash_local(r),
+        }
+        for r in sorted(df_rows, key=lambda r: r["location_id"])
+    ]
+
+    import pg_bulk
+
+    params = pg_bulk.pg_connect_params(PG_URL, PG_USER, PG_PW, DB_NAME)
+    for table, rows, cols in [
+        ("mdm_zone_record_v2", records, RECORD_COLS),
+        ("mdm_zone_match_v2", matches, MATCH_COLS),
+    ]:
+        stats = pg_bulk.bulk_write_rows([tuple(r[c] for c in cols) for r in rows], params, table, cols, BATCH_ID)
+        print(f"PG WRITE: {stats}")
+    print(f"LOCAL ENGINE: records={len(records)} matches={len(matches)} pending={len(pending)}")
+
+# ---------- Engine selection ----------
+input_bytes = _input_size_bytes(S3_INPUT) if LOCAL_MAX_BYTES is not None else None
+if input_bytes is not None and input_bytes <= LOCAL_MAX_BYTES:
+    print(f"ENGINE: local ({input_bytes} bytes <= {LOCAL_MAX_BYTES})")
+    _run_local_engine()
+    sys.exit(0)
+if SparkContext is None:
+    raise Exception(f"Spark is not available and {S3_INPUT} exceeds local_engine_max_bytes")
+
+from stage_metrics import StageMetrics
 
 sc = SparkContext()
 glueContext = GlueContext(sc)
 spark = glueContext.spark_session
 job = Job(glueContext)
 job.init(args["JOB_NAME"], args)
+perf = StageMetrics(spark, args["JOB_NAME"])
 
-def norm_col(c):
-    return F.upper(F.trim(F.regexp_replace(F.col(c), r"[^A-Za-z0-9 ]", " ")))
+perf.start("read")
 
-# ---------- Read CSV and normalize headers ----------
-raw = spark.read.option("header", "true").option("inferSchema", "false").csv(S3_INPUT)
+# ---------- Read CSV with an explicit schema ----------
+# All-string schema named after the file's own header row (read with a ranged GET), so
+# no header-inference job runs before the real scan; headers are then normalized to
+# lowercase and the columns picked by name, so order, case and extra columns don't matter.
+# Without a readable header object Spark infers the header itself (still all strings).
+csv_header = _csv_header(S3_INPUT)
+reader = spark.read.option("header", "true")
+if csv_header is not None:
+    reader = reader.schema(T.StructType([T.StructField(c, T.StringType(), True) for c in csv_header]))
+else:
+    print(f"WARN: no header object found under {S3_INPUT}; inferring the header with Spark")
+raw = reader.csv(S3_INPUT)
 
 # normalize headers to lowercase for safety
-for c in raw.columns:
-    raw = raw.withColumnRenamed(c, c.strip().lower())
+raw = raw.toDF(*[c.strip().lower() for c in raw.columns])
 
 # Expected columns after lowercasing: locationid, borough, zone, service_zone
 required = ["locationid", "borough", "zone", "service_zone"]
@@ -68,35 +473,36 @@ df = (
     .na.drop(subset=["location_id", "borough", "zone"])
 )
 
-# ---------- Quality gate: unique location_id ----------
-dup_cnt = (
-    df.groupBy("location_id").count()
-      .filter(F.col("count") > 1)
-      .count()
-)
-if dup_cnt > 0:
-    raise Exception(f"Data quality failed: duplicate LocationID found: {dup_cnt}")
-
-# ---------- Normalize for matching ----------
+# ---------- Normalize for matching (materialized once) ----------
 dfn = (
     df.withColumn("borough_norm", norm_col("borough"))
       .withColumn("zone_norm", norm_col("zone"))
       .withColumn("zone_norm", F.regexp_replace(F.col("zone_norm"), r"\s+", " "))
+      .persist(StorageLevel.MEMORY_AND_DISK)
 )
 
+# ---------- Quality gate: unique location_id ----------
+# One action scans the CSV and fills the cache; the grouped count only runs on failure
+gate = dfn.agg(F.count(F.lit(1)).alias("rows"), F.countDistinct("location_id").alias("ids")).first()
+if gate["rows"] != gate["ids"]:
+    dup_cnt = (
+        dfn.groupBy("location_id").count()
+           .filter(F.col("count") > 1)
+           .count()
+    )
+    raise Exception(f"Data quality failed: duplicate LocationID found: {dup_cnt}")
+
+perf.start("match")
 a = dfn.alias("a")
 b = dfn.alias("b")
 
 pairs = (
-    a.join(
-        b,
-        (F.col("a.borough_norm") == F.col("b.borough_norm")) &
-        (F.col("a.location_id") < F.col("b.location_id")),
-        "inner"
-    )
+    _candidate_ids(dfn, BLOCKING, NGRAM_Q, STEWARD_T)
+    .join(a, F.col("location_id_1") == F.col("a.location_id"), "inner")
+    .join(b, F.col("location_id_2") == F.col("b.location_id"), "inner")
     .select(
-        F.col("a.location_id").alias("location_id_1"),
-        F.col("b.location_id").alias("location_id_2"),
+        F.col("location_id_1"),
+        F.col("location_id_2"),
         F.col("a.borough").alias("borough"),
         F.col("a.zone").alias("zone_1"),
         F.col("b.zone").alias("zone_2"),
@@ -105,19 +511,21 @@ pairs = (
     )
 )
 
+# Length pruning: dist >= |len1 - len2|, so this is an upper bound on score
+len_1 = F.length("zone_1_norm")
+len_2 = F.length("zone_2_norm")
+pairs = pairs.filter(score_col(F.abs(len_1 - len_2), F.greatest(len_1, len_2)) >= F.lit(STEWARD_T))
+
 pairs = (
     pairs.withColumn("max_len", F.greatest(F.length("zone_1_norm"), F.length("zone_2_norm")))
          .withColumn("dist", F.levenshtein("zone_1_norm", "zone_2_norm"))
-         .withColumn(
-             "score",
-             F.when(F.col("max_len") == 0, F.lit(0))
-              .otherwise(F.round((F.lit(1) - (F.col("dist") / F.col("max_len"))) * 100).cast("int"))
-         )
+         .withColumn("score", score_col(F.col("dist"), F.col("max_len")))
          .drop("max_len", "dist", "zone_1_norm", "zone_2_norm")
 )
 
 pairs = pairs.filter(F.col("score") >= F.lit(STEWARD_T))
 
+# Scored pairs are materialized once and reused by pending_ids and the match write
 classified = (
     pairs.withColumn(
             "action",
@@ -136,7 +544,9 @@ classified = (
              .otherwise(F.least(F.col("location_id_1"), F.col("location_id_2")))
     )
     .withColumn("batch_id", F.lit(BATCH_ID))
+    .persist(StorageLevel.MEMORY_AND_DISK)
 )
+match_cnt = classified.count()
 
 pending_ids = (
     classified.filter(F.col("action") == "STEWARD_REVIEW")
@@ -148,10 +558,11 @@ pending_ids = (
 )
 
 records = (
-    df.select("location_id", "borough", "zone", "service_zone")
+    dfn.select("location_id", "borough", "zone", "service_zone")
       .withColumn("batch_id", F.lit(BATCH_ID))
       .withColumn("status", F.lit("APPROVED"))
       .withColumn("source_file", F.lit(S3_INPUT))
+      .withColumn("record_hash", record_hash_col())
 )
 
 records = (
@@ -174,36 +585,57 @@ matches_out = classified.select(
 )
 
 # ---------- Write to RDS (idempotent per batch_id) ----------
-pre_rec = f"DELETE FROM mdm_zone_record_v2 WHERE batch_id = '{BATCH_ID}';"
-pre_match = f"DELETE FROM mdm_zone_match_v2 WHERE batch_id = '{BATCH_ID}';"
-
-rec_dyf = DynamicFrame.fromDF(records, glueContext, "rec_dyf")
-match_dyf = DynamicFrame.fromDF(matches_out, glueContext, "match_dyf")
-
-glueContext.write_dynamic_frame.from_options(
-    frame=rec_dyf,
-    connection_type="postgresql",
-    connection_options={
-        "url": PG_URL,
-        "user": PG_USER,
-        "password": PG_PW,
-        "dbtable": "mdm_zone_record_v2",
-        "database": DB_NAME,
-        "preactions": pre_rec,
-    }
-)
+perf.start("write")
+if PG_WRITER == "copy":
+    import pg_bulk
 
-glueContext.write_dynamic_frame.from_options(
-    frame=match_dyf,
-    connection_type="postgresql",
-    connection_options={
-        "url": PG_URL,
-        "user": PG_USER,
-        "password": PG_PW,
-        "dbtable": "mdm_zone_match_v2",
-        "database": DB_NAME,
-        "preactions": pre_match,
-    }
-)
+    pg_params = pg_bulk.pg_connect_params(PG_URL, PG_USER, PG_PW, DB_NAME)
+    for table, frame in [("mdm_zone_record_v2", records), ("mdm_zone_match_v2", matches_out)]:
+        stats = pg_bulk.bulk_write_df(frame, pg_params, table, BATCH_ID)
+        print(f"PG WRITE: {stats}")
+else:
+    batch_lit = BATCH_ID.replace("'", "''")
+    pre_rec = f"DELETE FROM mdm_zone_record_v2 WHERE batch_id = '{batch_lit}';"
+    pre_match = f"DELETE FROM mdm_zone_match_v2 WHERE batch_id = '{batch_lit}';"
+
+    rec_dyf = DynamicFrame.fromDF(records, glueContext, "rec_dyf")
+    match_dyf = DynamicFrame.fromDF(matches_out, glueContext, "match_dyf")
+
+    glueContext.write_dynamic_frame.from_options(
+        frame=rec_dyf,
+        connection_type="postgresql",
+        connection_options={
+            "url": PG_URL,
+            "user": PG_USER,
+            "password": PG_PW,
+            "dbtable": "mdm_zone_record_v2",
+            "database": DB_NAME,
+            "preactions": pre_rec,
+        }
+    )
+
+    glueContext.write_dynamic_frame.from_options(
+        frame=match_dyf,
+        connection_type="postgresql",
+        connection_options={
+            "url": PG_URL,
+            "user": PG_USER,
+            "password": PG_PW,
+            "dbtable": "mdm_zone_match_v2",
+            "database": DB_NAME,
+            "preactions": pre_match,
+        }
+    )
+
+classified.unpersist()
+dfn.unpersist()
+
+stage_metrics = perf.summary()
+print(f"STAGE METRICS: {json.dumps(stage_metrics)}")
+if args.get("GOV_METRICS_NAMESPACE"):
+    boto3.client("cloudwatch").put_metric_data(Namespace=args["GOV_METRICS_NAMESPACE"], MetricData=perf.metric_data())
+
+spark_jobs = len(perf.job_ids())
+print(f"RUN STATS: rows={gate['rows']} matches={match_cnt} spark_jobs={spark_jobs} input_scans={_file_scans(spark)}")
 
 job.commit()
\ No newline at end of file
@@ -0,0 +1,155 @@
+"""
+Stage-level timing and Spark task metrics for the Glue jobs.
+
+A job marks its logical stages in order (read, cast, validate, join, write,
+metrics). Every Spark job started while a stage is open runs under the job group
+"<job name>:<stage>", so the task metrics Spark's status listener aggregates per
+Spark stage (input bytes, shuffle read/write, spill, GC time) can be summed back
+onto the logical stage that triggered them. They are read from the application
+status store in the driver, so they do not need the Spark UI (spark.ui.enabled). Spark is lazy: the read/cast/validate
+work of a DataFrame shows up under the stage whose action (usually write) runs it.
+
+    perf = StageMetrics(spark, args["JOB_NAME"])
+    perf.start("read")
+    ...
+    perf.start("write")
+    ...
+    perf.stop()
+    metrics["stage_metrics"] = perf.summary()
+    cw.put_metric_data(Namespace=ns, MetricData=gauges + perf.metric_data())
+
+Ship with --extra-py-files <s3 path>/stage_metrics.py.
+"""
+import time
+
+# Spark StageData field (status store, same names as the REST API) -> summary key
+TASK_METRICS = {
+    "inputBytes": "input_bytes",
+    "outputBytes": "output_bytes",
+    "shuffleReadBytes": "shuffle_read_bytes",
+    "shuffleWriteBytes": "shuffle_write_bytes",
+    "memoryBytesSpilled": "memory_spilled_bytes",
+    "diskBytesSpilled": "disk_spilled_bytes",
+    "jvmGcTime": "jvm_gc_ms",
+    "executorRunTime": "executor_run_ms",
+}
+
+# summary key -> (CloudWatch metric name, unit)
+CLOUDWATCH_METRICS = {
+    "seconds": ("StageSeconds", "Seconds"),
+    "input_bytes": ("StageInputBytes", "Bytes"),
+    "shuffle_read_bytes": ("StageShuffleReadBytes", "Bytes"),
+    "shuffle_write_bytes": ("StageShuffleWriteBytes", "Bytes"),
+    "memory_spilled_bytes": ("StageMemorySpilledBytes", "Bytes"),
+    "disk_spilled_bytes": ("StageDiskSpilledBytes", "Bytes"),
+    "jvm_gc_ms": ("StageGcTime", "Milliseconds"),
+}
+
+
+def _scala_iter(seq):
+    it = seq.iterator()
+    while it.hasNext():
+        yield it.next()
+
+
+class StageMetrics:
+    def __init__(self, spark, job_name: str):
+        self.sc = spark.sparkContext
+        self.job_name = job_name
+        self.stages = {}   # name -> {"seconds": float}, in first-start order
+        self._current = None
+        self._started = None
+        self._t0 = time.time()
+        self._summary = None
+
+    def _group(self, name: str) -> str:
+        return f"{self.job_name}:{name}"
+
+    def start(self, name: str) -> None:
+        """Closes the open stage (if any) and opens `name`; re-opening a stage adds to it."""
+        self.stop()
+        self._current = name
+        self._started = time.time()
+        self.stages.setdefault(name, {"seconds": 0.0})
+        self.sc.setJobGroup(self._group(name), f"{self.job_name} {name}")
+
+    def attach(self) -> None:
+        """Runs the calling thread's Spark jobs under the open stage (job groups are per thread)."""
+        if self._current is not None:
+            self.sc.setJobGroup(self._group(self._current), f"{self.job_name} {self._current}")
+
+    def stop(self) -> None:
+        if self._current is None:
+            return
+        self.stages[self._current]["seconds"] += time.time() - self._started
+        self._current = None
+        self.sc.setLocalProperty("spark.jobGroup.id", None)
+        self.sc.setLocalProperty("spark.job.description", None)
+
+    def job_ids(self) -> list:
+        """Ids of the Spark jobs run under the logical stages so far."""
+        tracker = self.sc.statusTracker()
+        return sorted(j for name in self.stages for j in tracker.getJobIdsForGroup(self._group(name)))
+
+    def _task_metrics_by_stage(self) -> dict:
+        """{logical stage: summed task metrics} from the status listener's store (the REST API's source)."""
+        store = self.sc._jsc.sc().statusStore()
+        groups = {self._group(name): name for name in self.stages}
+        owner = {}
+        # a Spark stage reused by a later job (e.g. a cached shuffle) counts once, for its first job
+        for job in sorted(_scala_iter(store.jobsList(None)), key=lambda j: j.jobId()):
+            group = job.jobGroup()
+            name = groups.get(group.get()) if group.isDefined() else None
+            if name is None:
+                continue
+            for stage_id in _scala_iter(job.stageIds()):
+                owner.setdefault(stage_id, name)
+
+        totals = {name: {key: 0 for key in TASK_METRICS.values()} for name in self.stages}
+        # Spark 3.3 signature with its defaults spelled out (py4j does not apply Scala defaults):
+        # stageList(statuses = all, details, withSummaries, unsortedQuantiles, taskStatus)
+        gateway = self.sc._gateway
+        stages = store.stageList(None, False, False, gateway.new_array(gateway.jvm.double, 0),
+                                 gateway.jvm.java.util.ArrayList())
+        for stage in _scala_iter(stages):
+            name = owner.get(stage.stageId())
+            if name is None or stage.status().toString() not in ("COMPLETE", "FAILED"):
+                continue
+            for field, key in TASK_METRICS.items():
+                totals[name][key] += getattr(stage, field)()
+        return totals
+
+    def summary(self) -> dict:
+        """Closes the open stage and returns the JSON-ready per-stage breakdown."""
+        self.stop()
+        stages = {name: {"seconds": round(s["seconds"], 3)} for name, s in self.stages.items()}
+        source = "spark_status_store"
+        try:
+            for name, totals in self._task_metrics_by_stage().items():
+                stages[name].update(totals)
+        except Exception as e:
+            # timings are still worth publishing without the task metrics
+            print(f"STAGE METRICS: Spark task metrics unavailable ({e})")
+            source = None
+        self._summary = {
+            "job_seconds": round(time.time() - self._t0, 3),
+            "task_metrics_source": source,
+            "stages": stages,
+        }
+        return self._summary
+
+    def metric_data(self) -> list:
+        """CloudWatch MetricData (JobName + Stage dimensions) for the last summary()."""
+        summary = self._summary or self.summary()
+        data = [{
+            "MetricName": "JobSeconds",
+            "Dimensions": [{"Name": "JobName", "Value": self.job_name}],
+            "Value": float(summary["job_seconds"]),
+            "Unit": "Seconds",
+        }]
+        for name, stage in summary["stages"].items():
+            dims = [{"Name": "JobName", "Value": self.job_name}, {"Name": "Stage", "Value": name}]
+            for key, (metric, unit) in CLOUDWATCH_METRICS.items():
+                if key in stage:
+                    data.append({"MetricName": metric, "Dimensions": dims, "Value": float(stage[key]), "Unit": unit})
+        return data
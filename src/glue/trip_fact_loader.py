@@ -0,0 +1,550 @@
+"""
+Incremental, run-scoped load of final_fact.trip_fact.
+
+Only the curated files of one run_id are read and joined to the dimensions, so a
+load costs the size of the run instead of the whole history (09_fact.sql stays the
+one-off full rebuild). Every load appends rows/seconds to
+final_fact.trip_fact_load_log (14_fact_incremental.sql).
+
+Scopes (--scope):
+  run       (default) the run holds only new trips (--incremental true upstream): the
+            fact rows of run_id are replaced, other runs are kept.
+  full      the run holds the whole history (glue_raw_to_validated.py without
+            --incremental re-reads all of raw/trips/): every fact row is replaced by
+            the run's rows. Opt-in only, it deletes every other run.
+Both delete and insert in one transaction, so rerunning a run_id never duplicates it.
+
+Layouts (--layout):
+  curated   flat curated rows (natural ids); the surrogate keys are resolved here with
+            the 09_fact.sql LEFT JOINs.
+  fact      load-ready rows written by glue_enrich_to_curated.py --fact_prefix, keys
+            already resolved in Spark from the exported key maps (16_fact_key_maps.sql):
+            the columnar COPY is followed by a join-free INSERT ... SELECT.
+
+Sources (--source):
+  copy      Redshift COPY of the run's files through a manifest: the compaction
+            _MANIFEST.json of the run folder when present, else one generated under
+            --manifest_prefix. COPY maps parquet columns by position, so the curated
+            layout (whose columns depend on the enrich engine, partition layout and TLC
+            vintage) is staged in a temp table declared from the parquet footer of the
+            run's first file; the fact layout is staged in final_staging.trip_fact_run,
+            whose columns are written in that order by glue_enrich_to_curated.py.
+  spectrum  INSERT ... SELECT from the Spectrum table filtered on its run partition
+            column (--spectrum_run_column), no staging copy.
+  local     Parquet files under <local_root>/<bucket>/<curated prefix>run_id=<id>/
+            streamed with COPY FROM STDIN (pg_bulk) into final_staging.trip_fact_stage
+            (curated layout) or final_staging.trip_fact_keyed_stage (fact layout) of a
+            Postgres stand-in.
+
+Needs pg8000 and pyarrow (plus boto3 for --source copy), with lake_io.py next to it
+(--extra-py-files for a Glue Python shell job). Self-check against a local Postgres:
+
+    python trip_fact_loader.py --selfcheck --host localhost --user postgres --database postgres
+"""
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from lake_io import is_data_file
+
+FACT_TABLE = "final_fact.trip_fact"
+LOAD_LOG_TABLE = "final_fact.trip_fact_load_log"
+COPY_STAGE_TABLE = "trips_curated_run"   # TEMP table, declared per load from the parquet schema
+LOCAL_STAGE_TABLE = "final_staging.trip_fact_stage"
+KEYED_COPY_STAGE_TABLE = "final_staging.trip_fact_run"
+KEYED_LOCAL_STAGE_TABLE = "final_staging.trip_fact_keyed_stage"
+
+# curated columns the fact needs (lower case; parquet names are matched case-insensitively)
+STAGE_COLUMNS = [
+    "vendorid", "ratecodeid", "payment_type", "pulocationid", "dolocationid",
+    "tpep_pickup_datetime", "tpep_dropoff_datetime", "passenger_count", "trip_distance",
+    "fare_amount", "extra", "mta_tax", "tip_amount", "tolls_amount", "improvement_surcharge",
+    "total_amount", "congestion_surcharge", "airport_fee", "cbd_congestion_fee",
+    "run_id", "ingested_at_utc",
+]
+
+# curated columns copied as-is into the fact (a column missing from an older vintage loads as NULL)
+CURATED_MEASURES = [
+    "tpep_pickup_datetime", "tpep_dropoff_datetime", "passenger_count", "trip_distance",
+    "fare_amount", "extra", "mta_tax", "tip_amount", "tolls_amount", "improvement_surcharge",
+    "total_amount", "congestion_surcharge", "airport_fee", "cbd_congestion_fee",
+]
+
+# same column mapping, unknown-member defaults and LEFT JOINs as 09_fact.sql, for one run
+FACT_INSERT_SQL = """
+INSERT INTO {fact} (
+  vendor_sk, ratecode_sk, payment_type_sk, pickup_zone_sk, dropoff_zone_sk,
+  pickup_datetime, dropoff_datetime, passenger_count, trip_distance,
+  fare_amount, extra, mta_tax, tip_amount, tolls_amount, improvement_surcharge,
+  total_amount, congestion_surcharge, airport_fee, cbd_congestion_fee,
+  run_id, ingested_at_utc
+)
+SELECT
+  v.vendor_sk, r.ratecode_sk, p.payment_type_sk, zpu.zone_sk, zdo.zone_sk,
+  {measures},
+  %s, {ingested_at_utc}
+FROM {source} t
+LEFT JOIN final_dim.vendor_dim v
+  ON v.vendor_id = t.vendorid
+LEFT JOIN final_dim.ratecode_dim r
+  ON r.rate_code_id = COALESCE(t.ratecodeid, 99)
+LEFT JOIN final_dim.payment_type_dim p
+  ON p.payment_type_id = COALESCE(t.payment_type, 5)
+LEFT JOIN final_dim.zone_dim zpu
+  ON zpu.location_id = t.pulocationid
+LEFT JOIN final_dim.zone_dim zdo
+  ON zdo.location_id = t.dolocationid
+{where}
+"""
+
+
+# final_fact.trip_fact columns in the order of the fact-layout parquet (no identity / created_at)
+KEYED_COLUMNS = [
+    "vendor_sk", "ratecode_sk", "payment_type_sk", "pickup_zone_sk", "dropoff_zone_sk",
+    "pickup_datetime", "dropoff_datetime", "passenger_count", "trip_distance",
+    "fare_amount", "extra", "mta_tax", "tip_amount", "tolls_amount", "improvement_surcharge",
+    "total_amount", "congestion_surcharge", "airport_fee", "cbd_congestion_fee",
+    "run_id", "ingested_at_utc",
+]
+
+# keys resolved upstream: a straight projection, no joins
+KEYED_INSERT_SQL = f"""
+INSERT INTO {{fact}} ({", ".join(KEYED_COLUMNS[:-2])}, run_id, ingested_at_utc)
+SELECT {", ".join(f"t.{c}" for c in KEYED_COLUMNS[:-2])}, %s, t.ingested_at_utc
+FROM {{source}} t
+{{where}}
+"""
+
+# layout -> (insert SQL, parquet columns, COPY stage, local stage, default prefix, default Spectrum table)
+LAYOUTS = {
+    "curated": (FACT_INSERT_SQL, STAGE_COLUMNS, COPY_STAGE_TABLE, LOCAL_STAGE_TABLE,
+                "curated/trips_enriched/", "spectrum.trips_curated"),
+    "fact": (KEYED_INSERT_SQL, KEYED_COLUMNS, KEYED_COPY_STAGE_TABLE, KEYED_LOCAL_STAGE_TABLE,
+             "curated/trip_fact/", "spectrum.trip_fact_run"),
+}
+
+
+def _connect(params: dict):
+    import pg8000.dbapi
+
+    return pg8000.dbapi.connect(**params)
+
+
+# ----------------------------
+# Run file resolution
+# ----------------------------
+def run_manifest_s3(bucket: str, curated_prefix: str, run_id: str, manifest_prefix: str, s3=None) -> str:
+    """
+    S3 URI of a COPY manifest holding exactly the run's curated files: the compaction
+    manifest of the run folder if there is one, else a generated <manifest_prefix>run_id=<id>.manifest.
+    """
+    import boto3
+    from botocore.exceptions import ClientError
+
+    s3 = s3 or boto3.client("s3")
+    run_prefix = f"{curated_prefix}run_id={run_id}/"
+    try:
+        s3.head_object(Bucket=bucket, Key=f"{run_prefix}_MANIFEST.json")
+        return f"s3://{bucket}/{run_prefix}_MANIFEST.json"
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+            raise
+
+    entries = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=run_prefix):
+        for obj in page.get("Contents", []):
+            if is_data_file(obj["Key"]):
+                # COPY ... FORMAT AS PARQUET needs meta.content_length
+                entries.append({"url": f"s3://{bucket}/{obj['Key']}", "mandatory": True,
+                                "meta": {"content_length": obj["Size"]}})
+    if not entries:
+        raise Exception(f"No curated files under s3://{bucket}/{run_prefix}")
+    key = f"{manifest_prefix}run_id={run_id}.manifest"
+    s3.put_object(Bucket=bucket, Key=key, Body=json.dumps({"entries": entries}, indent=2).encode("utf-8"),
+                  ContentType="application/json")
+    return f"s3://{bucket}/{key}"
+
+
+def manifest_files(manifest_uri: str, s3=None):
+    """Data file URIs listed by a COPY manifest (generated or compaction _MANIFEST.json)."""
+    import boto3
+
+    s3 = s3 or boto3.client("s3")
+    bucket, key = manifest_uri[len("s3://"):].split("/", 1)
+    body = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    return [e["url"] for e in json.loads(body.decode("utf-8"))["entries"]]
+
+
+def parquet_schema_s3(uri: str, s3=None):
+    """Arrow schema of an S3 parquet file, read from its footer only (no data pages)."""
+    import boto3
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    s3 = s3 or boto3.client("s3")
+    bucket, key = uri[len("s3://"):].split("/", 1)
+    size = s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
+    # file tail: <footer><4-byte little-endian footer length>PAR1
+    tail = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={size - 8}-")["Body"].read()
+    footer_len = int.from_bytes(tail[:4], "little")
+    footer = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={size - 8 - footer_len}-")["Body"].read()
+    return pq.read_schema(pa.BufferReader(b"PAR1" + footer))
+
+
+def _redshift_type(arrow_type) -> str:
+    import pyarrow.types as pat
+
+    if pat.is_boolean(arrow_type):
+        return "BOOLEAN"
+    if pat.is_int8(arrow_type) or pat.is_int16(arrow_type):
+        return "SMALLINT"
+    if pat.is_int32(arrow_type):
+        return "INTEGER"
+    if pat.is_int64(arrow_type):
+        return "BIGINT"
+    if pat.is_float16(arrow_type) or pat.is_float32(arrow_type):
+        return "REAL"
+    if pat.is_float64(arrow_type):
+        return "DOUBLE PRECISION"
+    if pat.is_decimal(arrow_type):
+        return f"DECIMAL({arrow_type.precision},{arrow_type.scale})"
+    if pat.is_string(arrow_type) or pat.is_large_string(arrow_type):
+        return "VARCHAR(65535)"
+    if pat.is_timestamp(arrow_type):
+        return "TIMESTAMP"
+    if pat.is_date(arrow_type):
+        return "DATE"
+    raise Exception(f"No Redshift column type for parquet type {arrow_type}")
+
+
+def copy_stage_ddl(table: str, schema) -> str:
+    """TEMP table with the parquet columns in file order (COPY ... FORMAT AS PARQUET maps by position)."""
+    cols = ",\n  ".join(f'"{field.name.lower()}" {_redshift_type(field.type)}' for field in schema)
+    return f"CREATE TEMP TABLE {table} (\n  {cols}\n)"
+
+
+def local_run_files(run_dir: str):
+    """Data files of a local run folder, through its _MANIFEST.json when compacted."""
+    manifest = os.path.join(run_dir, "_MANIFEST.json")
+    if os.path.exists(manifest):
+        with open(manifest, "r", encoding="utf-8") as fh:
+            return [e["url"][len("file://"):] if e["url"].startswith("file://") else e["url"]
+                    for e in json.load(fh)["entries"]]
+    files = []
+    for dirpath, _, filenames in os.walk(run_dir):
+        files += [os.path.join(dirpath, n) for n in sorted(filenames) if is_data_file(n)]
+    if not files:
+        raise Exception(f"No curated files under {run_dir}")
+    return sorted(files)
+
+
+def _parquet_rows(files, columns=STAGE_COLUMNS):
+    """`columns` tuples from parquet files, batch by batch (columns missing in a vintage -> NULL)."""
+    import pyarrow.parquet as pq
+
+    for path in files:
+        pf = pq.ParquetFile(path)
+        by_lower = {name.lower(): name for name in pf.schema_arrow.names}
+        present = [by_lower[c] for c in columns if c in by_lower]
+        for batch in pf.iter_batches(columns=present, batch_size=50000):
+            cols = {name.lower(): batch.column(name).to_pylist() for name in present}
+            empty = [None] * batch.num_rows
+            yield from zip(*[cols.get(c, empty) for c in columns])
+
+
+# ----------------------------
+# Load
+# ----------------------------
+def _insert_sql(template: str, source_table: str, run_column: str, source_columns) -> str:
+    """INSERT ... SELECT of one run; run_column=None when source_table only holds the run."""
+    present = {c.lower() for c in source_columns}
+    return template.format(
+        fact=FACT_TABLE,
+        source=source_table,
+        where=f"WHERE t.{run_column} = %s" if run_column else "",
+        # curated layout only (KEYED_INSERT_SQL has no such fields)
+        measures=", ".join(f"t.{c}" if c in present else "NULL" for c in CURATED_MEASURES),
+        ingested_at_utc="t.ingested_at_utc" if "ingested_at_utc" in present else "NULL",
+    )
+
+
+def _copy_manifest(cur, table: str, manifest: str, iam_role: str) -> None:
+    role = "default" if iam_role == "default" else f"'{iam_role}'"
+    cur.execute(f"COPY {table} FROM '{manifest}' IAM_ROLE {role} FORMAT AS PARQUET MANIFEST")
+
+
+def _replace_run(cur, run_id: str, scope: str, insert_sql: str, run_column: str) -> int:
+    if scope == "full":
+        # DELETE, not TRUNCATE: TRUNCATE commits immediately on Redshift
+        cur.execute(f"DELETE FROM {FACT_TABLE}")
+    else:
+        cur.execute(f"DELETE FROM {FACT_TABLE} WHERE run_id = %s", (run_id,))
+    cur.execute(insert_sql, (run_id, run_id) if run_column else (run_id,))
+    return cur.rowcount
+
+
+def load_run(params: dict, run_id: str, source: str, bucket: str = None,
+             curated_prefix: str = None,
+             manifest_prefix: str = "manifests/fact_loads/", iam_role: str = "default",
+             spectrum_table: str = None, spectrum_run_column: str = "run_id",
+             local_root: str = None, layout: str = "curated", scope: str = "run") -> dict:
+    """Loads the run's curated (or fact-layout) rows into the fact with the given scope; returns the load stats."""
+    if layout not in LAYOUTS:
+        raise Exception(f"Unsupported layout '{layout}' (expected curated or fact)")
+    if scope not in ("full", "run"):
+        raise Exception(f"Unsupported scope '{scope}' (expected full or run)")
+    insert_template, columns, copy_stage, local_stage, default_prefix, default_spectrum = LAYOUTS[layout]
+    curated_prefix = default_prefix if curated_prefix is None else curated_prefix
+    curated_prefix = curated_prefix.strip("/") + "/" if curated_prefix.strip("/") else ""
+    spectrum_table = spectrum_table or default_spectrum
+    t0 = time.time()
+    conn = _connect(params)
+    try:
+        cur = conn.cursor()
+        manifest = None
+        source_columns = columns
+        if source == "copy":
+            manifest = run_manifest_s3(bucket, curated_prefix, run_id, manifest_prefix)
+            if layout == "curated":
+                # the stage only ever holds this run; the run_id column of curated files
+                # is the validated run's, so it is not filtered on
+                schema = parquet_schema_s3(manifest_files(manifest)[0])
+                cur.execute(copy_stage_ddl(copy_stage, schema))
+                source_columns, run_column = schema.names, None
+            else:
+                cur.execute(f"DELETE FROM {copy_stage} WHERE run_id = %s", (run_id,))
+                run_column = "run_id"
+            _copy_manifest(cur, copy_stage, manifest, iam_role)
+            source_table = copy_stage
+        elif source == "spectrum":
+            source_table, run_column = spectrum_table, spectrum_run_column
+        elif source == "local":
+            import pg_bulk
+
+            run_dir = os.path.join(local_root, bucket, curated_prefix, f"run_id={run_id}")
+            files = local_run_files(run_dir)
+            rows = ((run_id, *r) for r in _parquet_rows(files, columns))
+            # own transaction (pg_bulk connection); the stage rows of this run are replaced
+            pg_bulk.copy_rows(rows, params, local_stage, ["batch_id", *columns], run_id)
+            manifest = run_dir
+            source_table, run_column = local_stage, "batch_id"
+        else:
+            raise Exception(f"Unsupported source '{source}' (expected copy, spectrum or local)")
+        t1 = time.time()
+
+        insert_sql = _insert_sql(insert_template, source_table, run_column, source_columns)
+        rows_loaded = _replace_run(cur, run_id, scope, insert_sql, run_column)
+        if source == "copy" and run_column is None:
+            cur.execute(f"DROP TABLE {copy_stage}")
+        elif source == "copy":
+            cur.execute(f"DELETE FROM {copy_stage} WHERE run_id = %s", (run_id,))
+        elif source == "local":
+            cur.execute(f"DELETE FROM {local_stage} WHERE batch_id = %s", (run_id,))
+        t2 = time.time()
+
+        stats = {
+            "run_id": run_id,
+            "source": source,
+            "layout": layout,
+            "scope": scope,
+            "source_path": manifest or spectrum_table,
+            "rows_loaded": rows_loaded,
+            "stage_seconds": round(t1 - t0, 3),
+            "merge_seconds": round(t2 - t1, 3),
+            "total_seconds": round(t2 - t0, 3),
+            "loaded_at_utc": datetime.now(timezone.utc).isoformat(),
+        }
+        cur.execute(
+            f"INSERT INTO {LOAD_LOG_TABLE} (run_id, source, layout, source_path, rows_loaded, stage_seconds, "
+            f"merge_seconds, total_seconds, loaded_at_utc) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+            (run_id, source, layout, stats["source_path"], rows_loaded, stats["stage_seconds"],
+             stats["merge_seconds"], stats["total_seconds"], stats["loaded_at_utc"]),
+        )
+        conn.commit()
+        return stats
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# ----------------------------
+# Self-check (Postgres stand-in)
+# ----------------------------
+_SELFCHECK_DDL = [
+    "CREATE SCHEMA IF NOT EXISTS final_dim",
+    "CREATE SCHEMA IF NOT EXISTS final_fact",
+    "CREATE SCHEMA IF NOT EXISTS final_staging",
+    "CREATE TABLE final_dim.vendor_dim (vendor_sk BIGSERIAL, vendor_id INT NOT NULL)",
+    "CREATE TABLE final_dim.ratecode_dim (ratecode_sk BIGSERIAL, rate_code_id INT NOT NULL)",
+    "CREATE TABLE final_dim.payment_type_dim (payment_type_sk BIGSERIAL, payment_type_id INT NOT NULL)",
+    "CREATE TABLE final_dim.zone_dim (zone_sk BIGSERIAL, location_id INT NOT NULL)",
+    """CREATE TABLE final_fact.trip_fact (
+         trip_fact_sk BIGSERIAL, vendor_sk BIGINT, ratecode_sk BIGINT, payment_type_sk BIGINT,
+         pickup_zone_sk BIGINT, dropoff_zone_sk BIGINT, pickup_datetime TIMESTAMP, dropoff_datetime TIMESTAMP,
+         passenger_count INTEGER, trip_distance DOUBLE PRECISION, fare_amount DOUBLE PRECISION,
+         extra DOUBLE PRECISION, mta_tax DOUBLE PRECISION, tip_amount DOUBLE PRECISION,
+         tolls_amount DOUBLE PRECISION, improvement_surcharge DOUBLE PRECISION, total_amount DOUBLE PRECISION,
+         congestion_surcharge DOUBLE PRECISION, airport_fee DOUBLE PRECISION, cbd_congestion_fee DOUBLE PRECISION,
+         run_id VARCHAR(256), ingested_at_utc VARCHAR(256), created_at TIMESTAMP DEFAULT now())""",
+    """CREATE TABLE final_fact.trip_fact_load_log (
+         run_id VARCHAR(256), source VARCHAR(32), layout VARCHAR(16), source_path VARCHAR(1024), rows_loaded BIGINT,
+         stage_seconds DOUBLE PRECISION, merge_seconds DOUBLE PRECISION, total_seconds DOUBLE PRECISION,
+         loaded_at_utc VARCHAR(64))""",
+    """CREATE UNLOGGED TABLE final_staging.trip_fact_stage (
+         part_id INT NOT NULL, batch_id VARCHAR(256) NOT NULL, vendorid INT, ratecodeid INT, payment_type INT,
+         pulocationid INT, dolocationid INT, tpep_pickup_datetime TIMESTAMP, tpep_dropoff_datetime TIMESTAMP,
+         passenger_count INT, trip_distance DOUBLE PRECISION, fare_amount DOUBLE PRECISION,
+         extra DOUBLE PRECISION, mta_tax DOUBLE PRECISION, tip_amount DOUBLE PRECISION,
+         tolls_amount DOUBLE PRECISION, improvement_surcharge DOUBLE PRECISION, total_amount DOUBLE PRECISION,
+         congestion_surcharge DOUBLE PRECISION, airport_fee DOUBLE PRECISION, cbd_congestion_fee DOUBLE PRECISION,
+         run_id VARCHAR(256), ingested_at_utc VARCHAR(256))""",
+    """CREATE UNLOGGED TABLE final_staging.trip_fact_keyed_stage (
+         part_id INT NOT NULL, batch_id VARCHAR(256) NOT NULL, vendor_sk BIGINT, ratecode_sk BIGINT,
+         payment_type_sk BIGINT, pickup_zone_sk BIGINT, dropoff_zone_sk BIGINT, pickup_datetime TIMESTAMP,
+         dropoff_datetime TIMESTAMP, passenger_count INT, trip_distance DOUBLE PRECISION,
+         fare_amount DOUBLE PRECISION, extra DOUBLE PRECISION, mta_tax DOUBLE PRECISION,
+         tip_amount DOUBLE PRECISION, tolls_amount DOUBLE PRECISION, improvement_surcharge DOUBLE PRECISION,
+         total_amount DOUBLE PRECISION, congestion_surcharge DOUBLE PRECISION, airport_fee DOUBLE PRECISION,
+         cbd_congestion_fee DOUBLE PRECISION, run_id VARCHAR(256), ingested_at_utc VARCHAR(256))""",
+]
+_SELFCHECK_TABLES = ["final_dim.vendor_dim", "final_dim.ratecode_dim", "final_dim.payment_type_dim",
+                     "final_dim.zone_dim", FACT_TABLE, LOAD_LOG_TABLE, LOCAL_STAGE_TABLE, KEYED_LOCAL_STAGE_TABLE]
+
+
+def _selfcheck(params: dict, rows_per_run: int) -> None:
+    import shutil
+    import tempfile
+    from datetime import timedelta
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    conn = _connect(params)
+    cur = conn.cursor()
+    cur.execute(f"DROP TABLE IF EXISTS {', '.join(_SELFCHECK_TABLES)}")
+    for ddl in _SELFCHECK_DDL:
+        cur.execute(ddl)
+    cur.execute("INSERT INTO final_dim.vendor_dim (vendor_id) VALUES (1), (2)")
+    cur.execute("INSERT INTO final_dim.ratecode_dim (rate_code_id) VALUES (1), (2), (99)")
+    cur.execute("INSERT INTO final_dim.payment_type_dim (payment_type_id) VALUES (1), (2), (5)")
+    cur.execute("INSERT INTO final_dim.zone_dim (location_id) SELECT g FROM generate_series(1, 265) g")
+    conn.commit()
+
+    root = tempfile.mkdtemp(prefix="trip_fact_loader_")
+    t = datetime(2024, 1, 1)
+    for run_id in ["r1", "r2"]:
+        run_dir = os.path.join(root, "b", "curated", f"run_id={run_id}")
+        os.makedirs(run_dir)
+        # curated parquet keeps the TLC casing; two files per run
+        for part in range(2):
+            n = rows_per_run // 2
+            pq.write_table(pa.table({
+                "VendorID": [1 + i % 2 for i in range(n)],
+                "RatecodeID": [None if i % 10 == 0 else 1 for i in range(n)],
+                "payment_type": [None if i % 9 == 0 else 2 for i in range(n)],
+                "PULocationID": [1 + i % 265 for i in range(n)],
+                "DOLocationID": [1 + (i * 7) % 265 for i in range(n)],
+                "tpep_pickup_datetime": [t + timedelta(minutes=i) for i in range(n)],
+                "tpep_dropoff_datetime": [t + timedelta(minutes=i + 12) for i in range(n)],
+                "trip_distance": [1.5] * n,
+                "total_amount": [12.25] * n,
+                "run_id": [run_id] * n,
+                "ingested_at_utc": ["2024-01-02T00:00:00+00:00"] * n,
+            }), os.path.join(run_dir, f"part-{part:05d}.parquet"))
+
+    # r3: r1's rows in the fact layout, keys resolved upstream against the same dimensions
+    # (BIGSERIAL keys above: vendor/zone sk = id, ratecode 1,2,99 -> 1,2,3, payment 1,2,5 -> 1,2,3)
+    keyed = {1: 1, 2: 2, 99: 3, 5: 3}
+    r1 = pq.read_table(os.path.join(root, "b", "curated", "run_id=r1")).to_pydict()
+    r3_dir = os.path.join(root, "b", "trip_fact", "run_id=r3")
+    os.makedirs(r3_dir)
+    pq.write_table(pa.table({
+        "vendor_sk": r1["VendorID"],
+        "ratecode_sk": [keyed[99 if v is None else v] for v in r1["RatecodeID"]],
+        "payment_type_sk": [keyed[5 if v is None else v] for v in r1["payment_type"]],
+        "pickup_zone_sk": r1["PULocationID"],
+        "dropoff_zone_sk": r1["DOLocationID"],
+        "pickup_datetime": r1["tpep_pickup_datetime"],
+        "dropoff_datetime": r1["tpep_dropoff_datetime"],
+        "trip_distance": r1["trip_distance"],
+        "total_amount": r1["total_amount"],
+        "run_id": ["r3"] * len(r1["VendorID"]),
+        "ingested_at_utc": r1["ingested_at_utc"],
+    }), os.path.join(r3_dir, "part-00000.parquet"))
+
+    common = dict(bucket="b", curated_prefix="curated", local_root=root, scope="run")
+    for run_id in ["r1", "r1", "r2"]:   # r1 twice proves a rerun replaces, not appends
+        print(load_run(params, run_id, "local", **common))
+    for _ in range(2):
+        print(load_run(params, "r3", "local", bucket="b", curated_prefix="trip_fact", local_root=root, layout="fact",
+                       scope="run"))
+
+    cur.execute(f"SELECT run_id, count(*), count(ratecode_sk), count(payment_type_sk), count(pickup_zone_sk) "
+                f"FROM {FACT_TABLE} GROUP BY run_id ORDER BY run_id")
+    counts = cur.fetchall()
+    cur.execute(f"SELECT run_id, sum(vendor_sk), sum(ratecode_sk), sum(payment_type_sk), sum(pickup_zone_sk), "
+                f"sum(dropoff_zone_sk), sum(total_amount) FROM {FACT_TABLE} WHERE run_id IN ('r1', 'r3') "
+                f"GROUP BY run_id ORDER BY run_id")
+    key_sums = [list(r[1:]) for r in cur.fetchall()]
+    cur.execute(f"SELECT count(*) FROM {LOAD_LOG_TABLE}")
+    loads = cur.fetchone()[0]
+    cur.execute(f"SELECT (SELECT count(*) FROM {LOCAL_STAGE_TABLE}) + (SELECT count(*) FROM {KEYED_LOCAL_STAGE_TABLE})")
+    staged = cur.fetchone()[0]
+    cur.execute(f"DROP TABLE {', '.join(_SELFCHECK_TABLES)}")
+    conn.commit()
+    conn.close()
+    shutil.rmtree(root)
+
+    n = rows_per_run // 2 * 2
+    expected = [[run_id, n, n, n, n] for run_id in ["r1", "r2", "r3"]]
+    assert [list(r) for r in counts] == expected, counts
+    assert key_sums[0] == key_sums[1], key_sums
+    assert (loads, staged) == (5, 0), (loads, staged)
+    print(f"OK runs={len(counts)} rows_per_run={n}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Incremental run-scoped load of final_fact.trip_fact")
+    ap.add_argument("--run_id")
+    ap.add_argument("--source", default="copy", choices=["copy", "spectrum", "local"])
+    ap.add_argument("--bucket")
+    ap.add_argument("--layout", default="curated", choices=sorted(LAYOUTS))
+    ap.add_argument("--scope", default="run", choices=["full", "run"],
+                    help="run: replace the run's rows (default); full: replace the whole fact (non-incremental runs)")
+    ap.add_argument("--curated_prefix", help="default: curated/trips_enriched/ (curated), curated/trip_fact/ (fact)")
+    ap.add_argument("--manifest_prefix", default="manifests/fact_loads/")
+    ap.add_argument("--iam_role", default="default")
+    ap.add_argument("--spectrum_table", help="default: spectrum.trips_curated (curated), spectrum.trip_fact_run (fact)")
+    ap.add_argument("--spectrum_run_column", default="run_id")
+    ap.add_argument("--local_root")
+    ap.add_argument("--selfcheck", action="store_true")
+    ap.add_argument("--rows", type=int, default=10000)
+    ap.add_argument("--host")
+    ap.add_argument("--port", type=int, default=5439)
+    ap.add_argument("--unix-sock")
+    ap.add_argument("--user", default="postgres")
+    ap.add_argument("--password", default=os.environ.get("PGPASSWORD"))
+    ap.add_argument("--database", default="analytics")
+    # Glue Python shell jobs append their own --job-bookmark-option etc.
+    a, _ = ap.parse_known_args()
+
+    params = {"user": a.user, "database": a.database}
+    if a.unix_sock:
+        params["unix_sock"] = a.unix_sock
+    else:
+        params.update(host=a.host or "localhost", port=a.port)
+    if a.password:
+        params["password"] = a.password
+
+    if a.selfcheck:
+        _selfcheck(params, a.rows)
+    else:
+        print(json.dumps(load_run(params, a.run_id, a.source, bucket=a.bucket, curated_prefix=a.curated_prefix,
+                                  manifest_prefix=a.manifest_prefix, iam_role=a.iam_role,
+                                  spectrum_table=a.spectrum_table, spectrum_run_column=a.spectrum_run_column,
+                                  local_root=a.local_root, layout=a.layout, scope=a.scope)))
@@ -0,0 +1,184 @@
+"""
+BI rollup of the curated trips: one row per pickup date x PU zone x vendor x ratecode
+x payment type, published as versions behind a _LATEST.json pointer.
+
+    store = open_store(bucket, local_root)
+    rollup = update_rollup(spark, store, "curated/rollups/trip_daily/", run_id,
+                           curated_path, rebuild=not new_trips_only)
+
+Layout under the rollup base:
+    version=<ts>/                        a full rollup; _LATEST.json names the current one
+    _deltas/run_id=<id>/attempt=<ts>/    aggregates of one attempt of a run
+    _deltas/run_id=<id>/_COMMITTED       written when the run is first published
+
+Ship with --extra-py-files <s3 path>/trip_rollup.py (needs lake_io.py).
+"""
+from datetime import datetime, timedelta, timezone
+
+from pyspark.sql import functions as F
+
+# grain of the rollup: pickup date x PU zone x vendor x ratecode x payment type;
+# ratecode/payment type use the same unknown-member defaults as the fact (99 / 5)
+ROLLUP_KEYS = ["trip_date", "pulocationid", "vendorid", "ratecodeid", "payment_type"]
+# money/distance sums are DECIMAL so merged rollups add up exactly, run after run
+ROLLUP_SUM_COLS = ["total_amount", "fare_amount", "trip_distance"]
+ROLLUP_MEASURES = (["trips", "total_amount_count", "negative_duration_trips"]
+                   + [f"{c}_sum" for c in ROLLUP_SUM_COLS])
+
+# runs whose delta the pointer keeps (a rerun within them subtracts its earlier delta)
+DEFAULT_KEEP_RUNS = 50
+# published versions kept after a flip (readers of the previous pointer stay valid)
+DEFAULT_KEEP_VERSIONS = 3
+# unreferenced delta attempts younger than this may belong to a run still in flight
+DELTA_GRACE = timedelta(hours=6)
+# conditional pointer writes before giving up on concurrent publishers
+PUBLISH_ATTEMPTS = 3
+
+STAMP_FORMAT = "%Y%m%dT%H%M%S%f"
+
+
+def rollup_delta(curated):
+    """One run's contribution to the rollup, from the curated rows as written."""
+    keyed = curated.select(
+        F.to_date("tpep_pickup_datetime").alias("trip_date"),
+        F.col("pulocationid").cast("int").alias("pulocationid"),
+        F.col("vendorid").cast("int").alias("vendorid"),
+        F.coalesce(F.col("ratecodeid").cast("int"), F.lit(99)).alias("ratecodeid"),
+        F.coalesce(F.col("payment_type").cast("int"), F.lit(5)).alias("payment_type"),
+        *[F.col(c).cast("decimal(38,2)").alias(c) for c in ROLLUP_SUM_COLS],
+        (F.col("tpep_dropoff_datetime") < F.col("tpep_pickup_datetime")).cast("long").alias("negative_duration"),
+    )
+    return keyed.groupBy(*ROLLUP_KEYS).agg(
+        F.count(F.lit(1)).alias("trips"),
+        F.count("total_amount").alias("total_amount_count"),
+        F.coalesce(F.sum("negative_duration"), F.lit(0)).alias("negative_duration_trips"),
+        *[F.coalesce(F.sum(c), F.lit(0)).cast("decimal(38,2)").alias(f"{c}_sum") for c in ROLLUP_SUM_COLS],
+    )
+
+
+def merge_rollup(current, delta, previous_delta):
+    """current + delta - previous_delta (the run's earlier attempt), regrouped on the rollup keys."""
+    parts = [delta]
+    if current is not None:
+        parts.append(current.select(*ROLLUP_KEYS, *ROLLUP_MEASURES))
+    if previous_delta is not None:
+        parts.append(previous_delta.select(*ROLLUP_KEYS, *[(-F.col(m)).alias(m) for m in ROLLUP_MEASURES]))
+    rows = parts[0]
+    for part in parts[1:]:
+        rows = rows.unionByName(part)
+    merged = rows.groupBy(*ROLLUP_KEYS).agg(
+        *[F.sum(m).cast("decimal(38,2)" if m.endswith("_sum") else "long").alias(m) for m in ROLLUP_MEASURES])
+    return merged.where(F.col("trips") != 0)
+
+
+def _stamp() -> str:
+    return datetime.now(timezone.utc).strftime(STAMP_FORMAT)
+
+
+def update_rollup(spark, store, rollup_base: str, run_id: str, curated_path: str, rebuild: bool = False,
+                  keep_runs: int = DEFAULT_KEEP_RUNS, keep_versions: int = DEFAULT_KEEP_VERSIONS,
+                  delta_grace: timedelta = DELTA_GRACE) -> dict:
+    """
+    Publishes a new rollup version that includes the curated rows of run_id.
+
+    rebuild=False - the run holds only trips no earlier run had (incremental validated run):
+      its delta is merged into the latest version. The pointer maps the keep_runs most
+      recently published runs to the delta attempt each contributed, so a rerun subtracts
+      exactly what it added before; a rerun of a run that has left that window is refused.
+    rebuild=True - the run holds every trip: the new version is the run's delta alone and
+      the run map starts over, so successive full runs never add up.
+
+    _LATEST.json is replaced with a conditional PUT; when another run published in the
+    meantime the merge is redone on top of its version. After the flip, versions beyond
+    the newest keep_versions and delta attempts the pointer no longer references are deleted.
+    """
+    pointer_key = f"{rollup_base}_LATEST.json"
+    committed_key = f"{rollup_base}_deltas/run_id={run_id}/_COMMITTED"
+
+    # the run's delta lands in a fresh attempt folder, the previous attempt stays readable
+    delta_path = store.uri(f"{rollup_base}_deltas/run_id={run_id}/attempt={_stamp()}/")
+    rollup_delta(spark.read.parquet(curated_path)).coalesce(1).write.mode("overwrite").parquet(delta_path)
+    delta = spark.read.parquet(delta_path)
+
+    for _ in range(PUBLISH_ATTEMPTS):
+        pointer, etag = store.get_json_with_etag(pointer_key)
+        pointer = pointer or {}
+        runs = {} if rebuild else dict(pointer.get("runs", {}))
+        previous = runs.pop(run_id, None)
+        if not rebuild and previous is None and store.get_json(committed_key) is not None:
+            raise Exception(
+                f"Run {run_id} is already in the rollup but no longer in the pointer's last {keep_runs} runs, "
+                f"so its earlier rows cannot be subtracted; rebuild the rollup from a full (non-incremental) run")
+        current = None if rebuild or not pointer.get("path") else spark.read.parquet(pointer["path"])
+        previous_delta = spark.read.parquet(previous) if previous else None
+
+        version_prefix = f"{rollup_base}version={_stamp()}/"
+        version_path = store.uri(version_prefix)
+        (merge_rollup(current, delta, previous_delta)
+         .coalesce(1)
+         .sortWithinPartitions(*ROLLUP_KEYS)
+         .write.mode("overwrite").parquet(version_path))
+        rows = spark.read.parquet(version_path).count()
+
+        # re-inserted last: the map is in publish order, the oldest runs drop out first
+        runs[run_id] = delta_path
+        evicted = list(runs)[:max(len(runs) - keep_runs, 0)]
+        for old_run in evicted:
+            del runs[old_run]
+        published = {
+            "dataset": "trip_rollup_daily",
+            "bucket": store.bucket,
+            "prefix": version_prefix,
+            "path": version_path,
+            "row_count": rows,
+            "mode": "rebuild" if rebuild else "merge",
+            "runs": runs,
+            "committed_utc": datetime.now(timezone.utc).isoformat(),
+        }
+        if store.put_json_if_match(pointer_key, published, etag):
+            break
+        # another run published first: drop this version and merge again on top of its one
+        print(f"Rollup pointer {pointer_key} changed while merging - retrying")
+        store.delete_keys([o["key"] for o in store.list_objects(version_prefix)])
+    else:
+        raise Exception(f"Rollup pointer {pointer_key} kept changing; gave up after {PUBLISH_ATTEMPTS} attempts")
+
+    if store.get_json(committed_key) is None:
+        store.put_json(committed_key, {"run_id": run_id, "committed_utc": published["committed_utc"]})
+    expired = _expire_rollup(store, rollup_base, published, keep_versions, delta_grace)
+    return {"path": version_path, "row_count": rows, "mode": published["mode"], "delta_path": delta_path,
+            "replaced_delta_path": previous, "runs": len(runs), "evicted_runs": evicted, "expired": expired}
+
+
+def _expire_rollup(store, rollup_base: str, pointer: dict, keep_versions: int, delta_grace: timedelta) -> dict:
+    """
+    Deletes the versions beyond the newest keep_versions (never the published one) and
+    the delta attempts that are not in the pointer's run map and older than delta_grace.
+    _COMMITTED markers are kept: they are how a rerun of an evicted run is recognised.
+    """
+    versions = {}
+    for obj in store.list_objects(f"{rollup_base}version="):
+        folder = obj["key"][len(rollup_base):].split("/", 1)[0]
+        versions.setdefault(folder, []).append(obj["key"])
+    keep = set(sorted(versions, reverse=True)[:keep_versions])
+    keep.add(pointer["prefix"][len(rollup_base):].strip("/"))
+    expired_versions = sorted(v for v in versions if v not in keep)
+
+    deltas_prefix = f"{rollup_base}_deltas/"
+    referenced = {p.rstrip("/").split("/_deltas/", 1)[-1] for p in pointer["runs"].values()}
+    cutoff = datetime.now(timezone.utc) - delta_grace
+    attempts = {}
+    for obj in store.list_objects(deltas_prefix):
+        parts = obj["key"][len(deltas_prefix):].split("/")
+        if len(parts) < 3 or not parts[1].startswith("attempt="):
+            continue
+        attempts.setdefault("/".join(parts[:2]), []).append(obj["key"])
+    expired_attempts = sorted(
+        a for a in attempts
+        if a not in referenced
+        and datetime.strptime(a.rsplit("=", 1)[1], STAMP_FORMAT).replace(tzinfo=timezone.utc) < cutoff
+    )
+
+    store.delete_keys([k for v in expired_versions for k in versions[v]]
+                      + [k for a in expired_attempts for k in attempts[a]])
+    return {"versions": expired_versions, "delta_attempts": expired_attempts}
@@ -1,26 +1,114 @@
 import boto3
+import json
 import os
 from datetime import datetime, timezone
+from botocore.exceptions import ClientError
 
 s3 = boto3.client("s3")
 
-def lambda_handler(event, context):
-    bucket = event["bucket"]
-    prefix = event["snapshot_prefix"]
-    max_age_hours = float(event.get("max_age_hours") or os.getenv("DEFAULT_MAX_AGE_HOURS", "24"))
+# Pointer written by the golden snapshot job after a snapshot commits
+POINTER_NAME = "_LATEST.json"
 
-    latest_modified = None
 
+def _read_pointer(bucket: str, prefix: str):
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=f"{prefix}{POINTER_NAME}")
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None
+        raise
+    return json.loads(obj["Body"].read().decode("utf-8"))
+
+
+def _latest_snapshot_folder(bucket: str, prefix: str, start_after_id: str, max_pages: int):
+    """
+    Snapshot folders are named by lexically ordered snapshot IDs, so the newest one is the
+    greatest CommonPrefix. StartAfter skips everything up to a known snapshot ID and
+    max_pages bounds the scan (one entry per snapshot, not per object).
+    Returns (folder, complete): complete is False when max_pages ran out before the
+    listing did, so a newer folder may exist and the folder must not be trusted.
+    """
+    params = {"Bucket": bucket, "Prefix": prefix, "Delimiter": "/"}
+    if start_after_id:
+        params["StartAfter"] = f"{prefix}{start_after_id.strip('/')}/"
+
+    latest = None
     paginator = s3.get_paginator("list_objects_v2")
-    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+    for pages, page in enumerate(paginator.paginate(**params), start=1):
+        for cp in page.get("CommonPrefixes", []):
+            if latest is None or cp["Prefix"] > latest:
+                latest = cp["Prefix"]
+        if pages >= max_pages and page.get("IsTruncated"):
+            return latest, False
+
+    if latest is None and start_after_id:
+        # nothing newer than the known snapshot
+        latest = f"{prefix}{start_after_id.strip('/')}/"
+    return latest, True
+
+
+def _max_last_modified(bucket: str, prefix: str, max_pages: int):
+    """(newest LastModified under prefix, complete) - same page cap as _latest_snapshot_folder."""
+    latest_modified = None
+    paginator = s3.get_paginator("list_objects_v2")
+    for pages, page in enumerate(paginator.paginate(Bucket=bucket, Prefix=prefix), start=1):
         for obj in page.get("Contents", []):
             lm = obj["LastModified"]
             if latest_modified is None or lm > latest_modified:
                 latest_modified = lm
+        if pages >= max_pages and page.get("IsTruncated"):
+            return latest_modified, False
+    return latest_modified, True
+
+
+def lambda_handler(event, context):
+    bucket = event["bucket"]
+    prefix = event["snapshot_prefix"]
+    max_age_hours = float(event.get("max_age_hours") or os.getenv("DEFAULT_MAX_AGE_HOURS", "24"))
+    start_after_id = event.get("last_snapshot_id") or ""
+    max_pages = int(os.getenv("SNAPSHOT_LIST_MAX_PAGES", "5"))
+
+    if prefix and not prefix.endswith("/"):
+        prefix += "/"
+
+    snapshot_id = None
+    row_counts = None
+    latest_modified = None
+
+    # 1) O(1): snapshot commit metadata from the pointer object
+    pointer = _read_pointer(bucket, prefix)
+    if pointer and pointer.get("committed_utc"):
+        source = "pointer"
+        snapshot_id = pointer.get("snapshot_id")
+        row_counts = pointer.get("row_counts")
+        latest_modified = datetime.fromisoformat(pointer["committed_utc"])
+        if latest_modified.tzinfo is None:
+            latest_modified = latest_modified.replace(tzinfo=timezone.utc)
+    else:
+        # 2) Fallback: bounded listing of the newest snapshot folder only
+        source = "listing"
+        folder, complete = _latest_snapshot_folder(bucket, prefix, start_after_id, max_pages)
+        if complete:
+            if folder:
+                snapshot_id = folder[len(prefix):].strip("/")
+            latest_modified, complete = _max_last_modified(bucket, folder or prefix, max_pages)
+        if not complete:
+            # a partial listing can miss the newest snapshot: report unknown, never an age
+            return {
+                "freshnessOk": False,
+                "freshnessUnknown": True,
+                "reason": (f"No {POINTER_NAME} under snapshot_prefix and the listing did not finish within "
+                           f"{max_pages} pages (SNAPSHOT_LIST_MAX_PAGES); pass last_snapshot_id or "
+                           f"publish the pointer"),
+                "bucket": bucket,
+                "snapshot_prefix": prefix,
+                "metadataSource": source,
+            }
 
     if latest_modified is None:
         return {
             "freshnessOk": False,
+            "freshnessUnknown": True,
             "reason": "No objects found under snapshot_prefix",
             "bucket": bucket,
             "snapshot_prefix": prefix
@@ -31,8 +119,12 @@ def lambda_handler(event, context):
 
     return {
         "freshnessOk": age_hours <= max_age_hours,
+        "freshnessUnknown": False,
         "bucket": bucket,
         "snapshot_prefix": prefix,
+        "snapshotId": snapshot_id,
+        "rowCounts": row_counts,
+        "metadataSource": source,
         "lastModified": latest_modified.isoformat(),
         "ageHours": round(age_hours, 2),
         "maxAgeHours": max_age_hours
@@ -0,0 +1,162 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the Glue jobs import their shared modules (--extra-py-files) as top-level modules;
+# benchmarks/ provides the synthetic TLC generator (tlc_gen)
+for path in ("src/glue", "src/lambdas", "benchmarks", "benchmarks/shim"):
+    sys.path.insert(0, os.path.join(ROOT, path))
+
+
+@pytest.fixture(scope="session")
+def spark():
+    pytest.importorskip("pyspark")
+    from pyspark.sql import SparkSession
+
+    session = (SparkSession.builder
+               .master("local[1]")
+               .appName("tests")
+               .config("spark.ui.enabled", "false")
+               .config("spark.sql.shuffle.partitions", "1")
+               .config("spark.sql.session.timeZone", "UTC")
+               .getOrCreate())
+    yield session
+    session.stop()
+
+
+@pytest.fixture(scope="session")
+def pg_params():
+    """pg8000 connect kwargs from the libpq variables (PGHOST may be a socket directory)."""
+    if not os.environ.get("PGHOST"):
+        pytest.skip("PGHOST not set (no Postgres for the RDS / Redshift loader tests)")
+    pytest.importorskip("pg8000")
+    host = os.environ["PGHOST"]
+    port = int(os.environ.get("PGPORT", "5432"))
+    params = {"user": os.environ.get("PGUSER", "postgres"), "database": os.environ.get("PGDATABASE", "postgres")}
+    if host.startswith("/"):
+        params["unix_sock"] = f"{host}/.s.PGSQL.{port}"
+    else:
+        params.update(host=host, port=port)
+    if os.environ.get("PGPASSWORD"):
+        params["password"] = os.environ["PGPASSWORD"]
+    return params
+
+
+class GlueLake:
+    """
+    Runs the src/glue jobs in subprocesses the way benchmarks/run_bench.py does: awsglue
+    shim on the path, boto3 against an in-process moto server, Spark s3://<bucket>/...
+    paths under <work>/lake/<bucket>/.
+    """
+
+    def __init__(self, work, bucket: str = ""):
+        import boto3
+        import run_bench
+
+        self.work = work
+        self.lake = work / "lake"
+        # moto servers of one process share their backend: other lakes need a bucket of their own
+        self.bucket = bucket or run_bench.BUCKET
+        self.server, self.endpoint = run_bench._start_moto()
+        self.aws_env = {
+            "AWS_ENDPOINT_URL": self.endpoint,
+            "AWS_ACCESS_KEY_ID": "test",
+            "AWS_SECRET_ACCESS_KEY": "test",
+            "AWS_DEFAULT_REGION": "us-east-1",
+        }
+        self.env = dict(
+            os.environ,
+            **self.aws_env,
+            BENCH_LAKE_ROOT=str(self.lake),
+            PYTHONPATH=os.pathsep.join([os.path.join(ROOT, "benchmarks", "shim"), os.environ.get("PYTHONPATH", "")]),
+            PYSPARK_PYTHON=sys.executable,
+            PYSPARK_SUBMIT_ARGS="--master local[2] --driver-memory 1g --conf spark.ui.enabled=false pyspark-shell",
+        )
+        self.s3 = boto3.client("s3", endpoint_url=self.endpoint, region_name="us-east-1",
+                               aws_access_key_id="test", aws_secret_access_key="test")
+        self.s3.create_bucket(Bucket=self.bucket)
+        self._runs = {}
+
+    def run(self, name: str, script: str, *job_args):
+        import run_bench
+
+        return run_bench._run_stage(name, run_bench.GLUE / script, list(job_args), self.env, self.work)
+
+    def path(self, prefix: str):
+        return self.lake / self.bucket / prefix
+
+    def upload(self, prefix: str) -> int:
+        """Mirrors Spark output under the local lake into moto (boto3 listings see it)."""
+        import run_bench
+
+        return run_bench._upload_tree(self.s3, self.path(prefix), prefix, self.bucket)
+
+    def validate(self, run_id: str, *job_args) -> str:
+        """glue_raw_to_validated.py over raw/trips/ (schema registry read); returns its stage metrics."""
+        return self.run(f"raw_to_validated_{run_id}", "glue_raw_to_validated.py",
+                        "--bucket", self.bucket,
+                        "--raw_trips_prefix", "raw/trips/",
+                        "--validated_trips_prefix", "validated/trips/",
+                        "--run_id", run_id,
+                        "--schema_registry", "true", *job_args)
+
+    def enrich(self, run_id: str, *job_args) -> str:
+        """glue_enrich_to_curated.py over the validated run (once per run_id); returns the curated run prefix."""
+        import run_bench
+
+        if run_id not in self._runs:
+            self.run(f"enrich_{run_id}", "glue_enrich_to_curated.py",
+                     "--bucket", self.bucket,
+                     "--validated_trips_prefix", "validated/trips/",
+                     "--snapshot_prefix", run_bench.SNAPSHOT_PREFIX,
+                     "--vendor_snapshot_prefix", run_bench.VENDOR_SNAPSHOT_PREFIX,
+                     "--ratecode_snapshot_prefix", run_bench.RATECODE_SNAPSHOT_PREFIX,
+                     "--curated_trips_prefix", "curated/trips/",
+                     "--metrics_prefix", f"audit/metrics/{run_id}/",
+                     "--run_id", run_id, *job_args)
+            self._runs[run_id] = f"curated/trips/run_id={run_id}/"
+            self.upload(self._runs[run_id])
+        return self._runs[run_id]
+
+
+@pytest.fixture(scope="session")
+def glue_lake(tmp_path_factory):
+    """
+    Synthetic 2019 + 2025 raw trips validated by glue_raw_to_validated.py (run_id v1);
+    glue_lake.enrich(run_id, *args) produces curated runs from it.
+    """
+    pytest.importorskip("pyspark")
+    pytest.importorskip("moto")
+    import run_bench
+    import tlc_gen
+
+    lake = GlueLake(tmp_path_factory.mktemp("glue"))
+    try:
+        raw_dir = lake.path("raw/trips/")
+        lake.generated = tlc_gen.generate(raw_dir, 0.002, ["2019", "2025"], 1, 0.02, 7)
+        run_bench._upload_tree(lake.s3, raw_dir, "raw/trips/")
+        run_bench._seed_zone_snapshot(lake.s3, lake.lake)
+        run_bench._seed_reference_snapshots(lake.s3, lake.lake)
+        lake.validate("v1")
+        yield lake
+    finally:
+        lake.server.stop()
+
+
+@pytest.fixture
+def empty_glue_lake(tmp_path):
+    """A GlueLake of its own with the reference snapshots seeded and no raw trips yet."""
+    pytest.importorskip("pyspark")
+    pytest.importorskip("moto")
+    import run_bench
+
+    lake = GlueLake(tmp_path, f"lake-{uuid.uuid4().hex[:12]}")
+    try:
+        run_bench._seed_zone_snapshot(lake.s3, lake.lake, lake.bucket)
+        run_bench._seed_reference_snapshots(lake.s3, lake.lake, lake.bucket)
+        yield lake
+    finally:
+        lake.server.stop()
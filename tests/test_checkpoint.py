@@ -0,0 +1,229 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from lake_io import LocalObjectStore, advance_checkpoint, pending_raw_files, read_checkpoint
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUCKET = "lake"
+RAW = "raw/trips/"
+CHECKPOINT = "manifests/checkpoints/raw_trips/_CHECKPOINT.json"
+
+
+@pytest.fixture(params=["local", "moto"])
+def store(request, tmp_path):
+    if request.param == "local":
+        yield LocalObjectStore(str(tmp_path), BUCKET)
+        return
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    from lake_io import S3ObjectStore
+
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield S3ObjectStore(BUCKET, client)
+
+
+def _put(store, key: str, body: bytes):
+    if isinstance(store, LocalObjectStore):
+        path = os.path.join(store.base, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as fh:
+            fh.write(body)
+    else:
+        store.client.put_object(Bucket=store.bucket, Key=key, Body=body)
+
+
+def _pending_keys(store):
+    checkpoint = read_checkpoint(store, CHECKPOINT)
+    raw_files, pending = pending_raw_files(store, RAW, checkpoint)
+    return checkpoint, raw_files, sorted(o["key"] for o in pending)
+
+
+def test_first_run_without_checkpoint_processes_every_data_file(store):
+    _put(store, f"{RAW}yellow_tripdata_2024-01.parquet", b"jan")
+    _put(store, f"{RAW}yellow_tripdata_2024-02.parquet", b"feb")
+    _put(store, f"{RAW}_SUCCESS", b"")
+
+    checkpoint, _, pending = _pending_keys(store)
+    assert checkpoint == {"files": {}}
+    assert pending == [f"{RAW}yellow_tripdata_2024-01.parquet", f"{RAW}yellow_tripdata_2024-02.parquet"]
+
+
+def test_rerun_after_crash_before_advance_picks_up_the_same_files(store):
+    _put(store, f"{RAW}yellow_tripdata_2024-01.parquet", b"jan")
+    checkpoint, raw_files, pending = _pending_keys(store)
+    advance_checkpoint(store, CHECKPOINT, checkpoint, RAW, raw_files,
+                       [o for o in raw_files if o["key"] in pending], "run-1")
+
+    # run-2 writes its outputs for February, then fails before advancing the checkpoint
+    _put(store, f"{RAW}yellow_tripdata_2024-02.parquet", b"feb")
+    _, _, crashed = _pending_keys(store)
+    assert crashed == [f"{RAW}yellow_tripdata_2024-02.parquet"]
+
+    # the retry sees exactly the same work, then commits it
+    checkpoint, raw_files, retry = _pending_keys(store)
+    assert retry == crashed
+    manifest = advance_checkpoint(store, CHECKPOINT, checkpoint, RAW, raw_files,
+                                  [o for o in raw_files if o["key"] in retry], "run-2")
+    assert manifest["files"][f"{RAW}yellow_tripdata_2024-01.parquet"]["run_id"] == "run-1"
+    assert manifest["files"][f"{RAW}yellow_tripdata_2024-02.parquet"]["run_id"] == "run-2"
+    assert _pending_keys(store)[2] == []
+
+
+def test_changed_file_is_pending_again(store):
+    key = f"{RAW}yellow_tripdata_2024-01.parquet"
+    _put(store, key, b"jan")
+    checkpoint, raw_files, _ = _pending_keys(store)
+    advance_checkpoint(store, CHECKPOINT, checkpoint, RAW, raw_files, raw_files, "run-1")
+
+    _put(store, key, b"jan, restated")
+    assert _pending_keys(store)[2] == [key]
+
+
+def test_checkpoint_entry_for_missing_file_is_ignored_and_pruned(store):
+    kept = f"{RAW}yellow_tripdata_2024-02.parquet"
+    gone = f"{RAW}yellow_tripdata_2024-01.parquet"
+    _put(store, kept, b"feb")
+    store.put_json(CHECKPOINT, {"files": {gone: {"etag": "0" * 32, "size": 3, "run_id": "run-0"}}})
+
+    checkpoint, raw_files, pending = _pending_keys(store)
+    assert pending == [kept]
+    manifest = advance_checkpoint(store, CHECKPOINT, checkpoint, RAW, raw_files,
+                                  [o for o in raw_files if o["key"] in pending], "run-1")
+    assert sorted(manifest["files"]) == [kept]
+    assert read_checkpoint(store, CHECKPOINT) == manifest
+
+    # the same key uploaded again later is new data
+    _put(store, gone, b"jan")
+    assert _pending_keys(store)[2] == [gone]
+
+
+def _run_raw_to_validated(lake, run_id: str, *job_args):
+    env = dict(os.environ,
+               PYTHONPATH=os.pathsep.join([os.path.join(ROOT, "benchmarks", "shim"), os.path.join(ROOT, "src", "glue")]),
+               PYSPARK_PYTHON=sys.executable,
+               PYSPARK_SUBMIT_ARGS="--master local[1] --conf spark.ui.enabled=false pyspark-shell")
+    env.pop("BENCH_LAKE_ROOT", None)
+    env.pop("BENCH_STAGE_METRICS", None)
+    proc = subprocess.run([
+        sys.executable, os.path.join(ROOT, "src", "glue", "glue_raw_to_validated.py"),
+        "--JOB_NAME", "test_raw_to_validated",
+        "--bucket", BUCKET,
+        "--raw_trips_prefix", RAW,
+        "--validated_trips_prefix", "validated/trips/",
+        "--run_id", run_id,
+        "--local_root", str(lake),
+        "--incremental", "true",
+        "--schema_registry", "true",
+        "--metrics_prefix", "audit/metrics",
+        *job_args,
+    ], env=env, capture_output=True, text=True, timeout=600)
+    assert proc.returncode == 0, proc.stdout[-4000:] + proc.stderr[-4000:]
+    return proc.stdout
+
+
+def test_raw_to_validated_incremental_rerun(tmp_path):
+    pytest.importorskip("pyspark")
+    pq = pytest.importorskip("pyarrow.parquet")
+    import tlc_gen
+
+    lake = tmp_path / "lake"
+    raw_dir = lake / BUCKET / RAW
+    generated = tlc_gen.generate(raw_dir, 0.002, ["2024"], 2, 0.05, 7)
+    store = LocalObjectStore(str(lake), BUCKET)
+
+    def validated_rows(run_id):
+        folder = lake / BUCKET / "validated" / "trips" / f"run_id={run_id}"
+        return sum(pq.read_metadata(p).num_rows for p in folder.rglob("*.parquet"))
+
+    def metrics():
+        with open(lake / BUCKET / "audit" / "metrics" / "_VALIDATION_METRICS.json", encoding="utf-8") as fh:
+            return json.load(fh)
+
+    _run_raw_to_validated(lake, "run-1")
+    first = metrics()
+    assert first["raw_files_processed"] == 2
+    assert first["validated_rows"] + first["quarantine_rows"] == generated["rows"]
+    assert len(read_checkpoint(store, CHECKPOINT)["files"]) == 2
+
+    # crash between the output writes and the checkpoint advance: the retry of the same
+    # run reprocesses the same files and overwrites (not appends to) its run folder
+    store.delete_keys([CHECKPOINT])
+    _run_raw_to_validated(lake, "run-1")
+    assert metrics()["raw_files_processed"] == 2
+    assert validated_rows("run-1") == first["validated_rows"]
+
+    # nothing new: the next run exits before reading anything
+    out = _run_raw_to_validated(lake, "run-2")
+    assert "Nothing to process" in out
+    assert not (lake / BUCKET / "validated" / "trips" / "run_id=run-2").exists()
+
+
+def test_stream_execution_publishes_one_run_with_every_batch(tmp_path):
+    pytest.importorskip("pyspark")
+    pq = pytest.importorskip("pyarrow.parquet")
+    import tlc_gen
+
+    lake = tmp_path / "lake"
+    raw_dir = lake / BUCKET / RAW
+    generated = tlc_gen.generate(raw_dir, 0.002, ["2024"], 2, 0.05, 7)
+    store = LocalObjectStore(str(lake), BUCKET)
+    pointer_key, state_key = "validated/trips/_LATEST.json", "manifests/checkpoints/raw_trips_stream/_STREAM_RUN.json"
+    stream = ("--streaming", "true", "--tlc_version", "2024", "--max_files_per_trigger", "1")
+
+    def validated_run_ids(run_id):
+        folder = lake / BUCKET / "validated" / "trips" / f"run_id={run_id}"
+        return [i for p in folder.rglob("*.parquet") for i in pq.read_table(p, columns=["run_id"]).column(0).to_pylist()]
+
+    # fresh stream checkpoint: one micro-batch per file, both in one run that holds every trip
+    _run_raw_to_validated(lake, "s1", *stream)
+    pointer, state = store.get_json(pointer_key), store.get_json(state_key)
+    assert (pointer["run_id"], pointer["stream_batches"], pointer["incremental"]) == ("s1", [0, 1], False)
+    assert sum(b["rows"] + b["quarantine_rows"] for b in state["batches"].values()) == generated["rows"]
+    assert validated_run_ids("s1") == ["s1"] * pointer["row_count"]
+
+    # a new file: the next execution's run holds only its trips
+    extra = tlc_gen.generate(tmp_path / "more", 0.002, ["2024"], 3, 0.05, 11)
+    new_file = sorted(extra["files"])[-1]
+    (raw_dir / new_file).write_bytes((tmp_path / "more" / new_file).read_bytes())
+    _run_raw_to_validated(lake, "s2", *stream)
+    pointer, state = store.get_json(pointer_key), store.get_json(state_key)
+    assert (pointer["run_id"], pointer["stream_batches"], pointer["incremental"]) == ("s2", [2], True)
+    assert state["batches"]["2"]["rows"] + state["batches"]["2"]["quarantine_rows"] == extra["files"][new_file]
+    s2_rows = len(validated_run_ids("s2"))
+
+    # the s2 execution failed after writing batch 2, before publishing and before the stream
+    # checkpoint committed it: the next execution replays the batch into the unpublished s2
+    commits = lake / BUCKET / "manifests" / "checkpoints" / "raw_trips_stream" / "commits"
+    for name in ["2", ".2.crc"]:
+        os.remove(commits / name)
+    del state["published_utc"]
+    store.put_json(state_key, state)
+    store.put_json(pointer_key, dict(pointer, run_id="s1"))
+    out = _run_raw_to_validated(lake, "s3", *stream)
+    assert "resuming unpublished run s2" in out and "already written to run s2, skipped" in out
+    pointer = store.get_json(pointer_key)
+    assert (pointer["run_id"], pointer["stream_batches"], pointer["row_count"]) == ("s2", [2], s2_rows)
+    assert len(validated_run_ids("s2")) == s2_rows
+    assert not (lake / BUCKET / "validated" / "trips" / "run_id=s3").exists()
+
+
+def test_conditional_pointer_write_loses_to_a_concurrent_writer(store):
+    key = "curated/rollups/trip_daily/_LATEST.json"
+    assert store.get_json_with_etag(key) == (None, None)
+    assert store.put_json_if_match(key, {"version": 1}, None)
+    # a second "create" loses: the pointer exists now
+    assert not store.put_json_if_match(key, {"version": 0}, None)
+
+    payload, etag = store.get_json_with_etag(key)
+    assert payload == {"version": 1}
+    assert store.put_json_if_match(key, {"version": 2}, etag)
+    # the writer that read version 1 lost the race
+    assert not store.put_json_if_match(key, {"version": 3}, etag)
+    assert store.get_json(key) == {"version": 2}
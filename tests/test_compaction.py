@@ -0,0 +1,186 @@
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+from lake_io import LocalObjectStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUCKET = "lake"
+TRIPS = "validated/trips/"
+
+# Runs glue_compact_trips.py in-process against a moto Glue Catalog holding CATALOG_PARTITIONS
+# and, around every object-store write and delete, resolves run r1 the way the readers do:
+# manifest readers (_MANIFEST.json when present, else every data file in the folder) and
+# Spectrum (the data files of each catalog partition's folder). Records the rows each would see.
+DRIVER = """
+import json, os, runpy, sys
+import boto3
+import pyarrow.parquet as pq
+from moto import mock_aws
+import lake_io
+
+views = []
+mock = mock_aws()
+mock.start()
+glue = boto3.client("glue")
+glue.create_database(DatabaseInput={"Name": "lake"})
+glue.create_table(DatabaseName="lake", TableInput={
+    "Name": "trips",
+    "PartitionKeys": [{"Name": k, "Type": "string"} for k in json.loads(os.environ["PARTITION_KEYS"])],
+    "StorageDescriptor": {"Columns": [{"Name": "trip_id", "Type": "bigint"}], "Location": "s3://lake/trips/"},
+})
+for values, location in json.loads(os.environ["CATALOG_PARTITIONS"]):
+    glue.create_partition(DatabaseName="lake", TableName="trips", PartitionInput={
+        "Values": values, "StorageDescriptor": {"Location": location}})
+
+def _ids(paths):
+    return [i for p in paths for i in pq.read_table(p, columns=["trip_id"]).column("trip_id").to_pylist()]
+
+def reader_view(store, step):
+    run_prefix = os.environ["RUN_PREFIX"]
+    manifest = store.get_json(run_prefix + "_MANIFEST.json")
+    if manifest:
+        paths = [e["url"][len("file://"):] for e in manifest["entries"]]
+    else:
+        paths = [os.path.join(store.base, o["key"]) for o in store.list_objects(run_prefix)
+                 if lake_io.is_data_file(o["key"])]
+    listed = []
+    for partition in glue.get_partitions(DatabaseName="lake", TableName="trips")["Partitions"]:
+        folder = partition["StorageDescriptor"]["Location"][len("file://"):]
+        if os.path.isdir(folder):
+            listed += [os.path.join(folder, n) for n in sorted(os.listdir(folder))
+                       if lake_io.is_data_file(n) and os.path.isfile(os.path.join(folder, n))]
+    ids, spectrum = _ids(paths), _ids(listed)
+    views.append({"step": step, "rows": len(ids), "distinct": len(set(ids)), "files": len(paths),
+                  "spectrum_rows": len(spectrum), "spectrum_distinct": len(set(spectrum))})
+
+for name in ["put_json", "delete_keys"]:
+    def wrap(original, name=name):
+        def call(self, *args, **kwargs):
+            reader_view(self, f"before {name} {args[0] if name == 'put_json' else len(list(args[0]))}")
+            result = original(self, *args, **kwargs)
+            reader_view(self, f"after {name}")
+            return result
+        return call
+    setattr(lake_io.LocalObjectStore, name, wrap(getattr(lake_io.LocalObjectStore, name)))
+
+sys.argv = [sys.argv[1], *sys.argv[3:]]
+try:
+    runpy.run_path(sys.argv[0], run_name="__main__")
+finally:
+    with open(os.environ["VIEWS_OUT"], "w") as fh:
+        json.dump(views, fh)
+"""
+
+
+def _write_run(lake, run_id: str, files: int, rows: int, date_layout: bool = False):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    t = datetime(2024, 1, 1)
+    for f in range(files):
+        ids = list(range(f * rows, (f + 1) * rows))
+        table = pa.table({
+            "trip_id": ids,
+            "tpep_pickup_datetime": [t + timedelta(minutes=i) for i in ids],
+            "total_amount": [10.0] * rows,
+        })
+        leaf = lake / BUCKET / TRIPS / f"run_id={run_id}"
+        if date_layout:
+            leaf = leaf / "pickup_year=2024" / "pickup_month=1" / f"pickup_day={1 + f % 2}"
+        leaf.mkdir(parents=True, exist_ok=True)
+        pq.write_table(table, leaf / f"part-{f:05d}-{run_id}.snappy.parquet")
+    return files * rows
+
+
+def _catalog_partitions(lake, date_layout: bool):
+    """
+    (partition keys, [[values, location]]) of the catalog table over the run folders: the
+    folders holding the runs' data files now, like a catalog kept up to date by compaction.
+    """
+    keys = ["run_id", "pickup_year", "pickup_month", "pickup_day"] if date_layout else ["run_id"]
+    partitions = []
+    for dirpath, _, filenames in sorted(os.walk(lake / BUCKET)):
+        folders = os.path.relpath(dirpath, lake / BUCKET).split(os.sep)
+        runs = [i for i, f in enumerate(folders) if f.startswith("run_id=")]
+        if runs and any(n.endswith(".parquet") for n in filenames):
+            partitions.append([[f.split("=", 1)[1] for f in folders[runs[0]:]], f"file://{dirpath}/"])
+    return keys, partitions
+
+
+def _compact(tmp_path, *job_args, date_layout: bool = False):
+    driver = tmp_path / "driver.py"
+    driver.write_text(DRIVER, encoding="utf-8")
+    views_out = tmp_path / "views.json"
+    partition_keys, partitions = _catalog_partitions(tmp_path / "lake", date_layout)
+    env = dict(os.environ,
+               AWS_ACCESS_KEY_ID="test", AWS_SECRET_ACCESS_KEY="test", AWS_DEFAULT_REGION="us-east-1",
+               PARTITION_KEYS=json.dumps(partition_keys), CATALOG_PARTITIONS=json.dumps(partitions),
+               PYTHONPATH=os.pathsep.join([os.path.join(ROOT, "benchmarks", "shim"), os.path.join(ROOT, "src", "glue")]),
+               PYSPARK_PYTHON=sys.executable,
+               PYSPARK_SUBMIT_ARGS="--master local[1] --conf spark.ui.enabled=false pyspark-shell",
+               RUN_PREFIX=f"{TRIPS}run_id=r1/",
+               VIEWS_OUT=str(views_out))
+    env.pop("BENCH_LAKE_ROOT", None)
+    env.pop("AWS_ENDPOINT_URL", None)
+    proc = subprocess.run([
+        sys.executable, str(driver), os.path.join(ROOT, "src", "glue", "glue_compact_trips.py"), "--",
+        "--JOB_NAME", "test_compact",
+        "--bucket", BUCKET,
+        "--trips_prefix", TRIPS,
+        "--local_root", str(tmp_path / "lake"),
+        "--catalog_database", "lake",
+        "--catalog_table", "trips",
+        *job_args,
+    ], env=env, capture_output=True, text=True, timeout=600)
+    assert proc.returncode == 0, proc.stdout[-4000:] + proc.stderr[-4000:]
+    with open(views_out, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+@pytest.mark.parametrize("date_layout", [False, True])
+def test_readers_never_see_duplicates_during_first_compaction(tmp_path, date_layout):
+    pytest.importorskip("pyspark")
+    pytest.importorskip("moto")
+    rows = _write_run(tmp_path / "lake", "r1", files=6, rows=50, date_layout=date_layout)
+
+    views = _compact(tmp_path, "--min_files", "2", date_layout=date_layout)
+
+    assert views, "compaction wrote nothing"
+    for view in views:
+        assert (view["rows"], view["distinct"]) == (rows, rows), view
+        assert (view["spectrum_rows"], view["spectrum_distinct"]) == (rows, rows), view
+    # the run went from 6 files to one per leaf and ends committed through its manifest
+    assert views[-1]["files"] == (2 if date_layout else 1)
+    store = LocalObjectStore(str(tmp_path / "lake"), BUCKET)
+    manifest = store.get_json(f"{TRIPS}run_id=r1/_MANIFEST.json")
+    assert len(manifest["entries"]) == views[-1]["files"]
+    assert store.get_json(f"{TRIPS}run_id=r1/_COMPACTION.json") is None
+
+
+def test_recompaction_moves_the_run_to_a_new_generation(tmp_path):
+    pytest.importorskip("pyspark")
+    pytest.importorskip("moto")
+    rows = _write_run(tmp_path / "lake", "r1", files=6, rows=50)
+    store = LocalObjectStore(str(tmp_path / "lake"), BUCKET)
+    # a target of a third of the run: the first compaction leaves about three files
+    size = sum(o["size"] for o in store.list_objects(f"{TRIPS}run_id=r1/"))
+    _compact(tmp_path, "--min_files", "2", "--target_file_mb", str(size / 3 / (1024 * 1024)))
+    first = store.get_json(f"{TRIPS}run_id=r1/_MANIFEST.json")
+    assert 1 < len(first["entries"]) < 6
+
+    # the first generation's files are compacted again, into a second generation
+    views = _compact(tmp_path, "--min_files", "2")
+    for view in views:
+        assert (view["rows"], view["distinct"]) == (rows, rows), view
+        assert (view["spectrum_rows"], view["spectrum_distinct"]) == (rows, rows), view
+    second = store.get_json(f"{TRIPS}run_id=r1/_MANIFEST.json")
+    assert len(second["entries"]) == 1
+    compacted = [o["key"] for o in store.list_objects(TRIPS.rstrip("/") + "_compacted/")]
+    # nothing is left of the first generation, nor of the original run folder's data files
+    assert compacted == [second["entries"][0]["url"][len(store.uri("")):]]
+    assert [o["key"] for o in store.list_objects(f"{TRIPS}run_id=r1/")] == [f"{TRIPS}run_id=r1/_MANIFEST.json"]
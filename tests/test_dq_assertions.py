@@ -0,0 +1,108 @@
+import json
+import os
+
+import pytest
+
+import dq_assertions as dq
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+# final_dq / final_fact stand-ins (11_dq_schema.sql, 09_fact.sql columns the assertions read)
+DDL = [
+    "CREATE SCHEMA IF NOT EXISTS final_dq",
+    "CREATE SCHEMA IF NOT EXISTS final_fact",
+    """CREATE TABLE final_dq.test_results (
+         test_run_id UUID NOT NULL DEFAULT gen_random_uuid(), test_name TEXT NOT NULL, passed BOOLEAN NOT NULL,
+         metric_value NUMERIC NULL, threshold NUMERIC NULL, details TEXT NULL,
+         created_at TIMESTAMPTZ NOT NULL DEFAULT now(), created_by TEXT NOT NULL DEFAULT current_user)""",
+    """CREATE TABLE final_fact.trip_fact (
+         vendor_sk BIGINT, ratecode_sk BIGINT, payment_type_sk BIGINT, pickup_zone_sk BIGINT,
+         dropoff_zone_sk BIGINT, pickup_datetime TIMESTAMP, dropoff_datetime TIMESTAMP,
+         trip_distance DOUBLE PRECISION, total_amount DOUBLE PRECISION, run_id VARCHAR(256))""",
+]
+TABLES = [dq.RESULTS_TABLE, "final_fact.trip_fact"]
+ROWS = 2000
+
+
+@pytest.fixture
+def warehouse(pg_params, tmp_path):
+    """
+    final_fact.trip_fact seeded with run r1, and the same rows as fact-layout parquet in
+    two files under <tmp>/trip_fact/run_id=r1/. Every 100th row has a negative distance,
+    every 50th a dropoff before pickup, every 20th no vendor_sk: 3 failing tests.
+    """
+    conn = dq._connect(pg_params)
+    cur = conn.cursor()
+    cur.execute(f"DROP TABLE IF EXISTS {', '.join(TABLES)}")
+    for ddl in DDL:
+        cur.execute(ddl)
+    cur.execute("""
+        INSERT INTO final_fact.trip_fact
+        SELECT CASE WHEN i %% 20 = 0 THEN NULL ELSE 1 END, 1, 2, 1 + i %% 265, 1 + i %% 263,
+               TIMESTAMP '2024-01-01' + i * INTERVAL '1 minute',
+               TIMESTAMP '2024-01-01' + (i + CASE WHEN i %% 50 = 0 THEN -5 ELSE 12 END) * INTERVAL '1 minute',
+               CASE WHEN i %% 100 = 0 THEN -1.0 ELSE 2.5 END, 15.5, 'r1'
+        FROM generate_series(0, %s - 1) i""", (ROWS,))
+    conn.commit()
+
+    cur.execute("SELECT * FROM final_fact.trip_fact")
+    names = [d[0] for d in cur.description]
+    fetched = cur.fetchall()
+    table = pa.table({name: [r[k] for r in fetched] for k, name in enumerate(names)}).drop(["run_id"])
+    run_dir = tmp_path / "trip_fact" / "run_id=r1"
+    run_dir.mkdir(parents=True)
+    pq.write_table(table.slice(0, ROWS // 2), run_dir / "part-00000.parquet")
+    pq.write_table(table.slice(ROWS // 2), run_dir / "part-00001.parquet")
+
+    yield pg_params, cur, run_dir
+    conn.rollback()
+    cur.execute(f"DROP TABLE IF EXISTS {', '.join(TABLES)}")
+    conn.commit()
+    conn.close()
+
+
+def _metrics(summary):
+    return [r["metric_value"] for r in summary["results"]]
+
+
+def test_table_and_parquet_sources_agree(warehouse):
+    params, cur, run_dir = warehouse
+    by_table = dq.run_assertions(params, "table", run_id="r1")
+    by_parquet = dq.run_assertions(params, "parquet", path=str(run_dir))
+
+    assert _metrics(by_table) == _metrics(by_parquet)
+    failed = {r["test_name"].rsplit(".", 1)[1] for r in by_table["results"] if not r["passed"]}
+    assert failed == {"negative_distance_count_eq_0", "bad_time_order_count_eq_0", "vendor_fk_fill_rate_ge_0_995"}
+    assert (by_table["failed"], by_parquet["failed"]) == (3, 3)
+
+    # one INSERT per evaluation, one row per assertion
+    cur.execute(f"SELECT count(DISTINCT test_run_id), count(*), sum(CASE WHEN passed THEN 0 ELSE 1 END) "
+                f"FROM {dq.RESULTS_TABLE}")
+    assert list(cur.fetchone()) == [2, 2 * len(dq.ASSERTIONS), 6]
+
+
+def test_compacted_run_is_read_through_its_manifest(warehouse, tmp_path):
+    params, _, run_dir = warehouse
+    expected = _metrics(dq.run_assertions(params, "parquet", path=str(run_dir), write=False))
+
+    # the run folder keeps only the manifest; the files live in a compacted generation
+    compacted = tmp_path / "trip_fact_compacted" / "c1" / "run_id=r1"
+    compacted.mkdir(parents=True)
+    entries = []
+    for f in sorted(run_dir.iterdir()):
+        os.replace(f, compacted / f.name)
+        entries.append({"url": f"file://{compacted / f.name}", "mandatory": True,
+                        "meta": {"content_length": (compacted / f.name).stat().st_size}})
+    (run_dir / "_MANIFEST.json").write_text(json.dumps({"entries": entries}), encoding="utf-8")
+
+    assert _metrics(dq.run_assertions(params, "parquet", path=str(run_dir), write=False)) == expected
+
+
+def test_curated_layout_parquet_is_rejected(tmp_path):
+    # curated rows carry natural ids, not the *_sk keys the fill-rate tests read
+    pq.write_table(pa.table({"VendorID": [1, 2], "tpep_pickup_datetime": [None, None],
+                             "trip_distance": [1.0, 2.0], "total_amount": [5.0, 6.0]}),
+                   tmp_path / "part-00000.parquet")
+    with pytest.raises(Exception, match="not fact-layout parquet"):
+        dq.parquet_metrics(str(tmp_path), dq.ASSERTIONS)
@@ -0,0 +1,54 @@
+import importlib
+import json
+
+import pytest
+
+moto = pytest.importorskip("moto")
+
+BUCKET = "mdm-lake"
+PREFIX = "validated/master_snapshot/zonesnapshots/"
+
+
+@pytest.fixture
+def lambda_s3(monkeypatch):
+    import boto3
+
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        freshness_check = importlib.import_module("freshness_check")
+        monkeypatch.setattr(freshness_check, "s3", client)
+        yield freshness_check, client
+
+
+def _check(freshness_check, **event):
+    return freshness_check.lambda_handler({"bucket": BUCKET, "snapshot_prefix": PREFIX, **event}, None)
+
+
+def test_pointer_gives_the_snapshot_without_listing(lambda_s3):
+    freshness_check, client = lambda_s3
+    client.put_object(Bucket=BUCKET, Key=f"{PREFIX}_LATEST.json", Body=json.dumps({
+        "snapshot_id": "20261017T000000", "row_counts": {"zones": 265},
+        "committed_utc": "2026-10-17T00:00:00+00:00"}))
+
+    result = _check(freshness_check, max_age_hours="1000000")
+    assert (result["metadataSource"], result["snapshotId"], result["freshnessOk"]) == (
+        "pointer", "20261017T000000", True)
+
+
+def test_listing_cut_short_by_the_page_cap_reports_unknown(lambda_s3, monkeypatch):
+    freshness_check, client = lambda_s3
+    # more snapshot folders than one 1000-key page
+    for i in range(1001):
+        client.put_object(Bucket=BUCKET, Key=f"{PREFIX}snapshot_id={i:06d}/part-0.parquet", Body=b"x")
+    monkeypatch.setenv("SNAPSHOT_LIST_MAX_PAGES", "1")
+
+    result = _check(freshness_check)
+    assert result["freshnessOk"] is False and result["freshnessUnknown"] is True
+    assert "SNAPSHOT_LIST_MAX_PAGES" in result["reason"] and "snapshotId" not in result
+
+    # starting after the snapshot the caller knows, one page reaches the newest folder
+    result = _check(freshness_check, last_snapshot_id="snapshot_id=000990", max_age_hours="1")
+    assert (result["freshnessUnknown"], result["snapshotId"], result["freshnessOk"]) == (
+        False, "snapshot_id=001000", True)
@@ -0,0 +1,225 @@
+import ast
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUCKET = "golden"
+ENTITIES = ["zone", "vendor", "ratecode"]
+
+# Runs mdm_golden_snapshot_final.py once per GOLDEN_RUNS entry in one process (a new
+# SparkContext per run) and records the zone _LATEST pointer after each. JDBC reads of
+# the golden views are served from RDS_STATES[run["state"]] instead of RDS.
+DRIVER = """
+import json, os, runpy, sys
+import boto3
+from pyspark import SparkContext
+from pyspark.sql import readwriter
+
+STATES = json.loads(os.environ["RDS_STATES"])
+COLUMNS = "golden_sk, location_id, zone, effective_from, effective_to, is_current, created_at"
+state = None
+
+def _ts(v):
+    return f"TIMESTAMP '{v}'" if v else "CAST(NULL AS TIMESTAMP)"
+
+class GoldenViews:
+    def __init__(self, spark):
+        self.spark, self.opts = spark, {}
+
+    def option(self, key, value):
+        self.opts[key] = value
+        return self
+
+    def load(self):
+        select, view = (self.opts.get("query") or f"SELECT * FROM {self.opts['dbtable']}").rsplit(" FROM ", 1)
+        values = ", ".join(f"({sk}, {loc}, '{zone}', {_ts(frm)}, {_ts(to)}, {str(cur).lower()}, {_ts(created)})"
+                           for sk, loc, zone, frm, to, cur, created in STATES[state][view])
+        self.spark.sql(f"SELECT * FROM VALUES {values} AS t({COLUMNS})").createOrReplaceTempView(f"rds_{view}")
+        return self.spark.sql(f"{select} FROM rds_{view}")
+
+original_format = readwriter.DataFrameReader.format
+readwriter.DataFrameReader.format = lambda self, source: (
+    GoldenViews(self._spark) if source == "jdbc" else original_format(self, source))
+
+s3 = boto3.client("s3")
+script, pointers = sys.argv[1], []
+for run in json.loads(os.environ["GOLDEN_RUNS"]):
+    state = run["state"]
+    sys.argv = [script, *run["args"]]
+    runpy.run_path(script, run_name="__main__")
+    SparkContext._active_spark_context.stop()
+    key = run["args"][run["args"].index("--s3_validated_base") + 1].split("/", 3)[3] + "/_LATEST.json"
+    pointers.append(json.loads(s3.get_object(Bucket=os.environ["GOLDEN_BUCKET"], Key=key)["Body"].read()))
+
+with open(os.environ["GOLDEN_OUT"], "w") as fh:
+    json.dump(pointers, fh)
+"""
+
+D0, D1, D2, D3, D4 = (f"2024-01-0{d} 10:00:00" for d in range(1, 6))
+
+
+def _expire(rows, sk, at):
+    return [[*r[:4], at, False, r[6]] if r[0] == sk else r for r in rows]
+
+
+# the zone golden view after each day's MDM publish: (golden_sk, location_id, zone,
+# effective_from, effective_to, is_current, created_at)
+S0 = [[1, 1, "Newark Airport", D0, None, True, D0], [2, 2, "Jamaica Bay", D0, None, True, D0],
+      [3, 3, "Allerton", D0, None, True, D0], [4, 4, "Alphabet City", D0, None, True, D0]]
+# location 2 renamed, location 5 added
+S1 = _expire(S0, 2, D1) + [[5, 2, "Jamaica Bay East", D1, None, True, D1], [6, 5, "Arden Heights", D1, None, True, D1]]
+# location 3 retired, location 5 renamed
+S2 = _expire(_expire(S1, 3, D2), 6, D2) + [[7, 5, "Arden Heights South", D2, None, True, D2]]
+S3 = _expire(S2, 1, D3) + [[8, 1, "Newark Airport Terminal", D3, None, True, D3]]
+S4 = _expire(S3, 4, D4) + [[9, 4, "Alphabet City North", D4, None, True, D4]]
+# vendor / ratecode never change here
+STATIC = [[1, 1, "static", D0, None, True, D0]]
+
+
+def _state(zone_rows):
+    return {"v_mdm_zone_golden_all_v2": zone_rows,
+            "v_mdm_vendor_golden_all_v2": STATIC,
+            "v_mdm_rate_code_golden_all_v2": STATIC}
+
+
+def _run(snapshot_id, state, prefix="golden", *job_args):
+    return {"state": state, "args": [
+        "--JOB_NAME", f"golden_{snapshot_id}",
+        "--pg_jdbc_url", "jdbc:postgresql://rds.internal:5432/mdm",
+        "--pg_secret_id", "mdm-pg",
+        "--db_name", "mdm",
+        "--snapshot_id", snapshot_id,
+        *[a for n, e in zip(["", "2", "3"], ENTITIES) for a in (f"--s3_validated_base{n}", f"s3://{BUCKET}/{prefix}/{e}")],
+        *job_args]}
+
+
+RUNS = [
+    _run("s1", "S0", "golden", "--snapshot_mode", "delta"),
+    _run("s2", "S1", "golden", "--snapshot_mode", "delta"),
+    _run("s2", "S1", "golden", "--snapshot_mode", "delta"),
+    _run("s3", "S2", "golden", "--snapshot_mode", "delta"),
+    _run("f2", "S2", "full_s2"),
+    _run("s4", "S3", "golden", "--snapshot_mode", "delta", "--compact_every", "3"),
+    _run("f3", "S3", "full_s3"),
+    _run("s5", "S4", "golden", "--snapshot_mode", "delta", "--compact_every", "3"),
+]
+
+
+@pytest.fixture(scope="module")
+def chain(tmp_path_factory):
+    """Zone _LATEST pointer after each of RUNS, and the lake the snapshots were written to."""
+    pytest.importorskip("pyspark")
+    pytest.importorskip("moto")
+    import boto3
+    import run_bench
+
+    work = tmp_path_factory.mktemp("golden")
+    server, endpoint = run_bench._start_moto()
+    try:
+        aws = dict(endpoint_url=endpoint, aws_access_key_id="test", aws_secret_access_key="test")
+        boto3.client("s3", region_name="us-east-1", **aws).create_bucket(Bucket=BUCKET)
+        boto3.client("secretsmanager", region_name="us-east-2", **aws).create_secret(
+            Name="mdm-pg", SecretString=json.dumps({"username": "u", "password": "p"}))
+
+        driver = work / "driver.py"
+        driver.write_text(DRIVER, encoding="utf-8")
+        out = work / "pointers.json"
+        env = dict(os.environ,
+                   AWS_ENDPOINT_URL=endpoint, AWS_ACCESS_KEY_ID="test", AWS_SECRET_ACCESS_KEY="test",
+                   AWS_DEFAULT_REGION="us-east-1",
+                   BENCH_LAKE_ROOT=str(work / "lake"),
+                   GOLDEN_BUCKET=BUCKET, GOLDEN_OUT=str(out), GOLDEN_RUNS=json.dumps(RUNS),
+                   RDS_STATES=json.dumps({n: _state(s) for n, s in [("S0", S0), ("S1", S1), ("S2", S2),
+                                                                    ("S3", S3), ("S4", S4)]}),
+                   PYTHONPATH=os.pathsep.join([os.path.join(ROOT, "benchmarks", "shim"),
+                                               os.path.join(ROOT, "src", "glue")]),
+                   PYSPARK_PYTHON=sys.executable,
+                   PYSPARK_SUBMIT_ARGS="--master local[2] --driver-memory 1g --conf spark.ui.enabled=false "
+                                       "--conf spark.sql.session.timeZone=UTC pyspark-shell")
+        result = subprocess.run(
+            [sys.executable, str(driver), os.path.join(ROOT, "src", "glue", "mdm_golden_snapshot_final.py")],
+            env=env, capture_output=True, text=True, cwd=work)
+        assert result.returncode == 0, result.stdout[-3000:] + result.stderr[-3000:]
+        yield json.loads(out.read_text()), work / "lake"
+    finally:
+        server.stop()
+
+
+def _enrich_function(name):
+    """One function of the enrich job (the script itself runs its job on import)."""
+    from pyspark.sql import Window
+    from pyspark.sql import functions as F
+
+    path = os.path.join(ROOT, "src", "glue", "glue_enrich_to_curated.py")
+    node = next(n for n in ast.parse(open(path, encoding="utf-8").read()).body
+                if isinstance(n, ast.FunctionDef) and n.name == name)
+    scope = {"F": F, "Window": Window}
+    exec(compile(ast.Module([node], type_ignores=[]), path, "exec"), scope)
+    return scope[name]
+
+
+def _local(lake, url):
+    return str(lake / url[len("s3://"):])
+
+
+def _rows(df):
+    return sorted(tuple(r) for r in df.select("golden_sk", "location_id", "zone", "is_current").collect())
+
+
+def _current_view(spark, lake, pointer):
+    """The enrich job's read of a delta-mode pointer: base current/ + deltas, newest version wins."""
+    from pyspark.sql import functions as F
+
+    paths = [pointer["base"]["current_path"]] + [d["path"] for d in pointer["deltas"]]
+    df = None
+    for pos, path in enumerate(paths):
+        part = spark.read.parquet(_local(lake, path)).withColumn("_chain_pos", F.lit(pos))
+        df = part if df is None else df.unionByName(part, allowMissingColumns=True)
+    return _rows(_enrich_function("_current_golden_view")(df))
+
+
+def _snapshot_ids(pointer):
+    return pointer["base"]["snapshot_id"], [d["snapshot_id"] for d in pointer["deltas"]]
+
+
+def test_base_and_deltas_rebuild_the_full_export(spark, chain):
+    pointers, lake = chain
+    assert [p["snapshot_mode"] for p in pointers[:4]] == ["full", "delta", "delta", "delta"]
+    assert _snapshot_ids(pointers[3]) == ("s1", ["s2", "s3"])
+
+    full = pointers[4]
+    assert full["snapshot_mode"] == "full"
+    expected = _rows(spark.read.parquet(_local(lake, full["base"]["current_path"])))
+    assert expected == [(1, 1, "Newark Airport", True), (4, 4, "Alphabet City", True),
+                        (5, 2, "Jamaica Bay East", True), (7, 5, "Arden Heights South", True)]
+    assert _current_view(spark, lake, pointers[3]) == expected
+
+
+def test_rerun_of_a_delta_does_not_append_it_twice(chain):
+    pointers, _ = chain
+    assert _snapshot_ids(pointers[1]) == ("s1", ["s2"])
+    assert _snapshot_ids(pointers[2]) == ("s1", ["s2"])
+    # the rerun exports again from the watermark the first attempt started at
+    assert pointers[2]["since_utc"] == pointers[1]["since_utc"]
+    assert pointers[2]["deltas"] == pointers[1]["deltas"]
+
+
+def test_compaction_resets_the_chain(spark, chain):
+    pointers, lake = chain
+    compacted, full, after = pointers[5], pointers[6], pointers[7]
+    assert compacted["snapshot_mode"] == "compact"
+    assert _snapshot_ids(compacted) == ("s4", [])
+
+    # the compacted snapshot holds every version, like a full export of the same state
+    assert _rows(spark.read.parquet(_local(lake, compacted["base"]["path"]))) == \
+        _rows(spark.read.parquet(_local(lake, full["base"]["path"])))
+    assert _current_view(spark, lake, compacted) == _rows(spark.read.parquet(_local(lake, full["base"]["current_path"])))
+
+    # the next delta starts a new chain on the compacted base
+    assert after["snapshot_mode"] == "delta"
+    assert _snapshot_ids(after) == ("s4", ["s5"])
+    assert (9, 4, "Alphabet City North", True) in _current_view(spark, lake, after)
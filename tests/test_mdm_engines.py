@@ -0,0 +1,157 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ZONES_CSV = os.path.join(ROOT, "data", "taxi_zone_lookup.csv")
+BUCKET = "mdm"
+
+# Runs mdm_zones_ingest_final.py in-process against moto (secret + input CSV) and records
+# the rows each engine hands to pg_bulk instead of writing them to RDS. After a Spark-path
+# run it also casts CAST_SAMPLES with Spark, next to the local engine's _to_int.
+DRIVER = """
+import json, os, runpy, sys
+import boto3
+from moto import mock_aws
+import pg_bulk
+
+out = {"writes": {}}
+
+def bulk_write_rows(rows, params, table, columns, batch_id, stage_table=None):
+    out["writes"][table] = [dict(zip(columns, r)) for r in rows]
+    return {"table": table, "rows": len(rows)}
+
+def bulk_write_df(df, params, table, batch_id, stage_table=None, max_writers=8):
+    return bulk_write_rows([tuple(r) for r in df.collect()], params, table, df.columns, batch_id)
+
+pg_bulk.bulk_write_rows = bulk_write_rows
+pg_bulk.bulk_write_df = bulk_write_df
+
+with mock_aws():
+    boto3.client("secretsmanager", region_name="us-east-2").create_secret(
+        Name="mdm-pg", SecretString=json.dumps({"username": "u", "password": "p"}))
+    s3 = boto3.client("s3")
+    s3.create_bucket(Bucket=os.environ["MDM_BUCKET"])
+    for key, path in json.loads(os.environ["MDM_OBJECTS"]).items():
+        s3.upload_file(path, os.environ["MDM_BUCKET"], key)
+
+    sys.argv = sys.argv[1:]
+    try:
+        script = runpy.run_path(sys.argv[0], run_name="__main__")
+    except SystemExit:
+        script = None   # the local engine exits once written
+    if script is not None:
+        from pyspark.sql import functions as F
+        samples = json.loads(os.environ["CAST_SAMPLES"])
+        cast = (script["spark"].range(1)
+                .select(F.posexplode(F.array(*[F.lit(s) for s in samples])))
+                .select(F.col("col").cast("int").alias("v"))
+                .collect())
+        out["casts"] = {"spark": [r["v"] for r in cast], "local": [script["_to_int"](s) for s in samples]}
+
+with open(os.environ["MDM_OUT"], "w") as fh:
+    json.dump(out, fh, default=int)
+"""
+
+# strings the zone CSV's LocationID could plausibly hold, including the non-ANSI cast's edge cases
+CAST_SAMPLES = [
+    "42", " 42 ", "+7", "-3", "-3.9", "3.", ".5", "007", "\t12\n", "\x0b5\x1f", "12\x00", "\x7f5",
+    "\xa05", "\u30005", "\uff11\uff12",
+    "", " ", "+", "-", ".", "1e3", "0x1F", "12a", "1,000", "2147483647", "2147483648",
+    "-2147483648", "-2147483649", "99999999999999999999", "1.2.3", "- 1", "+-1",
+]
+
+
+def _ingest(tmp_path, name, *job_args, objects=None, input_url=f"s3://{BUCKET}/input/taxi_zone_lookup.csv"):
+    """Runs the ingest over objects ({key: local file}, uploaded to moto and the Spark lake)."""
+    lake = tmp_path / "lake"
+    objects = objects or {"input/taxi_zone_lookup.csv": ZONES_CSV}
+    for key, path in objects.items():
+        dest = lake / BUCKET / key
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, dest)
+
+    driver = tmp_path / "driver.py"
+    driver.write_text(DRIVER, encoding="utf-8")
+    out = tmp_path / f"{name}.json"
+    env = dict(os.environ,
+               AWS_ACCESS_KEY_ID="test", AWS_SECRET_ACCESS_KEY="test", AWS_DEFAULT_REGION="us-east-1",
+               BENCH_LAKE_ROOT=str(lake),
+               MDM_BUCKET=BUCKET, MDM_OBJECTS=json.dumps(objects), MDM_OUT=str(out),
+               CAST_SAMPLES=json.dumps(CAST_SAMPLES),
+               PYTHONPATH=os.pathsep.join([os.path.join(ROOT, "benchmarks", "shim"), os.path.join(ROOT, "src", "glue")]),
+               PYSPARK_PYTHON=sys.executable,
+               PYSPARK_SUBMIT_ARGS="--master local[2] --driver-memory 1g --conf spark.ui.enabled=false pyspark-shell")
+    env.pop("AWS_ENDPOINT_URL", None)
+    result = subprocess.run(
+        [sys.executable, str(driver), os.path.join(ROOT, "src", "glue", "mdm_zones_ingest_final.py"),
+         "--JOB_NAME", f"mdm_{name}",
+         "--s3_input_csv", input_url,
+         "--pg_jdbc_url", "jdbc:postgresql://rds.internal:5432/mdm",
+         "--pg_secret_id", "mdm-pg",
+         "--db_name", "mdm",
+         "--batch_id", "b1",
+         "--auto_merge_threshold", "90",
+         "--steward_min_threshold", "70",
+         *job_args],
+        env=env, capture_output=True, text=True, cwd=tmp_path)
+    assert result.returncode == 0, result.stdout[-3000:] + result.stderr[-3000:]
+    return json.loads(out.read_text())
+
+
+def _sorted(rows, *keys):
+    return sorted(rows, key=lambda r: tuple(r[k] for k in keys))
+
+
+@pytest.fixture(scope="module")
+def engines(tmp_path_factory):
+    pytest.importorskip("pyspark")
+    pytest.importorskip("moto")
+    local = _ingest(tmp_path_factory.mktemp("mdm_local"), "local", "--local_engine_max_bytes", str(1 << 30))
+    spark = _ingest(tmp_path_factory.mktemp("mdm_spark"), "spark", "--pg_writer", "copy")
+    return local, spark
+
+
+def test_local_and_spark_engines_write_the_same_rows(engines):
+    local, spark = engines
+    # each run took the engine it was meant to
+    assert "casts" not in local and "casts" in spark
+
+    records = [_sorted(run["writes"]["mdm_zone_record_v2"], "location_id") for run in engines]
+    matches = [_sorted(run["writes"]["mdm_zone_match_v2"], "location_id_1", "location_id_2") for run in engines]
+
+    assert len(records[0]) == 265
+    assert records[0] == records[1]
+    # both tiers occur, so classification and the pending status are compared too
+    assert {m["action"] for m in matches[0]} == {"AUTO_MERGE", "STEWARD_REVIEW"}
+    assert matches[0] == matches[1]
+
+
+def test_to_int_follows_spark_cast(engines):
+    _, spark = engines
+    assert spark["casts"]["local"] == spark["casts"]["spark"]
+
+
+def test_folder_input_takes_the_header_of_its_first_file(engines, tmp_path):
+    # the zone CSV split in two, each part with its own header, plus the markers Spark skips
+    lines = open(ZONES_CSV, encoding="utf-8").read().splitlines(keepends=True)
+    parts = {"part-00000.csv": [lines[0], *lines[1:130]], "part-00001.csv": [lines[0], *lines[130:]],
+             "_SUCCESS": []}
+    objects = {}
+    for name, content in parts.items():
+        (tmp_path / name).write_text("".join(content), encoding="utf-8")
+        objects[f"input/zones/{name}"] = str(tmp_path / name)
+
+    folder = _ingest(tmp_path, "folder", "--pg_writer", "copy",
+                     objects=objects, input_url=f"s3://{BUCKET}/input/zones")
+
+    _, spark = engines
+    for table, keys in [("mdm_zone_record_v2", ["location_id"]),
+                        ("mdm_zone_match_v2", ["location_id_1", "location_id_2"])]:
+        got = [dict(r, source_file=None) for r in _sorted(folder["writes"][table], *keys)]
+        want = [dict(r, source_file=None) for r in _sorted(spark["writes"][table], *keys)]
+        assert got == want
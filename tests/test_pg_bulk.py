@@ -0,0 +1,95 @@
+import sys
+
+import pytest
+
+import pg_bulk
+
+COLUMNS = ["batch_id", "id", "label"]
+
+
+@pytest.fixture
+def tables(pg_params):
+    with pg_bulk._transaction(pg_params) as cur:
+        cur.execute("DROP TABLE IF EXISTS pg_bulk_test, pg_bulk_test_stage")
+        cur.execute("CREATE TABLE pg_bulk_test (batch_id TEXT NOT NULL, id INT NOT NULL, label TEXT, "
+                    "PRIMARY KEY (batch_id, id))")
+        cur.execute("CREATE UNLOGGED TABLE pg_bulk_test_stage (part_id INT NOT NULL, batch_id TEXT NOT NULL, "
+                    "id INT, label TEXT)")
+    yield pg_params
+    with pg_bulk._transaction(pg_params) as cur:
+        cur.execute("DROP TABLE IF EXISTS pg_bulk_test, pg_bulk_test_stage")
+
+
+def _query(params, sql, args=()):
+    with pg_bulk._transaction(params) as cur:
+        cur.execute(sql, args)
+        return [list(r) for r in cur.fetchall()]
+
+
+def test_connect_params_from_jdbc_url():
+    assert pg_bulk.pg_connect_params("jdbc:postgresql://db.internal:6543/mdm", "u", "p") == {
+        "user": "u", "password": "p", "host": "db.internal", "port": 6543, "database": "mdm"}
+    assert pg_bulk.pg_connect_params("postgresql://db.internal/", "u", "p", "fallback")["database"] == "fallback"
+    assert pg_bulk.pg_connect_params("postgresql://db.internal/", "u", "p")["port"] == 5432
+
+
+def test_copy_line_escapes_text_format():
+    assert pg_bulk._copy_line(("a\tb", None, "c\\d\ne\r", 3)) == "a\\tb\t\\N\tc\\\\d\\ne\\r\t3\n"
+
+
+def test_bulk_write_round_trips_special_text(tables):
+    labels = ["tab\there", "back\\slash", "new\nline", "cr\rhere", "", None, "\\N"]
+    rows = [("b1", i, label) for i, label in enumerate(labels)]
+    stats = pg_bulk.bulk_write_rows(rows, tables, "pg_bulk_test", COLUMNS, "b1")
+
+    assert stats["rows"] == len(rows)
+    assert _query(tables, "SELECT batch_id, id, label FROM pg_bulk_test ORDER BY id") == [list(r) for r in rows]
+    # the stage is emptied by the merge
+    assert _query(tables, "SELECT count(*) FROM pg_bulk_test_stage") == [[0]]
+
+
+def test_rewriting_a_batch_replaces_only_that_batch(tables):
+    pg_bulk.bulk_write_rows([("b1", i, "old") for i in range(5)], tables, "pg_bulk_test", COLUMNS, "b1")
+    pg_bulk.bulk_write_rows([("b2", i, "other") for i in range(3)], tables, "pg_bulk_test", COLUMNS, "b2")
+    pg_bulk.bulk_write_rows([("b1", i, "new") for i in range(4)], tables, "pg_bulk_test", COLUMNS, "b1")
+
+    assert _query(tables, "SELECT batch_id, label, count(*) FROM pg_bulk_test GROUP BY 1, 2 ORDER BY 1") == [
+        ["b1", "new", 4], ["b2", "other", 3]]
+
+
+def test_retried_partition_replaces_its_stage_rows(tables):
+    stage_cols = ["batch_id", "id", "label"]
+    pg_bulk.copy_rows([("b1", i, "p0") for i in range(10)], tables, "pg_bulk_test_stage", stage_cols, "b1",
+                      part_id=0, chunk_rows=3)
+    pg_bulk.copy_rows([("b1", i, "p1") for i in range(10, 15)], tables, "pg_bulk_test_stage", stage_cols, "b1",
+                      part_id=1)
+    # partition 1 retried by Spark with the same rows
+    pg_bulk.copy_rows([("b1", i, "p1") for i in range(10, 15)], tables, "pg_bulk_test_stage", stage_cols, "b1",
+                      part_id=1)
+
+    assert _query(tables, "SELECT part_id, count(*) FROM pg_bulk_test_stage GROUP BY 1 ORDER BY 1") == [
+        [0, 10], [1, 5]]
+    assert pg_bulk.merge_stage(tables, "pg_bulk_test", "pg_bulk_test_stage", stage_cols, "b1") == 15
+
+
+def test_failed_transaction_is_rolled_back_and_connection_dropped(tables):
+    pg_bulk.bulk_write_rows([("b1", 1, "kept")], tables, "pg_bulk_test", COLUMNS, "b1")
+    pool_key = tuple(sorted(tables.items()))
+
+    # duplicate primary key: the merge fails after its DELETE
+    with pytest.raises(Exception):
+        pg_bulk.bulk_write_rows([("b1", 1, "a"), ("b1", 1, "b")], tables, "pg_bulk_test", COLUMNS, "b1")
+    assert pool_key not in pg_bulk._POOL
+
+    assert _query(tables, "SELECT label FROM pg_bulk_test WHERE batch_id = 'b1'") == [["kept"]]
+
+
+# Glue 4.0 runs Python 3.10; the cloudpickle bundled with PySpark 3.3 cannot pickle 3.11 functions
+@pytest.mark.skipif(sys.version_info >= (3, 11), reason="PySpark 3.3 cannot ship Python 3.11 functions")
+def test_bulk_write_df_copies_every_partition(tables, spark):
+    df = spark.sql("SELECT 'b1' AS batch_id, CAST(id AS INT) AS id, CONCAT('row ', id) AS label "
+                   "FROM range(0, 1000, 1, 4)")
+    stats = pg_bulk.bulk_write_df(df, tables, "pg_bulk_test", "b1", max_writers=2)
+
+    assert stats["rows"] == 1000
+    assert _query(tables, "SELECT count(*), count(DISTINCT id) FROM pg_bulk_test") == [[1000, 1000]]
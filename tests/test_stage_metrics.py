@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip("pyspark")
+
+from pyspark.sql import functions as F  # noqa: E402
+
+from stage_metrics import StageMetrics  # noqa: E402
+
+
+def test_task_metrics_without_the_spark_ui(spark, tmp_path):
+    # the session fixture runs with spark.ui.enabled=false, like the job tests
+    assert spark.sparkContext._jsc.sc().uiWebUrl().isEmpty()
+    path = str(tmp_path / "ids")
+
+    perf = StageMetrics(spark, "stage_metrics_test")
+    perf.start("write")
+    spark.range(0, 200_000, numPartitions=2).withColumn("v", F.col("id") * 3).write.parquet(path)
+    perf.start("read")
+    assert spark.read.parquet(path).agg(F.sum("v")).first()[0] == 3 * 199_999 * 200_000 // 2
+    perf.start("idle")
+    summary = perf.summary()
+
+    assert summary["task_metrics_source"] == "spark_status_store"
+    stages = summary["stages"]
+    assert stages["read"]["input_bytes"] > 0
+    assert stages["write"]["output_bytes"] > 0
+    assert stages["write"]["input_bytes"] == 0
+    # a stage that ran no Spark job keeps zeroed metrics
+    assert stages["idle"]["executor_run_ms"] == 0
+    assert {m["MetricName"] for m in perf.metric_data()} >= {"StageInputBytes", "StageSeconds"}
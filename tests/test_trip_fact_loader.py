@@ -0,0 +1,167 @@
+import io
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import pg_bulk
+import trip_fact_loader as loader
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+@pytest.fixture
+def warehouse(pg_params):
+    """final_dim / final_fact / final_staging stand-ins (loader self-check DDL) with seeded dimensions."""
+    conn = loader._connect(pg_params)
+    cur = conn.cursor()
+    cur.execute(f"DROP TABLE IF EXISTS {', '.join(loader._SELFCHECK_TABLES)}")
+    for ddl in loader._SELFCHECK_DDL:
+        cur.execute(ddl)
+    cur.execute("INSERT INTO final_dim.vendor_dim (vendor_id) VALUES (1), (2), (6), (7)")
+    cur.execute("INSERT INTO final_dim.ratecode_dim (rate_code_id) SELECT g FROM generate_series(1, 6) g")
+    cur.execute("INSERT INTO final_dim.ratecode_dim (rate_code_id) VALUES (99)")
+    cur.execute("INSERT INTO final_dim.payment_type_dim (payment_type_id) SELECT g FROM generate_series(0, 6) g")
+    cur.execute("INSERT INTO final_dim.zone_dim (location_id) SELECT g FROM generate_series(1, 265) g")
+    conn.commit()
+    yield pg_params, cur
+    conn.rollback()
+    cur.execute(f"DROP TABLE IF EXISTS {', '.join(loader._SELFCHECK_TABLES)}")
+    conn.commit()
+    conn.close()
+
+
+def _fact_counts(cur):
+    cur.execute(f"SELECT run_id, count(*) FROM {loader.FACT_TABLE} GROUP BY run_id ORDER BY run_id")
+    return {run_id: n for run_id, n in cur.fetchall()}
+
+
+def _write_curated_run(root, run_id: str, rows: int):
+    run_dir = os.path.join(root, "b", "curated", f"run_id={run_id}")
+    os.makedirs(run_dir)
+    t = datetime(2024, 1, 1)
+    pq.write_table(pa.table({
+        "VendorID": [1 + i % 2 for i in range(rows)],
+        "PULocationID": [1 + i % 265 for i in range(rows)],
+        "DOLocationID": [1 + (i * 7) % 265 for i in range(rows)],
+        "tpep_pickup_datetime": [t + timedelta(minutes=i) for i in range(rows)],
+        "tpep_dropoff_datetime": [t + timedelta(minutes=i + 9) for i in range(rows)],
+        "total_amount": [10.0] * rows,
+        "run_id": [run_id] * rows,
+        "ingested_at_utc": ["2024-01-02T00:00:00+00:00"] * rows,
+    }), os.path.join(run_dir, "part-00000.parquet"))
+
+
+def test_scope_run_replaces_only_the_run(warehouse, tmp_path):
+    params, cur = warehouse
+    for run_id, rows in [("r1", 30), ("r2", 20)]:
+        _write_curated_run(str(tmp_path), run_id, rows)
+    # no scope: run is the default
+    common = dict(bucket="b", curated_prefix="curated", local_root=str(tmp_path))
+
+    for run_id in ["r1", "r1", "r2"]:
+        loader.load_run(params, run_id, "local", **common)
+
+    assert _fact_counts(cur) == {"r1": 30, "r2": 20}
+    cur.execute(f"SELECT count(*), count(ratecode_sk), count(payment_type_sk) FROM {loader.FACT_TABLE}")
+    # missing RatecodeID / payment_type columns land on the unknown members (99 / 5)
+    assert cur.fetchone() == [50, 50, 50]
+
+
+def test_scope_full_replaces_the_whole_fact(warehouse, tmp_path):
+    params, cur = warehouse
+    for run_id, rows in [("r1", 30), ("r2", 40)]:
+        _write_curated_run(str(tmp_path), run_id, rows)
+    common = dict(bucket="b", curated_prefix="curated", local_root=str(tmp_path), scope="full")
+
+    # non-incremental runs each hold the whole history: loading both must not add them up
+    loader.load_run(params, "r1", "local", **common)
+    loader.load_run(params, "r2", "local", **common)
+
+    assert _fact_counts(cur) == {"r2": 40}
+    cur.execute(f"SELECT count(*) FROM {loader.LOAD_LOG_TABLE}")
+    assert cur.fetchone() == [2]
+
+
+def test_unknown_scope_is_rejected(pg_params):
+    with pytest.raises(Exception, match="Unsupported scope"):
+        loader.load_run(pg_params, "r1", "local", scope="append")
+
+
+def test_copy_stage_ddl_follows_parquet_column_order():
+    schema = pa.schema([("DOLocationID", pa.int32()), ("VendorID", pa.int64()), ("fare", pa.float64()),
+                        ("tpep_pickup_datetime", pa.timestamp("ns")), ("zone", pa.string()),
+                        ("flag", pa.bool_()), ("amount", pa.decimal128(10, 2))])
+    assert loader.copy_stage_ddl("stage", schema) == (
+        'CREATE TEMP TABLE stage (\n'
+        '  "dolocationid" INTEGER,\n  "vendorid" BIGINT,\n  "fare" DOUBLE PRECISION,\n'
+        '  "tpep_pickup_datetime" TIMESTAMP,\n  "zone" VARCHAR(65535),\n  "flag" BOOLEAN,\n'
+        '  "amount" DECIMAL(10,2)\n)')
+    with pytest.raises(Exception, match="No Redshift column type"):
+        loader.copy_stage_ddl("stage", pa.schema([("tags", pa.list_(pa.string()))]))
+
+
+# ----------------------------
+# --source copy against real glue_enrich_to_curated.py output
+# ----------------------------
+def _positional_copy(s3):
+    """
+    Stand-in for Redshift COPY ... FORMAT AS PARQUET MANIFEST: every file of the manifest
+    is appended to the table by column position, as Redshift does (names are ignored).
+    """
+    def copy(cur, table, manifest, iam_role):
+        for url in loader.manifest_files(manifest, s3):
+            bucket, key = url[len("s3://"):].split("/", 1)
+            data = pq.read_table(io.BytesIO(s3.get_object(Bucket=bucket, Key=key)["Body"].read()))
+            cur.execute(f"SELECT count(*) FROM information_schema.columns WHERE table_name = '{table}'")
+            assert cur.fetchone()[0] == data.num_columns, f"{key}: column count differs from {table}"
+            lines = "".join(pg_bulk._copy_line(r) for r in zip(*[c.to_pylist() for c in data.columns]))
+            cur.execute(f"COPY {table} FROM STDIN", stream=io.StringIO(lines))
+    return copy
+
+
+@pytest.mark.parametrize("curated_run, enrich_args", [
+    ("lookup_flat", ["--enrich_engine", "lookup"]),
+    ("join_date", ["--enrich_engine", "join", "--partition_layout", "date"]),
+])
+def test_copy_loads_enrich_output(warehouse, glue_lake, monkeypatch, curated_run, enrich_args):
+    params, cur = warehouse
+    prefix = glue_lake.enrich(curated_run, *enrich_args)
+    for name, value in glue_lake.aws_env.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(loader, "_copy_manifest", _positional_copy(glue_lake.s3))
+
+    curated = pq.read_table(str(glue_lake.path(prefix)))
+    # the files carry the validated run's run_id, not the curated run folder's
+    assert set(curated.column("run_id").to_pylist()) == {"v1"}
+
+    common = dict(bucket=glue_lake.bucket, curated_prefix="curated/trips/", manifest_prefix="manifests/fact_loads/")
+    for _ in range(2):
+        stats = loader.load_run(params, curated_run, "copy", **common)
+    assert stats["rows_loaded"] == curated.num_rows
+
+    assert _fact_counts(cur) == {curated_run: curated.num_rows}
+    cur.execute(f"SELECT count(pickup_zone_sk), count(dropoff_zone_sk), count(vendor_sk), "
+                f"round(sum(total_amount)::numeric, 2), count(cbd_congestion_fee), min(pickup_datetime) "
+                f"FROM {loader.FACT_TABLE}")
+    pu, do, vendor, total, cbd, first_pickup = cur.fetchone()
+    assert (pu, do, vendor) == (curated.num_rows,) * 3
+    assert float(total) == pytest.approx(pa.compute.sum(curated.column("total_amount")).as_py(), abs=0.01)
+    assert cbd == curated.column("cbd_congestion_fee").length() - curated.column("cbd_congestion_fee").null_count
+    assert first_pickup == pa.compute.min(curated.column("tpep_pickup_datetime")).as_py().replace(tzinfo=None)
+    # the temp stage is gone with the load
+    cur.execute("SELECT count(*) FROM information_schema.tables WHERE table_name = 'trips_curated_run'")
+    assert cur.fetchone() == [0]
+
+
+def test_enrich_engines_write_the_same_schema(glue_lake):
+    schemas = {}
+    for engine in ["lookup", "join"]:
+        prefix = glue_lake.enrich(f"{engine}_flat", "--enrich_engine", engine)
+        files = sorted(glue_lake.path(prefix).glob("*.parquet"))
+        schemas[engine] = {pq.read_schema(f).remove_metadata() for f in files}
+
+    assert len(schemas["lookup"]) == 1 and schemas["lookup"] == schemas["join"]
+    names = next(iter(schemas["lookup"])).names
+    assert names[-2:] == ["vendor_name", "rate_code_name"]
@@ -0,0 +1,185 @@
+import json
+from datetime import timedelta
+
+import pytest
+
+from lake_io import LocalObjectStore
+
+BUCKET = "lake"
+ROLLUP = "curated/rollups/trip_daily/"
+
+pytest.importorskip("pyspark")
+trip_rollup = pytest.importorskip("trip_rollup")
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalObjectStore(str(tmp_path), BUCKET)
+
+
+def _curated(spark, store, run_id: str, rows: int) -> str:
+    """A curated run of `rows` trips of 10.00 over three pickup days."""
+    path = store.uri(f"curated/trips/run_id={run_id}/")
+    spark.sql(f"""
+        SELECT CAST(date_add(DATE'2024-01-01', CAST(id % 3 AS INT)) AS TIMESTAMP) AS tpep_pickup_datetime,
+               CAST(date_add(DATE'2024-01-01', CAST(id % 3 AS INT)) AS TIMESTAMP) AS tpep_dropoff_datetime,
+               CAST(1 + id % 5 AS INT) AS pulocationid, CAST(1 + id % 2 AS INT) AS vendorid,
+               CAST(NULL AS INT) AS ratecodeid, CAST(1 AS INT) AS payment_type,
+               10.0D AS total_amount, 8.0D AS fare_amount, 1.5D AS trip_distance
+        FROM range({rows})
+    """).write.mode("overwrite").parquet(path)
+    return path
+
+
+def _publish(spark, store, run_id, rows, **kwargs):
+    return trip_rollup.update_rollup(spark, store, ROLLUP, run_id, _curated(spark, store, run_id, rows), **kwargs)
+
+
+def _totals(spark, store):
+    pointer = store.get_json(f"{ROLLUP}_LATEST.json")
+    row = spark.read.parquet(pointer["path"]).selectExpr("sum(trips)", "sum(total_amount_sum)").first()
+    return row[0], float(row[1])
+
+
+def _folders(store, prefix: str, depth: int):
+    return sorted({"/".join(o["key"][len(prefix):].split("/")[:depth]) for o in store.list_objects(prefix)})
+
+
+def test_incremental_runs_merge_and_reruns_replace_their_rows(spark, store):
+    _publish(spark, store, "r1", 30)
+    _publish(spark, store, "r2", 20)
+    rerun = _publish(spark, store, "r2", 25)
+
+    assert rerun["mode"] == "merge" and rerun["replaced_delta_path"]
+    assert _totals(spark, store) == (55, 550.0)
+    assert list(store.get_json(f"{ROLLUP}_LATEST.json")["runs"]) == ["r1", "r2"]
+
+
+def test_full_runs_rebuild_instead_of_adding_up(spark, store):
+    _publish(spark, store, "f1", 30, rebuild=True)
+    second = _publish(spark, store, "f2", 40, rebuild=True)
+
+    assert second["mode"] == "rebuild"
+    assert _totals(spark, store) == (40, 400.0)
+    assert list(store.get_json(f"{ROLLUP}_LATEST.json")["runs"]) == ["f2"]
+
+    # incremental runs merge on top of the rebuilt version
+    _publish(spark, store, "r3", 10)
+    assert _totals(spark, store) == (50, 500.0)
+
+
+def test_run_map_is_bounded_and_evicted_reruns_are_refused(spark, store):
+    for run_id in ["r1", "r2", "r3"]:
+        result = _publish(spark, store, run_id, 10, keep_runs=2)
+    assert result["evicted_runs"] == ["r1"]
+    assert list(store.get_json(f"{ROLLUP}_LATEST.json")["runs"]) == ["r2", "r3"]
+
+    with pytest.raises(Exception, match="no longer in the pointer's last 2 runs"):
+        _publish(spark, store, "r1", 10, keep_runs=2)
+    assert _totals(spark, store) == (30, 300.0)
+
+
+def test_old_versions_and_unreferenced_deltas_are_deleted(spark, store):
+    results = [_publish(spark, store, run_id, 10, keep_versions=2, delta_grace=timedelta(0))
+               for run_id in ["r1", "r1", "r2", "r3"]]
+
+    pointer = store.get_json(f"{ROLLUP}_LATEST.json")
+    versions = _folders(store, f"{ROLLUP}version=", 1)
+    assert len(versions) == 2 and pointer["prefix"] == f"{ROLLUP}version={versions[-1]}/"
+    referenced = sorted(p.rstrip("/").split("/_deltas/")[1] for p in pointer["runs"].values())
+    assert [f for f in _folders(store, f"{ROLLUP}_deltas/", 2) if "/attempt=" in f] == referenced
+    # the rerun of r1 drops its first attempt; the _COMMITTED markers are kept
+    first_attempt = results[0]["delta_path"].rstrip("/").split("/_deltas/")[1]
+    assert results[1]["expired"]["delta_attempts"] == [first_attempt]
+    assert [k["key"].rsplit("/", 2)[-2] for k in store.list_objects(f"{ROLLUP}_deltas/")
+            if k["key"].endswith("_COMMITTED")] == ["run_id=r1", "run_id=r2", "run_id=r3"]
+    assert _totals(spark, store) == (30, 300.0)
+
+
+class _RacingStore(LocalObjectStore):
+    """Another run publishes between this run's pointer read and its conditional write."""
+
+    def __init__(self, root, bucket, spark):
+        super().__init__(root, bucket)
+        self.other = LocalObjectStore(root, bucket)
+        self.spark = spark
+        self.raced = False
+
+    def put_json_if_match(self, key, payload, etag):
+        if not self.raced:
+            self.raced = True
+            _publish(self.spark, self.other, "other", 5)
+        return super().put_json_if_match(key, payload, etag)
+
+
+def test_pointer_conflict_merges_again_on_the_winning_version(spark, tmp_path):
+    _publish(spark, LocalObjectStore(str(tmp_path), BUCKET), "r1", 30)
+    racing = _RacingStore(str(tmp_path), BUCKET, spark)
+
+    _publish(spark, racing, "r2", 20)
+
+    assert _totals(spark, racing) == (55, 550.0)
+    assert list(racing.get_json(f"{ROLLUP}_LATEST.json")["runs"]) == ["r1", "other", "r2"]
+    # r1's version, the winner's and the retried merge; the lost attempt was dropped
+    assert len(_folders(racing, f"{ROLLUP}version=", 1)) == 3
+
+
+def test_enrich_rebuilds_the_rollup_from_non_incremental_runs(glue_lake):
+    args = ["--rollup_prefix", ROLLUP]
+    for run_id in ["rollup_1", "rollup_2"]:
+        prefix = glue_lake.enrich(run_id, *args)
+
+    # validated run v1 is not incremental: each curated run holds every trip
+    validated = json.loads(glue_lake.s3.get_object(Bucket=glue_lake.bucket,
+                                                   Key="validated/trips/_LATEST.json")["Body"].read())
+    assert validated["incremental"] is False
+    pointer = json.loads(glue_lake.s3.get_object(Bucket=glue_lake.bucket, Key=f"{ROLLUP}_LATEST.json")["Body"].read())
+    assert pointer["mode"] == "rebuild" and list(pointer["runs"]) == ["rollup_2"]
+
+    pq = pytest.importorskip("pyarrow.parquet")
+    trips = pq.read_table(str(glue_lake.path(pointer["prefix"])), columns=["trips"]).column("trips")
+    assert sum(trips.to_pylist()) == pq.read_table(str(glue_lake.path(prefix)), columns=["run_id"]).num_rows
+
+
+def test_changed_raw_file_rebuilds_the_rollup_from_every_file(empty_glue_lake, tmp_path):
+    import tlc_gen
+
+    lake = empty_glue_lake
+    pq = pytest.importorskip("pyarrow.parquet")
+    raw_dir = lake.path("raw/trips/")
+    tlc_gen.generate(raw_dir, 0.002, ["2024"], 2, 0.02, 7)
+    lake.upload("raw/trips/")
+
+    def validated_pointer():
+        return json.loads(lake.s3.get_object(Bucket=lake.bucket, Key="validated/trips/_LATEST.json")["Body"].read())
+
+    def rollup_trips():
+        pointer = json.loads(lake.s3.get_object(Bucket=lake.bucket, Key=f"{ROLLUP}_LATEST.json")["Body"].read())
+        return pointer, sum(pq.read_table(str(lake.path(pointer["prefix"])), columns=["trips"])
+                            .column("trips").to_pylist())
+
+    lake.validate("v1", "--incremental", "true")
+    first_rows = validated_pointer()["row_count"]
+    lake.enrich("c1", "--rollup_prefix", ROLLUP)
+
+    # January is uploaded again with other content: same key, new ETag
+    changed = tmp_path / "changed"
+    tlc_gen.generate(changed, 0.002, ["2024"], 2, 0.02, 8)
+    january = sorted(changed.iterdir())[0]
+    (raw_dir / january.name).write_bytes(january.read_bytes())
+    lake.s3.put_object(Bucket=lake.bucket, Key=f"raw/trips/{january.name}", Body=january.read_bytes())
+
+    lake.validate("v2", "--incremental", "true")
+    validated = validated_pointer()
+    assert validated["run_id"] == "v2" and validated["incremental"] is False
+    checkpoint = json.loads(lake.s3.get_object(
+        Bucket=lake.bucket, Key="manifests/checkpoints/raw_trips/_CHECKPOINT.json")["Body"].read())
+    assert {f["run_id"] for f in checkpoint["files"].values()} == {"v2"} and len(checkpoint["files"]) == 2
+
+    prefix = lake.enrich("c2", "--rollup_prefix", ROLLUP)
+    pointer, trips = rollup_trips()
+    curated_rows = pq.read_table(str(lake.path(prefix)), columns=["run_id"]).num_rows
+    # rebuilt from v2 alone, which holds the new January and the unchanged February
+    assert pointer["mode"] == "rebuild" and list(pointer["runs"]) == ["c2"]
+    assert trips == curated_rows == validated["row_count"]
+    assert abs(curated_rows - first_rows) < first_rows / 2
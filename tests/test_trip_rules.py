@@ -0,0 +1,101 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("pyspark")
+
+from pyspark.sql import functions as F  # noqa: E402
+
+import trip_rules  # noqa: E402
+from trip_rules import (VALIDATION_RULES, compile_bad_mask, decode_bad_reason,  # noqa: E402
+                        primary_reason, rules_for)
+
+ALL_COLUMNS = sorted({c for rule in VALIDATION_RULES for c in rule["columns"]} | {"cbd_congestion_fee"})
+COLUMNS = ["trip_distance", "cbd_congestion_fee", "tpep_pickup_datetime", "tpep_dropoff_datetime"]
+
+
+@pytest.fixture
+def fee_rule(monkeypatch):
+    """A rule enabled for the 2025 vintage only, appended as a new rule would be."""
+    rule = {
+        "name": "TEST_FEE_NEG",
+        "columns": ["cbd_congestion_fee"],
+        "predicate": lambda: F.col("cbd_congestion_fee") < 0,
+        "versions": {"2025"},
+    }
+    monkeypatch.setattr(trip_rules, "VALIDATION_RULES", [*VALIDATION_RULES, rule])
+    return rule
+
+
+def _names(active):
+    return [rule["name"] for _, rule in active]
+
+
+def test_bits_follow_registry_order():
+    active = rules_for(ALL_COLUMNS)
+    assert [bit for bit, _ in active] == [1 << i for i in range(len(VALIDATION_RULES))]
+
+
+def test_registry_has_no_versioned_rules():
+    # the default (no tlc_version) path applies every rule, so none may be vintage-specific yet
+    assert all(rule["versions"] is None for rule in VALIDATION_RULES)
+
+
+def test_versioned_rule_only_for_its_vintages(fee_rule):
+    assert "TEST_FEE_NEG" not in _names(rules_for(ALL_COLUMNS, "2024"))
+    assert "TEST_FEE_NEG" not in _names(rules_for(ALL_COLUMNS, "2015"))
+    assert "TEST_FEE_NEG" in _names(rules_for(ALL_COLUMNS, "2025"))
+    # unversioned rules stay on for every vintage
+    assert "TRIP_DISTANCE_NEG" in _names(rules_for(ALL_COLUMNS, "2015"))
+
+
+def test_unknown_version_applies_every_rule_with_its_columns(fee_rule):
+    assert "TEST_FEE_NEG" in _names(rules_for(ALL_COLUMNS, ""))
+    assert "TEST_FEE_NEG" not in _names(rules_for([c for c in ALL_COLUMNS if c != "cbd_congestion_fee"], ""))
+
+
+def test_versioned_rule_keeps_its_bit_when_others_are_skipped(fee_rule):
+    active = rules_for(["cbd_congestion_fee"], "2025")
+    assert active == [(1 << len(VALIDATION_RULES), fee_rule)]
+
+
+def _evaluate(spark, rows, active):
+    # SQL VALUES: no Python-side serialization of the rows
+    values = ", ".join(f"({d}, {fee}, TIMESTAMP '{pu}', TIMESTAMP '{do}')" for d, fee, pu, do in rows)
+    df = spark.sql(f"SELECT * FROM VALUES {values} AS t({', '.join(COLUMNS)})")
+    mask = compile_bad_mask(active)
+    out = (df.withColumn("bad_mask", mask)
+           .withColumn("reason_code", primary_reason(F.col("bad_mask"), active))
+           .withColumn("bad_reason", decode_bad_reason(F.col("bad_mask"), active)))
+    return [(r["bad_mask"], r["reason_code"], r["bad_reason"]) for r in out.collect()]
+
+
+def test_negative_cbd_fee_is_validated(spark):
+    t = datetime(2025, 1, 5, 8, 0)
+    assert _evaluate(spark, [(1.0, -0.75, t, t)], rules_for(COLUMNS, "2025")) == [(0, None, "")]
+    assert _evaluate(spark, [(1.0, -0.75, t, t)], rules_for(COLUMNS)) == [(0, None, "")]
+
+
+def test_versioned_rule_quarantines_its_vintage_only(spark, fee_rule):
+    t = datetime(2025, 1, 5, 8, 0)
+    rows = [(1.0, -0.75, t, t), (1.0, 0.75, t, t)]
+
+    bad_2025 = _evaluate(spark, rows, rules_for(COLUMNS, "2025"))
+    assert [r[1] for r in bad_2025] == ["TEST_FEE_NEG", None]
+
+    # the same rows read as an older vintage are not checked for the fee
+    assert [r[0] for r in _evaluate(spark, rows, rules_for(COLUMNS, "2024"))] == [0, 0]
+
+
+def test_primary_reason_is_first_violated_rule(spark, fee_rule):
+    t = datetime(2025, 1, 5, 8, 0)
+    rows = [(-1.0, -0.75, t, datetime(2025, 1, 5, 7, 0))]
+    [(mask, reason, decoded)] = _evaluate(spark, rows, rules_for(COLUMNS, "2025"))
+    assert reason == "TRIP_DISTANCE_NEG"
+    assert decoded == "TRIP_DISTANCE_NEG|DROPOFF_BEFORE_PICKUP|TEST_FEE_NEG"
+    assert bin(mask).count("1") == 3
+
+
+def test_no_active_rules(spark):
+    t = datetime(2025, 1, 5, 8, 0)
+    assert _evaluate(spark, [(1.0, 0.0, t, t)], []) == [(0, None, "")]